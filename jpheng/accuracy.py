@@ -0,0 +1,226 @@
+import time
+import numpy as np
+import jpheng.graphics as gra
+import jpheng.particles as entities
+import jpheng.pfgen as pfgen
+import jpheng.physics as phy
+import jpheng.pworld as pworld
+
+# Accuracy against cost for the integrator and force generators.  Canonical
+# scenes with analytic solutions are stepped at a range of time steps and
+# the energy drift, momentum error and position error of the simulation are
+# reported alongside its speed.
+#
+# An integrator is a PhysicsComponent class, so alternatives can be compared
+# by subclassing PhysicsComponent and overriding step.
+
+INTEGRATORS = {'euler': phy.PhysicsComponent}
+
+# no walls are reached in any scene
+FAR = 1e6
+
+
+class Scenario:
+    """A world with an analytic solution.
+    Variables:
+        world: ParticleWorld to step
+        particles: The particles compared against the solution
+        masses: Numpy array of the particles' masses
+        exact: Function of time returning the exact positions, (n, 3), and
+            total momentum, (3,), of the particles
+        energy: Function returning the current total energy of the world
+        momentum_scale: Typical magnitude of the momentum in the scene,
+            momentum errors are relative to this
+    """
+    def __init__(self, world, particles, exact, energy, momentum_scale):
+        self.world = world
+        self.particles = particles
+        self.masses = np.array([1/particle.physics.inv_mass
+                                for particle in particles])
+        self.exact = exact
+        self.energy = energy
+        self.momentum_scale = momentum_scale
+
+
+def _world():
+    return pworld.ParticleWorld([-FAR, FAR], [-FAR, FAR], [-FAR, FAR])
+
+
+def _particle(integrator, p, v, inv_mass, g=(0, 0, 0), r=1):
+    """Build an undamped particle whose physics is integrated by
+    integrator."""
+    physics = integrator(p, v, [0, 0, 0], inv_mass, np.array(g, dtype=float),
+                         damping=1)
+    return entities.Particle(physics, gra.SphereComponent(r, (0, 0, 0)))
+
+
+def _kinetic_energy(particles):
+    return sum(0.5*np.dot(particle.physics.v, particle.physics.v) /
+               particle.physics.inv_mass for particle in particles)
+
+
+def oscillator(integrator, generator='AnchoredSpring', k=20, mass=2,
+               amplitude=5, length=10):
+    """A particle oscillating on an undamped spring attached to a fixed
+    anchor, released at rest from amplitude beyond its natural length.  With
+    StiffAnchoredSpring, which has no natural length or mass dependence, the
+    exact motion is that of the undamped generator, p'' = -gamma**2*p where
+    the generator uses gamma = 0.5*sqrt(k), half the frequency of the
+    p'' = -k*p derived in its docstring."""
+    world = _world()
+    anchor = np.zeros(3)
+    if generator == 'AnchoredSpring':
+        omega = np.sqrt(k/mass)
+        rest = length
+        spring = pfgen.AnchoredSpring(anchor, k, length)
+    elif generator == 'StiffAnchoredSpring':
+        omega = 0.5*np.sqrt(k)
+        rest = 0
+        spring = pfgen.StiffAnchoredSpring(anchor, k, 0)
+    else:
+        raise ValueError('unknown spring {}'.format(generator))
+    particle = _particle(integrator, [rest + amplitude, 0, 0], [0, 0, 0],
+                         1/mass)
+    world.add_particle(particle)
+    world.force_registry.add(particle, spring)
+
+    def exact(t):
+        x = rest + amplitude*np.cos(omega*t)
+        v = -amplitude*omega*np.sin(omega*t)
+        return np.array([[x, 0, 0]]), np.array([mass*v, 0, 0])
+
+    def energy():
+        extension = np.linalg.norm(particle.physics.p - anchor) - rest
+        stiffness = mass*omega**2
+        return _kinetic_energy([particle]) + 0.5*stiffness*extension**2
+
+    return Scenario(world, [particle], exact, energy,
+                    mass*amplitude*omega)
+
+
+def projectile(integrator, mass=1, v0=(30, 10, 40), g=(0, 0, -20)):
+    """A particle thrown from the origin under constant gravity."""
+    world = _world()
+    v0 = np.array(v0, dtype=float)
+    g = np.array(g, dtype=float)
+    particle = _particle(integrator, [0, 0, 0], v0, 1/mass, g)
+    world.add_particle(particle)
+
+    def exact(t):
+        return (v0*t + 0.5*g*t*t)[np.newaxis], mass*(v0 + g*t)
+
+    def energy():
+        return _kinetic_energy([particle]) - mass*np.dot(g, particle.physics.p)
+
+    return Scenario(world, [particle], exact, energy,
+                    mass*np.linalg.norm(v0))
+
+
+def elastic_collision(integrator, masses=(1, 3), speeds=(20, -10),
+                      separation=40, r=2):
+    """Two particles colliding head on along the x axis with a coefficient
+    of restitution of 1."""
+    world = _world()
+    m1, m2 = masses
+    u1, u2 = speeds
+    p1 = np.array([-separation/2, 0, 0])
+    p2 = np.array([separation/2, 0, 0])
+    particles = [_particle(integrator, p1, [u1, 0, 0], 1/m1, r=r),
+                 _particle(integrator, p2, [u2, 0, 0], 1/m2, r=r)]
+    for particle in particles:
+        world.add_particle(particle)
+    # time of contact and velocities after the collision
+    t_contact = (separation - 2*r)/(u1 - u2)
+    w1 = ((m1 - m2)*u1 + 2*m2*u2)/(m1 + m2)
+    w2 = ((m2 - m1)*u2 + 2*m1*u1)/(m1 + m2)
+    momentum = np.array([m1*u1 + m2*u2, 0, 0])
+
+    def exact(t):
+        if t <= t_contact:
+            x1 = p1[0] + u1*t
+            x2 = p2[0] + u2*t
+        else:
+            x1 = p1[0] + u1*t_contact + w1*(t - t_contact)
+            x2 = p2[0] + u2*t_contact + w2*(t - t_contact)
+        return np.array([[x1, 0, 0], [x2, 0, 0]]), momentum
+
+    def energy():
+        return _kinetic_energy(particles)
+
+    return Scenario(world, particles, exact, energy,
+                    m1*abs(u1) + m2*abs(u2))
+
+
+SCENES = {'oscillator': oscillator,
+          'stiff_oscillator': lambda integrator: oscillator(
+              integrator, 'StiffAnchoredSpring'),
+          'projectile': projectile,
+          'elastic_collision': elastic_collision}
+
+DEFAULT_TIMESTEPS = (1/30, 1/60, 1/120, 1/240, 1/480)
+
+
+def run_case(scene, integrator='euler', dt=1/120, duration=4):
+    """Step a scene for duration seconds, comparing it with its analytic
+    solution after every step.
+    Returns:
+        Dictionary of the scene, integrator and dt, steps per second, and
+        the maximum over the run of the relative energy drift, the relative
+        momentum error and the position error
+    """
+    scenario = SCENES[scene](INTEGRATORS[integrator])
+    n_steps = int(round(duration/dt))
+    energy0 = scenario.energy()
+    energy_drift = 0.0
+    momentum_error = 0.0
+    position_error = 0.0
+    stepping = 0.0
+    for i in range(1, n_steps + 1):
+        start = time.perf_counter()
+        scenario.world.step(dt)
+        stepping += time.perf_counter() - start
+        positions, momentum = scenario.exact(i*dt)
+        p = np.array([particle.physics.p for particle in scenario.particles])
+        v = np.array([particle.physics.v for particle in scenario.particles])
+        position_error = max(position_error,
+                             np.max(np.linalg.norm(p - positions, axis=1)))
+        error = np.linalg.norm(scenario.masses.dot(v) - momentum)
+        momentum_error = max(momentum_error,
+                             error/scenario.momentum_scale)
+        energy_drift = max(energy_drift, abs(scenario.energy() - energy0) /
+                           max(abs(energy0), 1e-12))
+    return {'scene': scene,
+            'integrator': integrator,
+            'dt': dt,
+            'steps': n_steps,
+            'steps_per_second': n_steps/stepping if stepping > 0 else
+            float('inf'),
+            'energy_drift': float(energy_drift),
+            'momentum_error': float(momentum_error),
+            'position_error': float(position_error)}
+
+
+def run_all(scenes=None, integrators=None, timesteps=DEFAULT_TIMESTEPS,
+            duration=4):
+    """Run every combination of scene, integrator and time step.
+    Returns a list of run_case results."""
+    if scenes is None:
+        scenes = sorted(SCENES)
+    if integrators is None:
+        integrators = sorted(INTEGRATORS)
+    return [run_case(scene, integrator, dt, duration)
+            for scene in scenes
+            for integrator in integrators
+            for dt in timesteps]
+
+
+def largest_safe_dt(results, scene, integrator='euler', energy_drift=0.01,
+                    position_error=0.1):
+    """Return the largest time step of a scene and integrator whose energy
+    drift and position error are within the given tolerances, or None."""
+    safe = [result['dt'] for result in results
+            if result['scene'] == scene and
+            result['integrator'] == integrator and
+            result['energy_drift'] <= energy_drift and
+            result['position_error'] <= position_error]
+    return max(safe) if safe else None
@@ -0,0 +1,353 @@
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import jpheng.particles as entities
+import jpheng.pbd as pbd
+import jpheng.pcontacts as pcontacts
+import jpheng.pfgen as pfgen
+import jpheng.plinks as plinks
+import jpheng.profiler as profiler
+import jpheng.pworld as pworld
+
+# Headless, seeded versions of the demo scenes at a given number of
+# particles.  Every builder returns the world and a function to call after
+# each step, or None.  Particle density is kept constant as n grows.
+
+
+def _box(n, spacing):
+    """Return symmetric x, y limits and z limits of a box holding n
+    particles, one per cube of side spacing."""
+    side = spacing*max(1.0, np.ceil(n**(1/3)))
+    half = side/2
+    return [-half, half], [-half, half], [0, side]
+
+
+def _color(rng):
+    return tuple(rng.randint(0, 256, 3))
+
+
+def collision_gas(n, seed=0):
+    """Particles of radius 1 flying around a box, as in collision_demo."""
+    rng = np.random.RandomState(seed)
+    xlim, ylim, zlim = _box(n, 6)
+    world = pworld.ParticleWorld(xlim, ylim, zlim)
+    low = np.array([xlim[0], ylim[0], zlim[0]]) + 1
+    high = np.array([xlim[1], ylim[1], zlim[1]]) - 1
+    for i in range(n):
+        p = rng.uniform(low, high)
+        v = rng.uniform(-50, 50, 3)
+        world.add_particle(entities.QuickParticle(p, v, [0, 0, 0], 1/10, 1,
+                                                  color=_color(rng)))
+    return world, None
+
+
+def spring_network(n, seed=0):
+    """A square sheet of particles joined to their neighbours by springs,
+    as in springs_demo."""
+    rng = np.random.RandomState(seed)
+    width = max(1, int(np.ceil(np.sqrt(n))))
+    spacing = 4
+    half = spacing*width/2
+    xlim = [-half - spacing, half + spacing]
+    ylim = [-half - spacing, half + spacing]
+    zlim = [0, 50]
+    world = pworld.ParticleWorld(xlim, ylim, zlim)
+    grid = {}
+    for i in range(n):
+        row, col = divmod(i, width)
+        p = [col*spacing - half, row*spacing - half, 25]
+        p = np.array(p) + rng.normal(0, 0.2, 3)
+        particle = entities.QuickParticle(p, [0, 0, 0], [0, 0, 0], 1/5, 1,
+                                          color=_color(rng))
+        particle.physics.g = np.zeros(3)
+        world.add_particle(particle)
+        grid[row, col] = particle
+    for (row, col), particle in grid.items():
+        for other in (grid.get((row + 1, col)), grid.get((row, col + 1))):
+            if other is None:
+                continue
+            world.force_registry.add(
+                particle, pfgen.ParticleSpring(other, 3, spacing))
+            world.force_registry.add(
+                other, pfgen.ParticleSpring(particle, 3, spacing))
+    return world, None
+
+
+def link_chains(n, seed=0, chain_length=10):
+    """Chains of chain_length particles joined alternately by rods and
+    cables, falling onto the floor, as in links_demo."""
+    rng = np.random.RandomState(seed)
+    spacing = 3
+    n_chains = max(1, int(np.ceil(n/chain_length)))
+    xlim, ylim, zlim = _box(n_chains, chain_length*spacing + 4)
+    zlim = [0, 50]
+    world = pworld.ParticleWorld(xlim, ylim, zlim)
+    for chain in range(n_chains):
+        start = rng.uniform([xlim[0] + 1, ylim[0] + 1, 10],
+                            [xlim[1] - 1 - chain_length*spacing,
+                             ylim[1] - 1, 40])
+        links = []
+        for i in range(min(chain_length, n - chain*chain_length)):
+            p = start + [i*spacing, 0, 0]
+            particle = entities.QuickParticle(p, rng.normal(0, 5, 3),
+                                              [0, 0, 0], 1/10, 1,
+                                              color=_color(rng))
+            world.add_particle(particle)
+            links.append(particle)
+        for i in range(len(links) - 1):
+            pair = [links[i], links[i + 1]]
+            if i % 2 == 0:
+                link = plinks.ParticleRod(pair, spacing)
+            else:
+                link = plinks.ParticleCable(pair, spacing, 0.5)
+            world.contact_generators.append(link)
+    return world, None
+
+
+def link_set_chains(n, seed=0, chain_length=10):
+    """link_chains with all of its rods and cables held by one
+    plinks.ParticleLinkSet."""
+    world, hook = link_chains(n, seed, chain_length)
+    links = [generator for generator in world.contact_generators
+             if isinstance(generator, plinks.ParticleLink)]
+    world.contact_generators = [
+        generator for generator in world.contact_generators
+        if not isinstance(generator, plinks.ParticleLink)]
+    world.contact_generators.append(plinks.ParticleLinkSet.from_links(links))
+    return world, hook
+
+
+def pbd_chains(n, seed=0, chain_length=10):
+    """link_chains with its rods and cables projected by a
+    pbd.LinkSolver."""
+    world, hook = link_chains(n, seed, chain_length)
+    world.link_solver = pbd.LinkSolver()
+    return world, hook
+
+
+def fireworks(n, seed=0):
+    """Bursts of ten fireworks spread around the sky which burn out and
+    spawn new bursts by the rules in fireworks_demo."""
+    xlim, ylim, zlim = _box(n, 6)
+    zlim = [0, max(50, zlim[1])]
+    world = pworld.ParticleWorld(xlim, ylim, zlim, seed=seed)
+
+    def burst(world, p, generation):
+        """Spawn ten fireworks at p with random velocities drawn from the
+        world's random number generator."""
+        rng = world.rng
+        speed = rng.normal(10, 0.1)
+        thetas = rng.uniform(0, np.pi, 10)
+        phis = rng.uniform(0, 2*np.pi, 10)
+        v = speed*np.stack([np.sin(thetas)*np.cos(phis),
+                            np.sin(thetas)*np.sin(phis),
+                            np.cos(thetas)], axis=1)
+        fuses = rng.normal(1.5, 0.7, 10)
+        for i in range(10):
+            world.add_particle(entities.Firework(
+                p, v[i], fuses[i], rng.choice([True, False]), generation))
+
+    rng = world.rng
+    for i in range(max(1, n//10)):
+        p = rng.uniform([xlim[0] + 2, ylim[0] + 2, zlim[1]/2],
+                        [xlim[1] - 2, ylim[1] - 2, zlim[1] - 2])
+        burst(world, p, 1)
+
+    def rules(world, dt):
+        for firework in list(world.particle_list):
+            if firework.fuse <= 0:
+                world.remove_particle(firework)
+                if firework.parent:
+                    burst(world, firework.physics.p,
+                          firework.generation + 1)
+
+    return world, rules
+
+
+SCENES = {'collision_gas': collision_gas,
+          'spring_network': spring_network,
+          'link_chains': link_chains,
+          'link_set_chains': link_set_chains,
+          'pbd_chains': pbd_chains,
+          'fireworks': fireworks}
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+
+
+def run_benchmark(scene, n, steps=100, dt=1/120, seed=0, memory=True,
+                  backend='python', clock=time.perf_counter):
+    """Build a scene with n particles and time steps steps of it.
+    Arguments:
+        scene: Name of a scene in SCENES
+        n: Number of particles
+        steps: Number of steps to time
+        dt: Time step, seconds
+        seed: Seed for the scene's random number generator
+        memory: If True the scene is built and stepped a second time under
+            tracemalloc to measure its peak memory use
+        backend: ParticleWorld backend to step with, set after the scene is
+            built so compiling kernels is not timed
+        clock: Function returning the time in seconds everything is timed
+            with, time.process_time times CPU time instead of wall time
+    Returns:
+        Dictionary of results: the scene, size, backend and settings, the
+        build time,
+        total step time, steps per second, the mean time of each phase of
+        the step and the peak traced memory in bytes
+    """
+    builder = SCENES[scene]
+    gc.collect()
+    start = clock()
+    world, hook = builder(n, seed)
+    build_seconds = clock() - start
+    world.set_backend(backend)
+    world.profiler = profiler.StepProfiler(capacity=steps, clock=clock)
+    start = clock()
+    for i in range(steps):
+        world.step(dt)
+        if hook is not None:
+            hook(world, dt)
+    seconds = clock() - start
+    summary = world.profiler.summary()
+    result = {'scene': scene,
+              'n': n,
+              'backend': world.backend,
+              'n_particles': len(world.particle_list),
+              'steps': steps,
+              'dt': dt,
+              'seed': seed,
+              'build_seconds': build_seconds,
+              'seconds': seconds,
+              'steps_per_second': steps/seconds if seconds > 0 else
+              float('inf'),
+              'phases': {phase: summary[phase]['mean']
+                         for phase in profiler.StepProfiler.PHASES},
+              'counts': {count: summary[count]['mean']
+                         for count in profiler.StepProfiler.COUNTS}}
+    if memory:
+        result['peak_memory'] = measure_memory(scene, n, min(steps, 5), dt,
+                                               seed)
+    return result
+
+
+def measure_memory(scene, n, steps=5, dt=1/120, seed=0):
+    """Return the peak memory in bytes traced while building a scene and
+    stepping it."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        world, hook = SCENES[scene](n, seed)
+        for i in range(steps):
+            world.step(dt)
+            if hook is not None:
+                hook(world, dt)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def measure_step_allocations(scene, n, warmup=50, steps=20, dt=1/120,
+                             seed=0, pool=True):
+    """Build a scene, with a contact pool if pool is True, step it warmup
+    times and then trace the memory allocated while stepping it steps more
+    times.  The peak is the most memory held at once above that held
+    between steps, in a steady state it should not depend on n.
+    Returns:
+        Dictionary of the peak and net traced memory in bytes and the number
+        of garbage collections run during the traced steps
+    """
+    world, hook = SCENES[scene](n, seed)
+    if pool:
+        world.contact_pool = pcontacts.ParticleContactPool()
+    collections = []
+
+    def count(phase, info):
+        if phase == 'start':
+            collections.append(info['generation'])
+
+    def step():
+        world.step(dt)
+        if hook is not None:
+            hook(world, dt)
+
+    gc.collect()
+    # frees of objects allocated before tracing started are not subtracted,
+    # so the warm up steps creating the objects held between steps are
+    # traced too
+    tracemalloc.start()
+    try:
+        for i in range(warmup):
+            step()
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        gc.callbacks.append(count)
+        try:
+            for i in range(steps):
+                step()
+        finally:
+            gc.callbacks.remove(count)
+        net, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'scene': scene, 'n': n, 'peak_bytes': peak - start,
+            'net_bytes': net - start, 'collections': len(collections)}
+
+
+def run_scaling(scene, sizes=DEFAULT_SIZES, steps=100, dt=1/120, seed=0,
+                max_seconds=60, memory=True, log=None, backend='python'):
+    """Run a scene at each size in ascending order.  Sizes whose run is
+    predicted to take more than max_seconds, extrapolating quadratically
+    from the previous size, are skipped.
+    Returns:
+        List of result dictionaries, see run_benchmark.  Skipped sizes have
+        'skipped': True and no timings.
+    """
+    results = []
+    previous = None
+    for n in sorted(sizes):
+        if previous is not None and max_seconds is not None:
+            predicted = (previous['build_seconds'] + previous['seconds']) * \
+                (n/previous['n'])**2
+            if predicted > max_seconds:
+                results.append({'scene': scene, 'n': n, 'backend': backend,
+                                'skipped': True,
+                                'predicted_seconds': predicted})
+                if log is not None:
+                    log('{:<16}{:>8}{:>8}  skipped, predicted {:.0f} s'
+                        .format(scene, backend, n, predicted))
+                continue
+        result = run_benchmark(scene, n, steps, dt, seed, memory, backend)
+        results.append(result)
+        previous = result
+        if log is not None:
+            log('{:<16}{:>8}{:>8}{:>12.1f} steps/s'.format(
+                scene, result['backend'], n, result['steps_per_second']))
+    return results
+
+
+def environment():
+    """Return a dictionary describing the machine and software versions."""
+    return {'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def save_results(results, path):
+    """Write benchmark results, with a description of the environment, to a
+    JSON file."""
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f,
+                  indent=2)
+
+
+def load_results(path):
+    """Read benchmark results written by save_results."""
+    with open(path) as f:
+        return json.load(f)
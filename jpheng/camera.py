@@ -6,6 +6,7 @@
 import math
 import collections
 
+import numpy as np
 import pyglet
 
 
@@ -289,6 +290,11 @@ class MouseFirstPersonCamera(object):
         self._pitch = abs(self._pitch)
         self._pitch = -max(0, min(self._pitch, 180))
 
+    def eye_position(self):
+        """Position of the camera in world co-ordinates.  The camera stores
+        the translation applied to the scene, which is its negative."""
+        return [-x for x in self._position]
+
     def move_forward(self, distance):
         """Move forward on distance"""
         self._position[0] -= distance*math.sin(math.radians(self._yaw))
@@ -353,6 +359,23 @@ class MouseFirstPersonCamera(object):
         pyglet.gl.glRotatef(self._yaw, 0.0, 0.0, 1.0)
         pyglet.gl.glTranslatef(*self._position)
 
+    def view_matrix(self):
+        """Return the 4x4 modelview matrix applied by draw as a numpy
+        array, so that eye co-ordinates are view_matrix().dot([x,y,z,1])"""
+        pitch = math.radians(self._pitch)
+        yaw = math.radians(self._yaw)
+        rot_x = np.array([[1, 0, 0, 0],
+                          [0, math.cos(pitch), -math.sin(pitch), 0],
+                          [0, math.sin(pitch), math.cos(pitch), 0],
+                          [0, 0, 0, 1]])
+        rot_z = np.array([[math.cos(yaw), -math.sin(yaw), 0, 0],
+                          [math.sin(yaw), math.cos(yaw), 0, 0],
+                          [0, 0, 1, 0],
+                          [0, 0, 0, 1]])
+        translate = np.identity(4)
+        translate[:3, 3] = self._position
+        return rot_x.dot(rot_z).dot(translate)
+
 
 #----------------------ORIGINAL CAMERA-----------------------------------------
 
@@ -0,0 +1,302 @@
+import io
+import numpy as np
+import jpheng.graphics as gra
+import jpheng.particles as entities
+import jpheng.pcontacts as pcontacts
+import jpheng.pfgen as pfgen
+import jpheng.plinks as plinks
+import jpheng.pworld as pworld
+
+# Binary checkpoints of a ParticleWorld.  A checkpoint is an uncompressed
+# NumPy .npz archive of flat arrays: the world limits, the physics and
+# graphics state of every particle, each force generator and link grouped
+# by class with references to particles stored as indices, the force
+# registrations and the order of the contact generators.  Nothing is
+# pickled.  Values are stored as float64 so a restored world steps exactly
+# as the original would have, the world's dtype is stored with them and a
+# float32 world is restored as float32.  The iterations and compliance of a
+# world's pbd.LinkSolver are stored, as they change how its links behave.
+#
+# Generator and link fields are described by (attribute, kind) pairs, kind
+# is one of SCALAR, VECTOR, PARTICLE or PAIR.  Other classes can be
+# checkpointed by adding them to these tables.  plinks.ParticleLinkSets are
+# stored as their arrays, with their particles as indices.
+
+FORMAT_VERSION = 1
+
+SCALAR = 'scalar'
+VECTOR = 'vector'
+PARTICLE = 'particle'
+PAIR = 'pair'
+
+PARTICLE_TYPES = {cls.__name__: cls for cls in (
+    entities.Particle, entities.QuickParticle, entities.Laser,
+    entities.Firework)}
+
+GRAPHICS_TYPES = {cls.__name__: cls for cls in (
+    gra.SphereComponent, gra.CubeComponent)}
+
+FORCE_GENERATORS = {
+    'GravityGenerator': (pfgen.GravityGenerator, (('g', VECTOR),)),
+    'ParticleSpring': (pfgen.ParticleSpring, (
+        ('other_particle', PARTICLE), ('k', SCALAR), ('l0', SCALAR))),
+    'AnchoredSpring': (pfgen.AnchoredSpring, (
+        ('anchor', VECTOR), ('k', SCALAR), ('l0', SCALAR))),
+    'AnchoredBungee': (pfgen.AnchoredBungee, (
+        ('anchor', VECTOR), ('k', SCALAR), ('l0', SCALAR))),
+    'StiffAnchoredSpring': (pfgen.StiffAnchoredSpring, (
+        ('anchor', VECTOR), ('k', SCALAR), ('d', SCALAR)))}
+
+LINKS = {
+    'ParticleRod': (plinks.ParticleRod, (
+        ('particles', PAIR), ('length', SCALAR))),
+    'ParticleCable': (plinks.ParticleCable, (
+        ('particles', PAIR), ('max_length', SCALAR),
+        ('restitution', SCALAR)))}
+
+# contact generators every ParticleWorld creates for itself
+BUILTIN_CONTACT_GENERATORS = (pcontacts.ParticleCollisionGenerator,
+                              pcontacts.BoundaryCollisionGenerator)
+
+
+def _pack_objects(prefix, table, objects, index, arrays):
+    """Store objects, all of the classes in table, as arrays named
+    prefix/class/attribute.  Returns a list of (class name, position within
+    class) for each object."""
+    by_class = {}
+    refs = []
+    for obj in objects:
+        name = type(obj).__name__
+        if name not in table:
+            raise TypeError('cannot checkpoint {} {}'.format(prefix, name))
+        group = by_class.setdefault(name, [])
+        refs.append((name, len(group)))
+        group.append(obj)
+    for name, group in by_class.items():
+        for attribute, kind in table[name][1]:
+            values = [getattr(obj, attribute) for obj in group]
+            key = '{}/{}/{}'.format(prefix, name, attribute)
+            if kind == PARTICLE:
+                arrays[key] = np.array([index[id(v)] for v in values],
+                                       dtype=np.int64)
+            elif kind == PAIR:
+                arrays[key] = np.array([[index[id(v[0])], index[id(v[1])]]
+                                        for v in values],
+                                       dtype=np.int64).reshape(-1, 2)
+            elif kind == VECTOR:
+                arrays[key] = np.array(values, dtype=float).reshape(-1, 3)
+            else:
+                arrays[key] = np.array(values, dtype=float)
+        arrays['{}/{}/count'.format(prefix, name)] = np.array(len(group))
+    return refs
+
+
+def _unpack_objects(prefix, table, data, particles):
+    """Rebuild the objects stored by _pack_objects.  Returns a dictionary
+    mapping class names to lists of objects."""
+    objects = {}
+    for name, (cls, fields) in table.items():
+        key = '{}/{}/count'.format(prefix, name)
+        if key not in data:
+            continue
+        group = [cls.__new__(cls) for i in range(int(data[key]))]
+        for attribute, kind in fields:
+            values = data['{}/{}/{}'.format(prefix, name, attribute)]
+            for obj, value in zip(group, values):
+                if kind == PARTICLE:
+                    value = particles[value]
+                elif kind == PAIR:
+                    value = [particles[value[0]], particles[value[1]]]
+                elif kind == VECTOR:
+                    value = value.copy()
+                else:
+                    value = float(value)
+                setattr(obj, attribute, value)
+        objects[name] = group
+    return objects
+
+
+def to_arrays(world):
+    """Return a dictionary of the arrays making up a checkpoint of world."""
+    particles = world.particle_list
+    n = len(particles)
+    index = {id(particle): i for i, particle in enumerate(particles)}
+    arrays = {'version': np.array(FORMAT_VERSION),
+              'limits': np.array([world.xlim, world.ylim, world.zlim],
+                                 dtype=float),
+              'dtype': np.array(world.dtype.name)}
+    if world.link_solver is not None:
+        arrays['link_solver'] = np.array([world.link_solver.iterations,
+                                          world.link_solver.compliance],
+                                         dtype=float)
+    types = [type(particle).__name__ for particle in particles]
+    for name in set(types):
+        if name not in PARTICLE_TYPES:
+            raise TypeError('cannot checkpoint particle {}'.format(name))
+    graphics = [type(particle.graphics).__name__ for particle in particles]
+    for name in set(graphics):
+        if name not in GRAPHICS_TYPES:
+            raise TypeError('cannot checkpoint graphics {}'.format(name))
+    arrays['particle_type'] = np.array(types, dtype=str)
+    arrays['graphics_type'] = np.array(graphics, dtype=str)
+    physics = [particle.physics for particle in particles]
+    for attribute in ('p', 'v', 'a', 'g', 'force_accum'):
+        arrays[attribute] = np.array([getattr(component, attribute)
+                                      for component in physics],
+                                     dtype=float).reshape(n, 3)
+    arrays['inv_mass'] = np.array([c.inv_mass for c in physics], dtype=float)
+    arrays['damping'] = np.array([c.damping for c in physics], dtype=float)
+    arrays['radius'] = np.array([particle.graphics.r
+                                 for particle in particles], dtype=float)
+    arrays['color'] = np.array([particle.graphics.color
+                                for particle in particles],
+                               dtype=np.uint8).reshape(n, 3)
+    # Firework state, zero for other particles
+    arrays['fuse'] = np.array([getattr(particle, 'fuse', 0)
+                               for particle in particles], dtype=float)
+    arrays['generation'] = np.array([getattr(particle, 'generation', 0)
+                                     for particle in particles],
+                                    dtype=np.int64)
+    arrays['parent'] = np.array([getattr(particle, 'parent', False)
+                                 for particle in particles], dtype=bool)
+    arrays['collision_group'] = np.array(
+        [particle.collision_group for particle in particles], dtype=np.int64)
+    arrays['collision_mask'] = np.array(
+        [particle.collision_mask for particle in particles], dtype=np.int64)
+
+    # force registrations, generators shared between registrations are
+    # stored once
+    registry = world.force_registry.registry
+    generators = []
+    generator_index = {}
+    for entry in registry:
+        if id(entry.generator) not in generator_index:
+            generator_index[id(entry.generator)] = len(generators)
+            generators.append(entry.generator)
+    refs = _pack_objects('force', FORCE_GENERATORS, generators, index,
+                         arrays)
+    arrays['registration_particle'] = np.array(
+        [index[id(entry.particle)] for entry in registry], dtype=np.int64)
+    arrays['registration_type'] = np.array(
+        [refs[generator_index[id(entry.generator)]][0]
+         for entry in registry], dtype=str)
+    arrays['registration_index'] = np.array(
+        [refs[generator_index[id(entry.generator)]][1]
+         for entry in registry], dtype=np.int64)
+
+    # contact generators, the world's own are recreated on restore
+    links = []
+    link_sets = []
+    order = []
+    for generator in world.contact_generators:
+        if isinstance(generator, BUILTIN_CONTACT_GENERATORS):
+            order.append((type(generator).__name__, -1))
+        elif type(generator) is plinks.ParticleLinkSet:
+            order.append(('ParticleLinkSet', len(link_sets)))
+            link_sets.append(generator)
+        else:
+            order.append(None)
+            links.append(generator)
+    for k, link_set in enumerate(link_sets):
+        key = 'linkset/{}/'.format(k)
+        arrays[key + 'particles'] = np.array(
+            [index[id(particle)] for particle in link_set.particles],
+            dtype=np.int64)
+        arrays[key + 'ends'] = link_set.ends
+        arrays[key + 'lengths'] = link_set.lengths
+        arrays[key + 'restitution'] = link_set.restitution
+        arrays[key + 'cables'] = link_set.cables
+    arrays['linkset/count'] = np.array(len(link_sets))
+    refs = iter(_pack_objects('link', LINKS, links, index, arrays))
+    order = [entry if entry is not None else next(refs) for entry in order]
+    arrays['contact_generator_type'] = np.array([name for name, i in order],
+                                                dtype=str)
+    arrays['contact_generator_index'] = np.array([i for name, i in order],
+                                                 dtype=np.int64)
+    return arrays
+
+
+def from_arrays(data, profile=False, tracer=None):
+    """Build a ParticleWorld from checkpoint arrays."""
+    version = int(data['version'])
+    if version != FORMAT_VERSION:
+        raise ValueError('unsupported checkpoint version {}'.format(version))
+    xlim, ylim, zlim = (list(limits) for limits in data['limits'].tolist())
+    # checkpoints written before worlds had a dtype are float64
+    dtype = str(data['dtype']) if 'dtype' in data else 'float64'
+    link_iterations = link_compliance = None
+    if 'link_solver' in data:
+        link_iterations, link_compliance = data['link_solver'].tolist()
+        link_iterations = int(link_iterations)
+    world = pworld.ParticleWorld(xlim, ylim, zlim, profile, tracer,
+                                 dtype=dtype, link_iterations=link_iterations,
+                                 link_compliance=link_compliance or 0)
+
+    particles = entities.from_arrays(
+        data['p'], data['v'], data['a'], data['inv_mass'], data['radius'],
+        data['color'], data['g'], data['damping'], data['force_accum'],
+        [PARTICLE_TYPES[name] for name in data['particle_type'].tolist()],
+        [GRAPHICS_TYPES[name] for name in data['graphics_type'].tolist()],
+        dtype)
+    fuse = data['fuse'].tolist()
+    generation = data['generation'].tolist()
+    parent = data['parent'].tolist()
+    for i, particle in enumerate(particles):
+        if type(particle) is entities.Firework:
+            particle.fuse = fuse[i]
+            particle.generation = generation[i]
+            particle.parent = parent[i]
+    # checkpoints written before collision groups keep the defaults
+    if 'collision_group' in data:
+        for particle, group, mask in zip(particles,
+                                         data['collision_group'].tolist(),
+                                         data['collision_mask'].tolist()):
+            particle.collision_group = group
+            particle.collision_mask = mask
+    world.particle_list.extend(particles)
+
+    generators = _unpack_objects('force', FORCE_GENERATORS, data, particles)
+    for i, name, j in zip(data['registration_particle'].tolist(),
+                          data['registration_type'].tolist(),
+                          data['registration_index'].tolist()):
+        world.force_registry.add(particles[i], generators[name][j])
+
+    links = _unpack_objects('link', LINKS, data, particles)
+    link_sets = []
+    for k in range(int(data.get('linkset/count', 0))):
+        key = 'linkset/{}/'.format(k)
+        link_sets.append(plinks.ParticleLinkSet.from_arrays(
+            [particles[i] for i in data[key + 'particles'].tolist()],
+            data[key + 'ends'], data[key + 'lengths'],
+            data[key + 'restitution'], data[key + 'cables']))
+    links['ParticleLinkSet'] = link_sets
+    builtin = {type(generator).__name__: generator
+               for generator in world.contact_generators}
+    world.contact_generators = [
+        builtin[name] if i < 0 else links[name][i]
+        for name, i in zip(data['contact_generator_type'].tolist(),
+                           data['contact_generator_index'].tolist())]
+    return world
+
+
+def save(world, path):
+    """Write a checkpoint of world to path, a file name or file object."""
+    np.savez(path, **to_arrays(world))
+
+
+def load(path, profile=False, tracer=None):
+    """Restore a ParticleWorld from a checkpoint written by save.  profile
+    and tracer are passed to the new world."""
+    with np.load(path, allow_pickle=False) as data:
+        return from_arrays({key: data[key] for key in data.files}, profile,
+                           tracer)
+
+
+def clone(world):
+    """Return an independent copy of world made through an in-memory
+    checkpoint, e.g. to fork several experiments from one warmed up
+    world."""
+    buffer = io.BytesIO()
+    save(world, buffer)
+    buffer.seek(0)
+    return load(buffer)
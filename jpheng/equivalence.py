@@ -0,0 +1,197 @@
+import numpy as np
+import jpheng.checkpoint as checkpoint
+import jpheng.kernels as kernels
+import jpheng.particles as entities
+import jpheng.pbatch as pbatch
+import jpheng.pfgen as pfgen
+import jpheng.plinks as plinks
+import jpheng.pworld as pworld
+
+# Differential testing of fast paths against the reference implementation.
+# Randomised scenes are stepped side by side by the plain per-object
+# ParticleWorld and by a fast engine, and the first step and particle at
+# which their positions or velocities differ by more than a tolerance is
+# reported.
+#
+# An engine is built from a template ParticleWorld, which it must not
+# modify, and has a step(dt) method and a state() method returning a
+# dictionary of (n, 3) arrays of positions, 'p', and velocities, 'v'.
+# Engines which cannot simulate links set supports_links False.  New fast
+# paths are tested by adding them to ENGINES.
+
+
+class ReferenceEngine:
+    """Steps a copy of the world with the per-object ParticleWorld."""
+    supports_links = True
+
+    def __init__(self, world):
+        self.world = checkpoint.clone(world)
+
+    def step(self, dt):
+        self.world.step(dt)
+
+    def state(self):
+        particles = self.world.particle_list
+        return {'p': np.array([particle.physics.p for particle in particles]),
+                'v': np.array([particle.physics.v for particle in particles])}
+
+
+class BatchEngine:
+    """Steps the world as a pbatch.BatchParticleWorld of one world."""
+    supports_links = False
+
+    def __init__(self, world):
+        self.batch = pbatch.BatchParticleWorld.from_world(world, 1)
+
+    def step(self, dt):
+        self.batch.step(dt)
+
+    def state(self):
+        return {'p': self.batch.p[0].copy(), 'v': self.batch.v[0].copy()}
+
+
+class KernelEngine(ReferenceEngine):
+    """Steps a copy of the world with its contacts generated and resolved by
+    kernels.ContactSolver, compiled if numba is installed."""
+    def __init__(self, world):
+        ReferenceEngine.__init__(self, world)
+        self.world.contact_solver = kernels.ContactSolver()
+
+
+class LinkSetEngine(ReferenceEngine):
+    """Steps a copy of the world with its rods and cables moved into one
+    plinks.ParticleLinkSet, placed where the first of them was."""
+    def __init__(self, world):
+        ReferenceEngine.__init__(self, world)
+        generators = self.world.contact_generators
+        links = [generator for generator in generators
+                 if isinstance(generator, plinks.ParticleLink)]
+        if links:
+            position = generators.index(links[0])
+            generators = [generator for generator in generators
+                          if not isinstance(generator, plinks.ParticleLink)]
+            generators.insert(position,
+                              plinks.ParticleLinkSet.from_links(links))
+            self.world.contact_generators = generators
+
+
+ENGINES = {'reference': ReferenceEngine,
+           'batch': BatchEngine,
+           'kernels': KernelEngine,
+           'link_set': LinkSetEngine}
+
+
+def random_world(seed, n=20, forces=True, links=True, size=30):
+    """Build a randomised world of n particles in a box with sides of size.
+    Particles have random masses, a few infinite, and radii.  With forces
+    every kind of pfgen generator is registered on some particles, with
+    links rods and cables join some pairs at their initial separation.
+    Returns:
+        The ParticleWorld
+    """
+    rng = np.random.RandomState(seed)
+    half = size/2
+    world = pworld.ParticleWorld([-half, half], [-half, half], [0, size])
+    r = rng.uniform(0.5, 2, n)
+    p = rng.uniform([-half + 2, -half + 2, 2],
+                    [half - 2, half - 2, size - 2], (n, 3))
+    v = rng.normal(0, 10, (n, 3))
+    inv_mass = rng.uniform(0.05, 1, n)
+    inv_mass[rng.uniform(size=n) < 0.05] = 0
+    g = np.tile([0, 0, -20.0], (n, 1))
+    g[rng.uniform(size=n) < 0.3] = 0
+    particles = entities.from_arrays(p, v, np.zeros((n, 3)), inv_mass, r,
+                                     rng.randint(0, 256, (n, 3)), g)
+    for particle in particles:
+        world.add_particle(particle)
+
+    def pairs(count):
+        """Return count random pairs of distinct particle indices."""
+        first = rng.randint(0, n, count)
+        second = (first + rng.randint(1, n, count)) % n
+        return zip(first.tolist(), second.tolist())
+
+    def distance(i, j):
+        return float(np.linalg.norm(p[i] - p[j]))
+
+    if forces:
+        registry = world.force_registry
+        for i, j in pairs(n//4):
+            registry.add(particles[i], pfgen.ParticleSpring(
+                particles[j], rng.uniform(1, 10), distance(i, j)))
+        for i in rng.randint(0, n, n//8).tolist():
+            anchor = rng.uniform(-half, half, 3)
+            k = rng.uniform(1, 10)
+            l0 = rng.uniform(1, 10)
+            if rng.uniform() < 0.5:
+                generator = pfgen.AnchoredSpring(anchor, k, l0)
+            else:
+                generator = pfgen.AnchoredBungee(anchor, k, l0)
+            registry.add(particles[i], generator)
+        for i in rng.randint(0, n, n//10).tolist():
+            registry.add(particles[i], pfgen.StiffAnchoredSpring(
+                rng.uniform(-half, half, 3), rng.uniform(1, 10),
+                rng.uniform(0, 1)))
+        for i in rng.randint(0, n, n//10).tolist():
+            registry.add(particles[i], pfgen.GravityGenerator(
+                rng.normal(0, 5, 3)))
+    if links:
+        for i, j in pairs(n//5):
+            pair = [particles[i], particles[j]]
+            if rng.uniform() < 0.5:
+                link = plinks.ParticleRod(pair, distance(i, j))
+            else:
+                link = plinks.ParticleCable(pair, distance(i, j)*1.1,
+                                            rng.uniform(0, 1))
+            world.contact_generators.append(link)
+    return world
+
+
+def compare(world, engine, reference='reference', steps=200, dt=1/120,
+            atol=1e-9, rtol=1e-9):
+    """Step world with two engines side by side.  A value diverges when it
+    differs from the reference by more than atol + rtol*|reference|.
+    Returns:
+        None if the engines agree for every step, otherwise a dictionary of
+        the first divergence: the step (1 for the state after the first
+        step), particle index, field, both values and the absolute error
+    """
+    expected = ENGINES[reference](world)
+    actual = ENGINES[engine](world)
+    for step in range(1, steps + 1):
+        expected.step(dt)
+        actual.step(dt)
+        wanted = expected.state()
+        got = actual.state()
+        for field in ('p', 'v'):
+            error = np.abs(got[field] - wanted[field])
+            bad = ~(error <= atol + rtol*np.abs(wanted[field]))
+            if bad.any():
+                particle = int(np.flatnonzero(bad.any(axis=1))[0])
+                return {'step': step,
+                        'particle': particle,
+                        'field': field,
+                        'reference': wanted[field][particle].tolist(),
+                        'actual': got[field][particle].tolist(),
+                        'error': float(error[particle].max())}
+    return None
+
+
+def run(engines, seeds=range(10), n=20, steps=200, dt=1/120, atol=1e-9,
+        rtol=1e-9):
+    """Compare each engine with the reference on a randomised world for
+    every seed.  Links are only added for engines supporting them.
+    Returns:
+        List of dictionaries of the engine, seed and divergence, which is
+        None where the engine matched the reference
+    """
+    reports = []
+    for engine in engines:
+        links = ENGINES[engine].supports_links
+        for seed in seeds:
+            world = random_world(seed, n, links=links)
+            reports.append({'engine': engine, 'seed': seed,
+                            'divergence': compare(world, engine,
+                                                  steps=steps, dt=dt,
+                                                  atol=atol, rtol=rtol)})
+    return reports
@@ -1,21 +1,55 @@
+import functools
 import numpy as np
-import pyglet
+
+# OpenGL primitive types, equal to pyglet.gl.GL_TRIANGLES and GL_QUADS.
+# pyglet is only imported when a shape is first drawn, so physics-only code
+# can use graphics components without loading pyglet or opening a display.
+GL_TRIANGLES = 0x0004
+GL_QUADS = 0x0007
+
+# maximum number of distinct sphere meshes kept by sphere_mesh
+MESH_CACHE_SIZE = 128
+
+# random number generator for default colors, created on first use as
+# numpy.random is slow to import
+_rng = None
+
+
+def random_colors(n=None, rng=None):
+    """Return a random RGB color, or an (n, 3) array of n colors, drawn
+    from rng if given, otherwise from the module's generator."""
+    if rng is None:
+        if _rng is None:
+            seed_colors(None)
+        rng = _rng
+    return rng.randint(0, 256, 3 if n is None else (n, 3))
+
+
+def seed_colors(seed):
+    """Seed the random number generator used for default colors."""
+    global _rng
+    _rng = np.random.RandomState(seed)
+
 
 class GraphicsComponent:
     """Class which contains state and methods to describe, manipulate,
-    and update a shape.  Initially vertex_list is centred on the origin,
-    this is corrected the first time update is run.
+    and update a shape.  The vertex_list is only created the first time the
+    shape is drawn on its own, shapes drawn by a renderer.ParticleRenderer
+    never need one.  Initially vertex_list is centred on the origin, this is
+    corrected the first time update is run.
     Variables:
         n_verts: Number of vertices in the sphere
         draw_mode: OpenGL draw mode for the vertex_list
         vertex_list: Indexed vertex list containing the vertices and
-            colours of the sphere
+            colours of the sphere, None until the shape is first drawn
         color: RGB tuple containing the shape's color
         mesh: Numpy array containing the positions of the shape's vertices
             relative to its centre
+        indices: Vertex indices used to draw the mesh with draw_mode
     Methods:
         draw: Draws the shape in the active pyglet window
         update: Moves the shape to be centered around the position of entity
+        create_vertex_list: Returns a new vertex list for the shape
     """
     def __init__(self):
         self.vertex_list = None
@@ -23,66 +57,99 @@ class GraphicsComponent:
         self.n_verts = None
         self.draw_mode = None
         self.mesh = None
+        self.indices = None
 
     def draw(self):
         """Draw mesh."""
+        if self.vertex_list is None:
+            self.vertex_list = self.create_vertex_list()
         self.vertex_list.draw(self.draw_mode)
 
     def step(self, entity, dt):
         """Update the vertex list to the new entity position."""
-        self.vertex_list.vertices = np.add(
-            self.mesh, np.tile(entity.physics.p, self.n_verts))
+        if self.vertex_list is None:
+            return
+        # write straight into the mapped vertex buffer
+        vertices = np.ctypeslib.as_array(self.vertex_list.vertices)
+        np.add(self.mesh.reshape(-1, 3), entity.physics.p,
+               out=vertices.reshape(-1, 3))
+
+    def create_vertex_list(self):
+        """Create an indexed vertex list of the mesh centred on the
+        origin."""
+        import pyglet
+        colors = np.tile(self.color, self.n_verts)
+        return pyglet.graphics.vertex_list_indexed(
+            self.n_verts, self.indices, ('v3f', self.mesh), ('c3B', colors))
+
+def sphere_resolution(r):
+    """Return the number of latitudinal and longitudinal vertex positions
+    used to tessellate a sphere of radius r."""
+    n_lat = int(min(20, 3 + r))
+    n_long = int(min(30, 5 + r))
+    return n_lat, n_long
+
+def sphere_resolutions(radii):
+    """Vectorised sphere_resolution for a numpy array of radii."""
+    n_lat = np.minimum(20, 3 + radii).astype(int)
+    n_long = np.minimum(30, 5 + radii).astype(int)
+    return n_lat, n_long
+
+@functools.lru_cache(maxsize=MESH_CACHE_SIZE)
+def sphere_mesh(r, n_lat, n_long):
+    """Tessellate a sphere of radius r centred on the origin.  Meshes depend
+    only on their arguments so they are cached and shared between every
+    SphereComponent with the same radius and resolution, the returned arrays
+    are therefore read-only.
+    Returns:
+        mesh: Numpy float array, [x0,y0,z0,x1,y1,z1,...], containing the
+            vertex positions
+        indices: Numpy int array containing the GL_TRIANGLES vertex indices
+    """
+    # generate vertices about origin, row j holds the vertices at latitude
+    # theta_j, column i those at longitude phi_ij
+    j, i = np.mgrid[0:n_lat, 0:n_long]
+    theta = np.pi*(1 - j/(n_lat - 1))
+    phi = 2*np.pi*(i/n_long + j/(2*n_long))
+    mesh = np.empty((n_lat, n_long, 3))
+    mesh[..., 0] = r*np.sin(theta)*np.cos(phi)
+    mesh[..., 1] = r*np.sin(theta)*np.sin(phi)
+    mesh[..., 2] = r*np.cos(theta)
+    mesh = mesh.reshape(-1)
+
+    # generate indices, each vertex of rows 1 to n_lat - 2 starts two
+    # triangles, one joining it to the row below and one to the row above.
+    # The final column wraps around to the start of the row.
+    j, i = np.mgrid[1:n_lat - 1, 0:n_long]
+    i_next = (i + 1) % n_long
+    indices = np.stack([
+        j*n_long + i,
+        (j - 1)*n_long + i_next,
+        j*n_long + i_next,
+        j*n_long + i,
+        j*n_long + i_next,
+        (j + 1)*n_long + i], axis=-1).reshape(-1)
+
+    mesh.setflags(write=False)
+    indices.setflags(write=False)
+    return mesh, indices
 
 class SphereComponent(GraphicsComponent):
     """Graphics component to describe a sphere."""
     def __init__(self, r, color=None):
         GraphicsComponent.__init__(self)
         # number of latitudinal and longitudinal vertex positions
-        n_lat = int(min(20, 3 + r))
-        n_long = int(min(30, 5 + r))
+        n_lat, n_long = sphere_resolution(r)
         # set state
         self.r = r  # radius
         self.n_verts = n_lat*n_long  # number of vertices
-        self.draw_mode = pyglet.gl.GL_TRIANGLES  # pyglet draw mode
+        self.draw_mode = GL_TRIANGLES  # pyglet draw mode
         if color is None:
-            color = np.random.randint(0, 256, 3)
+            color = random_colors()
         self.color = color  # color rgb tuple
 
-        self.mesh = np.zeros(3*self.n_verts)  # 3 components per vertex
-        indices = [0]*3*2*(n_lat - 2)*n_long
-        colors = np.tile(color, self.n_verts)
-
-        # generate vertices about origin
-        for j in range(n_lat):
-            for i in range(n_long):
-                theta = np.pi*(1 - j/(n_lat - 1))
-                phi = 2*np.pi*(i/n_long + j/(2*n_long))
-                vertex = [r*np.sin(theta)*np.cos(phi),
-                          r*np.sin(theta)*np.sin(phi),
-                          r*np.cos(theta)]
-                self.mesh[3*(j*n_long + i):3 + 3*(j*n_long + i)] = vertex
-        vertices = self.mesh
-
-        # generate indices
-        for j in range(n_lat - 2):
-            for i in range(n_long - 1):
-                indices[6*(j*n_long + i) + 0] = n_long + j*n_long + i
-                indices[6*(j*n_long + i) + 1] = n_long + (j - 1)*n_long + i + 1
-                indices[6*(j*n_long + i) + 2] = n_long + j*n_long + i + 1
-                indices[6*(j*n_long + i) + 3] = n_long + j*n_long + i
-                indices[6*(j*n_long + i) + 4] = n_long + j*n_long + i + 1
-                indices[6*(j*n_long + i) + 5] = n_long + (j + 1)*n_long + i
-            # do final column manually
-            i = n_long - 1
-            indices[6*(j*n_long + i) + 0] = n_long + j*n_long + i
-            indices[6*(j*n_long + i) + 1] = n_long + (j - 1)*n_long
-            indices[6*(j*n_long + i) + 2] = n_long + j*n_long
-            indices[6*(j*n_long + i) + 3] = n_long + j*n_long + i
-            indices[6*(j*n_long + i) + 4] = n_long + j*n_long
-            indices[6*(j*n_long + i) + 5] = n_long + (j + 1)*n_long + i
-
-        self.vertex_list = pyglet.graphics.vertex_list_indexed(
-            self.n_verts, indices, ('v3f', vertices), ('c3B', colors))
+        # shared, read-only mesh and indices
+        self.mesh, self.indices = sphere_mesh(r, n_lat, n_long)
 
 class CubeComponent(GraphicsComponent):
     """Graphics component to describe a cube."""
@@ -90,9 +157,9 @@ class CubeComponent(GraphicsComponent):
         GraphicsComponent.__init__(self)
         self.n_verts = 8
         self.r = r  # side length
-        self.draw_mode = pyglet.gl.GL_QUADS
+        self.draw_mode = GL_QUADS
         if color is None:
-            color = np.random.randint(0, 256, 3)
+            color = random_colors()
         self.color = color
 
         self.mesh = np.array([
@@ -106,15 +173,10 @@ class CubeComponent(GraphicsComponent):
             0.5, 0.5, 0.5])  # 7
         self.mesh *= self.r
 
-        vertices = self.mesh
-        indices = [
+        self.indices = [
             0, 1, 6, 5,  # front
             1, 2, 7, 6,  # right
             2, 3, 4, 7,  # back
             3, 0, 5, 4,  # left
             0, 1, 2, 3,  # bottom
             4, 5, 6, 7]  # top
-        colors = np.tile(color, self.n_verts)
-
-        self.vertex_list = pyglet.graphics.vertex_list_indexed(
-            self.n_verts, indices, ('v3f', vertices), ('c3B', colors))
\ No newline at end of file
@@ -0,0 +1,402 @@
+import numpy as np
+import jpheng.pcontacts as pcontacts
+import jpheng.plinks as plinks
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Array kernels for the sequential loops of a step: the pairwise narrow
+# phase, boundary and link contact generation and in-order contact
+# resolution.  They are compiled with numba when it is installed and run as
+# plain Python otherwise, which is correct but slow, so ParticleWorld only
+# uses them with backend='numba' when numba is available.
+#
+# Contacts are rows of the buffers first, second, normal, penetration and
+# restitution.  second is -1 for contacts with the scenery.  Generating
+# kernels write rows from start and return the row after the last one
+# written, or -1 if the buffers are full.  The arithmetic follows the
+# ParticleContact and generator methods step for step, so results agree with
+# the python backend to rounding.
+
+# link kinds, CABLE matches True in ParticleLinkSet.cables
+ROD = 0
+CABLE = 1
+
+
+def jit(function):
+    """Compile function with numba if it is installed."""
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+@jit
+def collide(p, r, groups, masks, link_start, link_to, tested, first, second,
+            normal, penetration, restitution, start):
+    """Write a contact for every pair of overlapping spheres, in the order of
+    ParticleCollisionGenerator, skipping pairs filtered by their collision
+    groups and masks or linked, see
+    ParticleCollisionGenerator.filter_arrays.  The number of pairs tested is
+    written to tested[0]."""
+    n = p.shape[0]
+    capacity = first.shape[0]
+    m = start
+    tested[0] = 0
+    for i in range(n - 1):
+        # the next particle linked to i, link_to is sorted
+        k = link_start[i]
+        end = link_start[i + 1]
+        for j in range(i + 1, n):
+            if k < end and link_to[k] == j:
+                k += 1
+                continue
+            if (groups[i] & masks[j]) == 0 or (groups[j] & masks[i]) == 0:
+                continue
+            tested[0] += 1
+            dx = p[i, 0] - p[j, 0]
+            dy = p[i, 1] - p[j, 1]
+            dz = p[i, 2] - p[j, 2]
+            distance = np.sqrt(dx*dx + dy*dy + dz*dz)
+            r_sum = r[i] + r[j]
+            if distance < r_sum:
+                if m == capacity:
+                    return -1
+                first[m] = i
+                second[m] = j
+                normal[m, 0] = dx/distance
+                normal[m, 1] = dy/distance
+                normal[m, 2] = dz/distance
+                penetration[m] = r_sum - distance
+                restitution[m] = 1
+                m += 1
+    return m
+
+
+@jit
+def boundaries(p, r, limits, first, second, normal, penetration,
+               restitution, start):
+    """Write a contact for every wall a sphere touches, in the order of
+    BoundaryCollisionGenerator.  There is no upper z wall."""
+    capacity = first.shape[0]
+    m = start
+    for i in range(p.shape[0]):
+        for axis in range(3):
+            low = limits[axis, 0] + r[i]
+            high = limits[axis, 1] - r[i]
+            if p[i, axis] <= low:
+                depth = low - p[i, axis]
+                sign = 1
+            elif axis < 2 and p[i, axis] >= high:
+                depth = high - p[i, axis]
+                sign = -1
+            else:
+                continue
+            if m == capacity:
+                return -1
+            first[m] = i
+            second[m] = -1
+            normal[m, 0] = 0
+            normal[m, 1] = 0
+            normal[m, 2] = 0
+            normal[m, axis] = sign
+            penetration[m] = depth
+            restitution[m] = 1
+            m += 1
+    return m
+
+
+@jit
+def links(p, ends, kinds, lengths, link_restitution, first, second, normal,
+          penetration, restitution, start):
+    """Write a contact for every rod not at its length and every
+    overextended cable, in the order the links are given."""
+    capacity = first.shape[0]
+    m = start
+    for k in range(ends.shape[0]):
+        i = ends[k, 0]
+        j = ends[k, 1]
+        dx = p[i, 0] - p[j, 0]
+        dy = p[i, 1] - p[j, 1]
+        dz = p[i, 2] - p[j, 2]
+        length = np.sqrt(dx*dx + dy*dy + dz*dz)
+        sign = 1
+        if kinds[k] == CABLE:
+            if length < lengths[k]:
+                continue
+            depth = length - lengths[k]
+            bounce = link_restitution[k]
+        else:
+            if length == lengths[k]:
+                continue
+            if length > lengths[k]:
+                depth = length - lengths[k]
+            else:
+                depth = lengths[k] - length
+                sign = -1
+            bounce = 0.0
+        if m == capacity:
+            return -1
+        first[m] = i
+        second[m] = j
+        normal[m, 0] = sign*(-dx/length)
+        normal[m, 1] = sign*(-dy/length)
+        normal[m, 2] = sign*(-dz/length)
+        penetration[m] = depth
+        restitution[m] = bounce
+        m += 1
+    return m
+
+
+@jit
+def resolve(p, v, a, inv_mass, first, second, normal, penetration,
+            restitution, count, dt, touched):
+    """Resolve count contacts in order for velocity and then
+    interpenetration, as ParticleContact.resolve does, marking the particles
+    moved in touched."""
+    for c in range(count):
+        i = first[c]
+        j = second[c]
+        nx = normal[c, 0]
+        ny = normal[c, 1]
+        nz = normal[c, 2]
+        total_inv_mass = inv_mass[i]
+        if j >= 0:
+            total_inv_mass += inv_mass[j]
+        touched[i] = True
+        if j >= 0:
+            touched[j] = True
+
+        # velocity
+        vx = v[i, 0]
+        vy = v[i, 1]
+        vz = v[i, 2]
+        if j >= 0:
+            vx = vx - v[j, 0]
+            vy = vy - v[j, 1]
+            vz = vz - v[j, 2]
+        v_sep = vx*nx + vy*ny + vz*nz
+        if v_sep < 0:
+            new_v_sep = -restitution[c]*v_sep
+            ax = a[i, 0]
+            ay = a[i, 1]
+            az = a[i, 2]
+            if j >= 0:
+                ax = ax - a[j, 0]
+                ay = ay - a[j, 1]
+                az = az - a[j, 2]
+            v_acc = (ax*dt)*nx + (ay*dt)*ny + (az*dt)*nz
+            if v_acc < 0:
+                new_v_sep += restitution[c]*v_acc
+                if new_v_sep < 0:
+                    new_v_sep = 0.0
+            dv_sep = new_v_sep - v_sep
+            if total_inv_mass != 0:
+                dv = inv_mass[i]*dv_sep/total_inv_mass
+                v[i, 0] += dv*nx
+                v[i, 1] += dv*ny
+                v[i, 2] += dv*nz
+                if j >= 0:
+                    dv = inv_mass[j]*dv_sep/total_inv_mass
+                    v[j, 0] -= dv*nx
+                    v[j, 1] -= dv*ny
+                    v[j, 2] -= dv*nz
+
+        # interpenetration
+        depth = penetration[c]
+        if depth <= 0 or total_inv_mass == 0:
+            continue
+        move = inv_mass[i]*depth
+        p[i, 0] += nx*move/total_inv_mass
+        p[i, 1] += ny*move/total_inv_mass
+        p[i, 2] += nz*move/total_inv_mass
+        if j >= 0:
+            move = inv_mass[j]*depth
+            p[j, 0] -= nx*move/total_inv_mass
+            p[j, 1] -= ny*move/total_inv_mass
+            p[j, 2] -= nz*move/total_inv_mass
+
+
+_compiled = False
+
+
+def compile_kernels():
+    """Compile every kernel for the argument types ContactSolver uses by
+    calling it on empty arrays, so compiling is not part of the first
+    step.  Compiled kernels are cached on disk by numba."""
+    global _compiled
+    if _compiled or numba is None:
+        return
+    p = np.zeros((0, 3))
+    buffers = (np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64),
+               np.zeros((1, 3)), np.zeros(1), np.zeros(1))
+    bits = np.zeros(0, dtype=np.int64)
+    collide(p, np.zeros(0), bits, bits, np.zeros(1, dtype=np.int64), bits,
+            np.zeros(1, dtype=np.int64), *(buffers + (0,)))
+    boundaries(p, np.zeros(0), np.zeros((3, 2)), *(buffers + (0,)))
+    links(p, np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64),
+          np.zeros(0), np.zeros(0), *(buffers + (0,)))
+    resolve(p, p.copy(), p.copy(), np.zeros(0),
+            *(buffers + (0, 1/120, np.zeros(0, dtype=bool))))
+    _compiled = True
+
+
+class ContactSolver:
+    """Generates and resolves the contacts of a ParticleWorld with the
+    kernels in place of its contact generators' objects.  Collision and
+    boundary generators over the world's own particle list, rods, cables
+    and ParticleLinkSets are run as kernels, other generators' contacts are
+    copied into the buffers, all in the order of world.contact_generators.
+    Every contact is then resolved as a plain ParticleContact.
+    Variables:
+        n_contacts: Number of contacts generated by the last call to
+            generate
+    Methods:
+        generate: Generate the contacts of a world into the buffers
+        order: Sort the contacts as ParticleWorld.order_contacts does
+        resolve: Resolve the generated contacts and update the particles
+    """
+    def __init__(self, capacity=1024):
+        compile_kernels()
+        self.n_contacts = 0
+        self._allocate(capacity)
+        self._particles = None
+        self._p = None
+
+    def _allocate(self, capacity):
+        self.first = np.zeros(capacity, dtype=np.int64)
+        self.second = np.zeros(capacity, dtype=np.int64)
+        self.normal = np.zeros((capacity, 3))
+        self.penetration = np.zeros(capacity)
+        self.restitution = np.zeros(capacity)
+
+    def _buffers(self):
+        return (self.first, self.second, self.normal, self.penetration,
+                self.restitution)
+
+    def _grow(self, rows):
+        """Double the buffers, keeping their first rows rows."""
+        old = self._buffers()
+        self._allocate(2*len(self.first))
+        for new, values in zip(self._buffers(), old):
+            new[:rows] = values[:rows]
+
+    def _run(self, kernel, args, start):
+        """Call a generating kernel, growing the buffers until they fit."""
+        while True:
+            end = kernel(*(args + self._buffers() + (start,)))
+            if end >= 0:
+                return end
+            self._grow(start)
+
+    def generate(self, world, generators=None):
+        """Generate every contact of world, or of a list of its contact
+        generators."""
+        if generators is None:
+            generators = world.contact_generators
+        particles = world.particle_list
+        n = len(particles)
+        p = np.array([particle.physics.p for particle in particles],
+                     dtype=float).reshape(n, 3)
+        r = np.array([particle.graphics.r for particle in particles],
+                     dtype=float)
+        index = {id(particle): i for i, particle in enumerate(particles)}
+        count = 0
+        run = []
+        for generator in generators + [None]:
+            if type(generator) in (plinks.ParticleRod, plinks.ParticleCable):
+                run.append(generator)
+                continue
+            if run:
+                count = self._run(links,
+                                  (p,) + self._link_arrays(run, index),
+                                  count)
+                run = []
+            if generator is None:
+                break
+            kind = type(generator)
+            if kind is pcontacts.ParticleCollisionGenerator and \
+                    generator.particles is particles:
+                tested = np.zeros(1, dtype=np.int64)
+                count = self._run(collide, (p, r) + generator.filter_arrays() +
+                                  (tested,), count)
+                generator.n_candidates = int(tested[0])
+            elif kind is pcontacts.BoundaryCollisionGenerator and \
+                    generator.particles is particles:
+                limits = np.array([generator.xlim, generator.ylim,
+                                   generator.zlim], dtype=float)
+                count = self._run(boundaries, (p, r, limits), count)
+            elif kind is plinks.ParticleLinkSet:
+                ends = np.array([index[id(particle)]
+                                 for particle in generator.particles],
+                                dtype=np.int64)[generator.ends]
+                count = self._run(links, (
+                    p, ends, generator.cables.astype(np.int64),
+                    generator.lengths, generator.restitution), count)
+            else:
+                count = self._copy(generator.gen_contacts(), index, count)
+        self.n_contacts = count
+        self._particles = particles
+        self._p = p
+
+    @staticmethod
+    def _link_arrays(run, index):
+        """Return the ends, kinds, lengths and restitutions of a run of
+        rods and cables."""
+        ends = np.array([[index[id(link.particles[0])],
+                          index[id(link.particles[1])]] for link in run],
+                        dtype=np.int64)
+        kinds = np.array([CABLE if type(link) is plinks.ParticleCable
+                          else ROD for link in run], dtype=np.int64)
+        lengths = np.array([link.max_length
+                            if type(link) is plinks.ParticleCable
+                            else link.length for link in run], dtype=float)
+        restitution = np.array([getattr(link, 'restitution', 0)
+                                for link in run], dtype=float)
+        return ends, kinds, lengths, restitution
+
+    def _copy(self, contacts, index, count):
+        """Copy contact objects into the buffers from row count."""
+        while count + len(contacts) > len(self.first):
+            self._grow(count)
+        for contact in contacts:
+            first, second = contact.entities
+            self.first[count] = index[id(first)]
+            self.second[count] = -1 if second is None else index[id(second)]
+            self.normal[count] = contact.normal
+            self.penetration[count] = contact.penetration
+            self.restitution[count] = contact.restitution
+            count += 1
+        return count
+
+    def order(self):
+        """Sort the contacts by particle indices, boundary contacts first,
+        then by normal and penetration."""
+        n = self.n_contacts
+        order = np.lexsort((self.penetration[:n], self.normal[:n, 2],
+                            self.normal[:n, 1], self.normal[:n, 0],
+                            self.second[:n], self.first[:n]))
+        for values in self._buffers():
+            values[:n] = values[:n][order]
+
+    def resolve(self, dt):
+        """Resolve the contacts from the last call to generate and write the
+        new positions and velocities back to the particles moved."""
+        count = self.n_contacts
+        particles = self._particles
+        self._particles = None
+        if not count:
+            return
+        physics = [particle.physics for particle in particles]
+        n = len(physics)
+        v = np.array([c.v for c in physics], dtype=float).reshape(n, 3)
+        a = np.array([c.a for c in physics], dtype=float).reshape(n, 3)
+        inv_mass = np.array([c.inv_mass for c in physics], dtype=float)
+        touched = np.zeros(n, dtype=bool)
+        p = self._p
+        resolve(p, v, a, inv_mass, self.first, self.second, self.normal,
+                self.penetration, self.restitution, count, dt, touched)
+        for i in np.flatnonzero(touched).tolist():
+            physics[i].p[:] = p[i]
+            physics[i].v[:] = v[i]
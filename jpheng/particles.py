@@ -2,22 +2,60 @@ import numpy as np
 import jpheng.physics as phy
 import jpheng.graphics as gra
 
+# collision_group and collision_mask bits, see Particle
+DEFAULT_GROUP = 1
+ALL_GROUPS = 0xFFFFFFFF
+
 
 class Particle:
     """Parent class for all particle objects which are rendered in-simulation.
     Stores a PhysicsComponent and a GraphicsComponent, the former of which
     describes the particle's physics properties and behaviour, the latter of
     which describes the graphical properties and drawing methods.
+
+    Two particles are only tested for collision if the collision_group of
+    each shares a bit with the collision_mask of the other.  Every particle
+    starts in DEFAULT_GROUP colliding with ALL_GROUPS, a mask of 0 turns a
+    particle's collisions off.
     Variables:
         physics: PhysicsComponent object, handles entity physics
         graphics: GraphicsComponent object, handles entity graphics
+        collision_group: Bits of the collision groups the particle is in
+        collision_mask: Bits of the collision groups the particle collides
+            with
+        filter_version: Incremented whenever collision_group or
+            collision_mask is set
     Methods:
         draw: Draw the particle
         step: Call the component step routines
     """
+    __slots__ = ('physics', 'graphics', '_collision_group',
+                 '_collision_mask', 'filter_version')
+
     def __init__(self, physics, graphics):
         self.physics = physics
         self.graphics = graphics
+        self._collision_group = DEFAULT_GROUP
+        self._collision_mask = ALL_GROUPS
+        self.filter_version = 0
+
+    @property
+    def collision_group(self):
+        return self._collision_group
+
+    @collision_group.setter
+    def collision_group(self, bits):
+        self._collision_group = bits
+        self.filter_version += 1
+
+    @property
+    def collision_mask(self):
+        return self._collision_mask
+
+    @collision_mask.setter
+    def collision_mask(self, bits):
+        self._collision_mask = bits
+        self.filter_version += 1
 
     def draw(self):
         """Draw the entity on screen."""
@@ -31,6 +69,8 @@ class Particle:
 
 class QuickParticle(Particle):
     """Class defining a point mass."""
+    __slots__ = ()
+
     def __init__(self, p, v, a, inv_mass, r, color=None):
         physics = phy.PhysicsComponent(p, v, a, inv_mass)
         graphics = gra.SphereComponent(r, color)
@@ -39,6 +79,8 @@ class QuickParticle(Particle):
 
 class Laser(Particle):
     """Class defining a laser bullet."""
+    __slots__ = ()
+
     def __init__(self, p, direction):
         v = 100*np.array(direction)
         a = np.zeros(3)
@@ -54,6 +96,8 @@ class Laser(Particle):
 class Firework(Particle):
     """Class defining a firework.  Intended for use with rules found in
     'fireworks_demo.py'"""
+    __slots__ = ('fuse', 'generation', 'parent')
+
     def __init__(self, p, v, fuse, parent=True, generation=0):
         a = [0,0,0]
         inv_mass = 1/200
@@ -78,3 +122,71 @@ class Firework(Particle):
         """In addition to default entity update, reduce fuse by dt."""
         Particle.step(self, dt)
         self.fuse -= dt
+
+
+def from_arrays(p, v, a, inv_mass, r, colors=None, g=None, damping=None,
+                force_accum=None, types=None, graphics_types=None,
+                dtype=float, rng=None):
+    """Build many particles at once from arrays with one row per particle.
+    Constructors are bypassed: every particle's vectors are rows of one
+    copy of each array, and graphics components are copied from one built
+    for each type and radius, which is several times faster than calling
+    the constructors.  Particle subclasses are created without their own
+    state, e.g. a Firework's fuse, which must be set afterwards.
+    Arguments:
+        p, v, a: Positions, velocities and accelerations, (n, 3)
+        inv_mass: Inverse masses, (n,)
+        r: Radii, (n,)
+        colors: RGB colors, (n, 3), random if None
+        g: Accelerations due to gravity, (n, 3), PhysicsComponent's default
+            if None
+        damping: Damping constants, (n,), PhysicsComponent's default if None
+        force_accum: Force accumulators, (n, 3), zero if None
+        types: Particle class of each particle, QuickParticle if None
+        graphics_types: GraphicsComponent class of each particle,
+            SphereComponent if None
+        dtype: Float type the vectors are stored as
+        rng: numpy RandomState random colors are drawn from, the graphics
+            module's if None
+    Returns:
+        List of particles
+    """
+    n = len(p)
+    if colors is None:
+        colors = gra.random_colors(n, rng)
+    if g is None:
+        g = np.tile([0, 0, -20], (n, 1))
+    if damping is None:
+        damping = np.full(n, 0.999)
+    if force_accum is None:
+        force_accum = np.zeros((n, 3))
+    if types is None:
+        types = [QuickParticle]*n
+    if graphics_types is None:
+        graphics_types = [gra.SphereComponent]*n
+    rows = {name: list(np.array(values, dtype=dtype).reshape(n, 3))
+            for name, values in (('p', p), ('v', v), ('a', a), ('g', g),
+                                 ('force_accum', force_accum))}
+    inv_mass = np.asarray(inv_mass, dtype=float).tolist()
+    damping = np.asarray(damping, dtype=float).tolist()
+    r = np.asarray(r, dtype=float).tolist()
+    colors = [tuple(color) for color in np.asarray(colors).tolist()]
+    templates = {}
+    particles = []
+    for i in range(n):
+        physics = phy.PhysicsComponent.__new__(phy.PhysicsComponent)
+        for name, values in rows.items():
+            setattr(physics, name, values[i])
+        physics.inv_mass = inv_mass[i]
+        physics.damping = damping[i]
+        graphics_cls = graphics_types[i]
+        key = (graphics_cls, r[i])
+        if key not in templates:
+            templates[key] = graphics_cls(r[i], colors[i]).__dict__
+        graphics = graphics_cls.__new__(graphics_cls)
+        graphics.__dict__.update(templates[key])
+        graphics.color = colors[i]
+        particle = types[i].__new__(types[i])
+        Particle.__init__(particle, physics, graphics)
+        particles.append(particle)
+    return particles
@@ -0,0 +1,352 @@
+import numpy as np
+import jpheng.particles as entities
+import jpheng.pcontacts as pcontacts
+import jpheng.pfgen as pfgen
+
+
+class BatchParticleWorld:
+    """Steps many small worlds with identical topology in lockstep.
+
+    Every state array carries a leading world axis, e.g. positions have
+    shape (n_worlds, n_particles, 3), so forces, integration and contacts
+    for all worlds are evaluated in single array operations.  The physics
+    follows ParticleWorld.step exactly: forces from the registered
+    generators are accumulated, particles are integrated as in
+    PhysicsComponent.step, then particle collisions and boundary contacts are
+    generated from the integrated positions and resolved in the same order
+    as ParticleWorld resolves them.  Particles with zero inverse mass do not
+    accelerate.
+
+    Worlds are normally built from a template ParticleWorld with from_world,
+    after which per-world parameters, e.g. spring_k[w], may be changed.
+    from_world raises TypeError for worlds it cannot follow exactly.
+    Variables:
+        n_worlds: Number of worlds
+        n_particles: Number of particles in each world
+        xlim, ylim, zlim: Limits of the boundary walls
+        p, v, a: Position, velocity and acceleration, (n_worlds, n, 3)
+        force_accum: Force accumulator, (n_worlds, n, 3)
+        inv_mass: Inverse masses, (n_worlds, n)
+        g: Accelerations due to gravity, (n_worlds, n, 3)
+        damping: Damping constants, (n_worlds, n)
+        radius: Radii of the particles, (n,)
+        collisions: If True particles collide with each other
+        restitution: Coefficient of restitution for all contacts
+        spring_particles, spring_others: Indices of the particle each
+            ParticleSpring acts on and the particle at its other end, (S,)
+        spring_k, spring_l0: Spring constants and natural lengths,
+            (n_worlds, S)
+        anchor_particles: Indices of the particle each anchored spring or
+            bungee acts on, (A,)
+        anchors: Anchor points, (A, 3)
+        anchor_k, anchor_l0: Spring constants and natural lengths,
+            (n_worlds, A)
+        anchor_bungee: True for bungees, which only act when stretched, (A,)
+        stiff_particles: Indices of the particle each StiffAnchoredSpring
+            acts on, (T,)
+        stiff_anchors: Anchor points, (T, 3)
+        stiff_k, stiff_d: Spring and damping constants, (n_worlds, T)
+        gravity_particles: Indices of the particle each GravityGenerator acts
+            on, (G,)
+        gravity: Acceleration of each GravityGenerator, (G, 3)
+        initial: Dictionary of the state arrays restored by reset
+    Methods:
+        from_world: Build a batch of copies of a ParticleWorld
+        save_initial_state: Store the current state for reset
+        reset: Restore the initial state of some or all worlds
+        step: Advance every world by dt
+        update_forces: Accumulate the registered forces
+        integrate: Integrate every particle
+        resolve_contacts: Generate and resolve collisions and boundary
+            contacts
+    """
+    # state restored by reset
+    STATE = ('p', 'v', 'a', 'force_accum')
+
+    def __init__(self, n_worlds, n_particles, xlim, ylim, zlim):
+        self.n_worlds = n_worlds
+        self.n_particles = n_particles
+        self.xlim = xlim
+        self.ylim = ylim
+        self.zlim = zlim
+        shape = (n_worlds, n_particles, 3)
+        self.p = np.zeros(shape)
+        self.v = np.zeros(shape)
+        self.a = np.zeros(shape)
+        self.force_accum = np.zeros(shape)
+        self.inv_mass = np.ones((n_worlds, n_particles))
+        self.g = np.zeros(shape)
+        self.g[..., 2] = -20
+        self.damping = np.full((n_worlds, n_particles), 0.999)
+        self.radius = np.ones(n_particles)
+        self.collisions = True
+        self.restitution = 1
+        # force registrations
+        self.spring_particles = np.zeros(0, dtype=int)
+        self.spring_others = np.zeros(0, dtype=int)
+        self.spring_k = np.zeros((n_worlds, 0))
+        self.spring_l0 = np.zeros((n_worlds, 0))
+        self.anchor_particles = np.zeros(0, dtype=int)
+        self.anchors = np.zeros((0, 3))
+        self.anchor_k = np.zeros((n_worlds, 0))
+        self.anchor_l0 = np.zeros((n_worlds, 0))
+        self.anchor_bungee = np.zeros(0, dtype=bool)
+        self.stiff_particles = np.zeros(0, dtype=int)
+        self.stiff_anchors = np.zeros((0, 3))
+        self.stiff_k = np.zeros((n_worlds, 0))
+        self.stiff_d = np.zeros((n_worlds, 0))
+        self.gravity_particles = np.zeros(0, dtype=int)
+        self.gravity = np.zeros((0, 3))
+        self.initial = {}
+        self.save_initial_state()
+
+    @classmethod
+    def from_world(cls, world, n_worlds):
+        """Build n_worlds copies of a ParticleWorld.  Its force registry may
+        contain any of the generators in pfgen and its contact generators
+        must be its own boundary generator and, optionally, its own
+        collision generator.  Raises TypeError for anything else, including
+        links, a link solver and particles whose collision bits are not the
+        defaults."""
+        particles = world.particle_list
+        index = {id(particle): i for i, particle in enumerate(particles)}
+        for particle in particles:
+            if particle.collision_group != entities.DEFAULT_GROUP or \
+                    particle.collision_mask != entities.ALL_GROUPS:
+                raise TypeError('collision groups and masks are not '
+                                'supported by BatchParticleWorld')
+        if world.link_solver is not None:
+            raise TypeError('link solvers are not supported by '
+                            'BatchParticleWorld')
+        kinds = []
+        for generator in world.contact_generators:
+            kind = type(generator)
+            if kind not in (pcontacts.ParticleCollisionGenerator,
+                            pcontacts.BoundaryCollisionGenerator) or \
+                    generator.particles is not particles or kind in kinds:
+                raise TypeError('{} is not supported by BatchParticleWorld'
+                                .format(kind.__name__))
+            kinds.append(kind)
+        if pcontacts.BoundaryCollisionGenerator not in kinds:
+            raise TypeError('BatchParticleWorld needs the world\'s '
+                            'BoundaryCollisionGenerator')
+        batch = cls(n_worlds, len(particles), world.xlim, world.ylim,
+                    world.zlim)
+        batch.collisions = pcontacts.ParticleCollisionGenerator in kinds
+        for i, particle in enumerate(particles):
+            batch.p[:, i] = particle.physics.p
+            batch.v[:, i] = particle.physics.v
+            batch.a[:, i] = particle.physics.a
+            batch.force_accum[:, i] = particle.physics.force_accum
+            batch.inv_mass[:, i] = particle.physics.inv_mass
+            batch.g[:, i] = particle.physics.g
+            batch.damping[:, i] = particle.physics.damping
+            batch.radius[i] = particle.graphics.r
+
+        springs = []
+        anchored = []
+        stiff = []
+        gravity = []
+        for entry in world.force_registry.registry:
+            i = index[id(entry.particle)]
+            generator = entry.generator
+            if isinstance(generator, pfgen.ParticleSpring):
+                springs.append((i, index[id(generator.other_particle)],
+                                generator.k, generator.l0))
+            elif isinstance(generator, (pfgen.AnchoredSpring,
+                                        pfgen.AnchoredBungee)):
+                anchored.append((i, generator.anchor, generator.k,
+                                 generator.l0, isinstance(
+                                     generator, pfgen.AnchoredBungee)))
+            elif isinstance(generator, pfgen.StiffAnchoredSpring):
+                stiff.append((i, generator.anchor, generator.k, generator.d))
+            elif isinstance(generator, pfgen.GravityGenerator):
+                gravity.append((i, generator.g))
+            else:
+                raise TypeError('{} is not supported by BatchParticleWorld'
+                                .format(type(generator).__name__))
+        if springs:
+            i, j, k, l0 = zip(*springs)
+            batch.spring_particles = np.array(i)
+            batch.spring_others = np.array(j)
+            batch.spring_k = np.tile(np.array(k, dtype=float), (n_worlds, 1))
+            batch.spring_l0 = np.tile(np.array(l0, dtype=float),
+                                      (n_worlds, 1))
+        if anchored:
+            i, anchor, k, l0, bungee = zip(*anchored)
+            batch.anchor_particles = np.array(i)
+            batch.anchors = np.array(anchor, dtype=float)
+            batch.anchor_k = np.tile(np.array(k, dtype=float), (n_worlds, 1))
+            batch.anchor_l0 = np.tile(np.array(l0, dtype=float),
+                                      (n_worlds, 1))
+            batch.anchor_bungee = np.array(bungee)
+        if stiff:
+            i, anchor, k, d = zip(*stiff)
+            batch.stiff_particles = np.array(i)
+            batch.stiff_anchors = np.array(anchor, dtype=float)
+            batch.stiff_k = np.tile(np.array(k, dtype=float), (n_worlds, 1))
+            batch.stiff_d = np.tile(np.array(d, dtype=float), (n_worlds, 1))
+        if gravity:
+            i, g = zip(*gravity)
+            batch.gravity_particles = np.array(i)
+            batch.gravity = np.array(g, dtype=float)
+        batch.save_initial_state()
+        return batch
+
+    def save_initial_state(self):
+        """Store the current state of every world to be restored by
+        reset."""
+        self.initial = {name: getattr(self, name).copy()
+                        for name in self.STATE}
+
+    def reset(self, worlds=None):
+        """Restore the initial state of the given worlds, an index, array of
+        indices or boolean mask, or of every world if worlds is None."""
+        if worlds is None:
+            worlds = slice(None)
+        for name in self.STATE:
+            getattr(self, name)[worlds] = self.initial[name][worlds]
+
+    def step(self, dt):
+        """Advance every world by a time step of dt."""
+        self.update_forces(dt)
+        self.integrate(dt)
+        self.resolve_contacts(dt)
+
+    def _add_force(self, particles, f, movable):
+        """Add forces f, (n_worlds, len(particles), 3), to the accumulators
+        of particles, skipping particles with infinite mass."""
+        f = np.where(movable[..., np.newaxis], f, 0)
+        np.add.at(self.force_accum, (slice(None), particles), f)
+
+    def update_forces(self, duration):
+        """Accumulate the forces of every registered force generator."""
+        if len(self.spring_particles):
+            i = self.spring_particles
+            d = self.p[:, i] - self.p[:, self.spring_others]
+            length = np.sqrt(np.sum(d*d, axis=-1))
+            f = -(self.spring_k*(length - self.spring_l0) /
+                  length)[..., np.newaxis]*d
+            self._add_force(i, f, self.inv_mass[:, i] != 0)
+        if len(self.anchor_particles):
+            i = self.anchor_particles
+            d = self.p[:, i] - self.anchors
+            length = np.sqrt(np.sum(d*d, axis=-1))
+            f = -(self.anchor_k*(length - self.anchor_l0) /
+                  length)[..., np.newaxis]*d
+            # bungees do not resist compression
+            active = ~(self.anchor_bungee & (length <= self.anchor_l0))
+            self._add_force(i, f, (self.inv_mass[:, i] != 0) & active)
+        if len(self.stiff_particles):
+            i = self.stiff_particles
+            k = self.stiff_k
+            d = self.stiff_d
+            freq2 = k - 0.25*d*d
+            active = (self.inv_mass[:, i] != 0) & (freq2 > 0)
+            gamma = (0.5*np.sqrt(np.maximum(freq2, 0)))[..., np.newaxis]
+            gamma = np.where(gamma > 0, gamma, 1)
+            d = d[..., np.newaxis]
+            p0 = self.p[:, i] - self.stiff_anchors
+            v = self.v[:, i]
+            c = p0*d/(2*gamma) + v/gamma
+            target = (p0*np.cos(gamma*duration) +
+                      c*np.sin(gamma*duration))*np.exp(-0.5*d*duration)
+            accel = 2*(target - p0)/(duration*duration) - 2*v/duration
+            inv_mass = self.inv_mass[:, i, np.newaxis]
+            f = accel/np.where(inv_mass != 0, inv_mass, 1)
+            self._add_force(i, f, active)
+        if len(self.gravity_particles):
+            i = self.gravity_particles
+            inv_mass = self.inv_mass[:, i, np.newaxis]
+            f = np.broadcast_to(self.gravity, self.p[:, i].shape) / \
+                np.where(inv_mass != 0, inv_mass, 1)
+            self._add_force(i, f, self.inv_mass[:, i] != 0)
+
+    def integrate(self, dt):
+        """Integrate every particle as PhysicsComponent.step does, then clear
+        the force accumulators back to gravity."""
+        self.p += self.v*dt + 0.5*self.a*dt**2
+        self.v = self.v*(self.damping**dt)[..., np.newaxis] + self.a*dt
+        self.a = self.force_accum*self.inv_mass[..., np.newaxis]
+        movable = self.inv_mass != 0
+        mass = np.where(movable, 1/np.where(movable, self.inv_mass, 1), 0)
+        self.force_accum = self.g*mass[..., np.newaxis]
+
+    def _resolve(self, active, i, j, normal, penetration, dt):
+        """Resolve one contact in every world where active is True.  i is
+        the index of the first particle and j that of the second, or None
+        for contacts with the scenery.  normal is (n_worlds, 3) and
+        penetration (n_worlds,)."""
+        inv_a = np.where(active, self.inv_mass[:, i], 0)
+        total_inv_mass = inv_a.copy()
+        v_rel = self.v[:, i].copy()
+        a_rel = self.a[:, i].copy()
+        if j is not None:
+            inv_b = np.where(active, self.inv_mass[:, j], 0)
+            total_inv_mass += inv_b
+            v_rel -= self.v[:, j]
+            a_rel -= self.a[:, j]
+        safe_total = np.where(total_inv_mass > 0, total_inv_mass, 1)
+
+        # velocity
+        v_sep = np.sum(v_rel*normal, axis=-1)
+        new_v_sep = -self.restitution*v_sep
+        v_acc = np.sum(a_rel*dt*normal, axis=-1)
+        new_v_sep = np.where(
+            v_acc < 0, np.maximum(new_v_sep + self.restitution*v_acc, 0),
+            new_v_sep)
+        dv_sep = np.where(active & (v_sep < 0) & (total_inv_mass > 0),
+                          new_v_sep - v_sep, 0)
+        impulse = (dv_sep/safe_total)[:, np.newaxis]*normal
+        self.v[:, i] += inv_a[:, np.newaxis]*impulse
+        if j is not None:
+            self.v[:, j] -= inv_b[:, np.newaxis]*impulse
+
+        # interpenetration
+        depth = np.where(active & (penetration > 0) & (total_inv_mass > 0),
+                         penetration, 0)
+        move = (depth/safe_total)[:, np.newaxis]*normal
+        self.p[:, i] += inv_a[:, np.newaxis]*move
+        if j is not None:
+            self.p[:, j] -= inv_b[:, np.newaxis]*move
+
+    def resolve_contacts(self, dt):
+        """Generate particle collision and boundary contacts from the
+        current positions, then resolve them in the order ParticleWorld
+        would: collisions pair by pair, then boundaries particle by
+        particle."""
+        p = self.p.copy()
+        r = self.radius
+        contacts = []
+        if self.collisions:
+            for i in range(self.n_particles - 1):
+                for j in range(i + 1, self.n_particles):
+                    p_sep = p[:, i] - p[:, j]
+                    distance = np.sqrt(np.sum(p_sep*p_sep, axis=-1))
+                    active = distance < r[i] + r[j]
+                    if not active.any():
+                        continue
+                    normal = p_sep/np.where(active, distance,
+                                            1)[:, np.newaxis]
+                    contacts.append((active, i, j, normal,
+                                     r[i] + r[j] - distance))
+        ones = np.ones(self.n_worlds)
+        for i in range(self.n_particles):
+            for axis, limits in enumerate((self.xlim, self.ylim, self.zlim)):
+                lower = p[:, i, axis] <= limits[0] + r[i]
+                if lower.any():
+                    normal = np.zeros((self.n_worlds, 3))
+                    normal[:, axis] = ones
+                    contacts.append((lower, i, None, normal,
+                                     limits[0] + r[i] - p[:, i, axis]))
+                # there is no ceiling
+                if axis == 2:
+                    continue
+                upper = ~lower & (p[:, i, axis] >= limits[1] - r[i])
+                if upper.any():
+                    normal = np.zeros((self.n_worlds, 3))
+                    normal[:, axis] = -ones
+                    contacts.append((upper, i, None, normal,
+                                     limits[1] - r[i] - p[:, i, axis]))
+        for contact in contacts:
+            self._resolve(*contact, dt=dt)
@@ -0,0 +1,309 @@
+import numpy as np
+import jpheng.plinks as plinks
+
+# Position based dynamics for rods and cables.  Instead of generating
+# contacts which push the ends of a link apart or together with impulses,
+# a LinkSolver moves the ends of every violated link directly after the
+# world's contacts are resolved, sweeping over all links for a number of
+# iterations, and adds the distance each particle was moved divided by the
+# step to its velocity.  Chains and cloth stay at their lengths with one
+# step per frame where impulse contacts resolved in list order need many.
+#
+# Constraints are solved as in XPBD: compliance is the inverse stiffness
+# of the links, 0 for rigid rods, and a link's accumulated multiplier
+# makes the result independent of the number of iterations.  A cable only
+# ever pulls, its restitution is not used.  Links are split into colors,
+# groups in which no two links share a particle, so every link of a color
+# is projected at once while successive colors see each other's
+# corrections as in a Gauss-Seidel sweep.
+
+LINK_TYPES = (plinks.ParticleLink, plinks.ParticleLinkSet)
+
+
+def color_links(ends):
+    """Greedily assign each link the first color not used by another link
+    at either of its ends.
+    Arguments:
+        ends: Numpy int array, (n_links, 2), particle indices of the two
+            ends of each link
+    Returns:
+        List of numpy int arrays, the indices of the links of each color in
+        the order they are given
+    """
+    used = {}
+    colors = []
+    for k, (i, j) in enumerate(ends.tolist()):
+        taken = used.setdefault(i, set()) | used.setdefault(j, set())
+        color = 0
+        while color in taken:
+            color += 1
+        used[i].add(color)
+        used[j].add(color)
+        if color == len(colors):
+            colors.append([])
+        colors[color].append(k)
+    return [np.array(links, dtype=np.int64) for links in colors]
+
+
+def _scale_rows(rows, scale, out):
+    """Multiply each row of the (n, 3) array rows by an element of scale
+    into out, column by column as broadcasting scale[:, np.newaxis]
+    allocates a buffer for every row."""
+    for axis in range(3):
+        np.multiply(rows[:, axis], scale, out=out[:, axis])
+
+
+class LinkSolver:
+    """Projects the rods, cables and ParticleLinkSets of a ParticleWorld on
+    particle positions, see the module comment.  Assign it to
+    world.link_solver, the world then leaves those generators out of
+    contact generation and calls project after resolving contacts.
+
+    The links are gathered from the world's contact generators, and the
+    buffers project works in are allocated, when the generator list or its
+    length, or the size of a link set, change.  Call reset after changing
+    the length of a link already in the world or replacing a generator.
+    Variables:
+        iterations: Number of sweeps over the links per step
+        compliance: Inverse stiffness of the links, m/N, 0 for rigid links
+        n_links: Number of links projected in the last step
+        n_violated: Number of links violated before the last projection
+    Methods:
+        contact_generators: Returns the generators left to make contacts
+        project: Move the particles of a world to satisfy its links
+        reset: Gather the links again at the next step
+    """
+    def __init__(self, iterations=10, compliance=0):
+        self.iterations = iterations
+        self.compliance = compliance
+        self.n_links = 0
+        self.n_violated = 0
+        # generator list, its length and the link sets with their sizes the
+        # links were gathered from
+        self._generators = None
+        self._n_generators = None
+        self._sizes = []
+        self._particles = []
+        self._ends = np.zeros((0, 2), dtype=np.int64)
+        self._lengths = np.zeros(0)
+        self._cables = np.zeros(0, dtype=bool)
+        self._colors = []
+        self._buffers = None
+        self._color_buffers = []
+
+    def contact_generators(self, generators):
+        """Return generators without the links projected by the solver."""
+        return [generator for generator in generators
+                if not isinstance(generator, LINK_TYPES)]
+
+    def reset(self):
+        """Gather the links and their lengths again at the next step."""
+        self._generators = None
+
+    def _changed(self, generators):
+        """Return True if the links may have changed since they were
+        gathered."""
+        if generators is not self._generators or \
+                len(generators) != self._n_generators:
+            return True
+        for link_set, size in self._sizes:
+            if len(link_set) != size:
+                return True
+        return False
+
+    def _gather(self, generators):
+        """Rebuild the link arrays, colors and buffers from generators if
+        they changed since the last step."""
+        if not self._changed(generators):
+            return
+        links = [generator for generator in generators
+                 if isinstance(generator, LINK_TYPES)]
+        particles = []
+        index = {}
+
+        def particle_index(particle):
+            key = id(particle)
+            if key not in index:
+                index[key] = len(particles)
+                particles.append(particle)
+            return index[key]
+
+        ends = []
+        lengths = []
+        cables = []
+        sizes = []
+        for link in links:
+            if isinstance(link, plinks.ParticleLinkSet):
+                mapping = [particle_index(particle)
+                           for particle in link.particles]
+                ends.extend([mapping[i], mapping[j]]
+                            for i, j in link.ends.tolist())
+                lengths.extend(link.lengths.tolist())
+                cables.extend(link.cables.tolist())
+                sizes.append((link, len(link)))
+                continue
+            ends.append([particle_index(link.particles[0]),
+                         particle_index(link.particles[1])])
+            if isinstance(link, plinks.ParticleCable):
+                lengths.append(link.max_length)
+                cables.append(True)
+            else:
+                lengths.append(link.length)
+                cables.append(False)
+        self._particles = particles
+        self._ends = np.array(ends, dtype=np.int64).reshape(-1, 2)
+        self._lengths = np.array(lengths, dtype=float)
+        self._cables = np.array(cables, dtype=bool)
+        self._colors = color_links(self._ends)
+        self._generators = generators
+        self._n_generators = len(generators)
+        self._sizes = sizes
+        n = len(particles)
+        # start and projected positions, inverse masses, corrections and
+        # velocity changes of the particles
+        self._buffers = {
+            'start': np.zeros((n, 3)),
+            'p': np.zeros((n, 3)),
+            'inv_mass': np.zeros(n),
+            'correction': np.zeros((n, 3)),
+            'velocity': np.zeros((n, 3)),
+            'moved': np.zeros(n, dtype=bool),
+            'axis_moved': np.zeros(n, dtype=bool)}
+        # ends, lengths and cables of the links of each color, the
+        # multipliers accumulated over a step and temporaries
+        self._color_buffers = []
+        axes = np.arange(3)
+        for color in self._colors:
+            m = len(color)
+            i = np.ascontiguousarray(self._ends[color, 0])
+            j = np.ascontiguousarray(self._ends[color, 1])
+            self._color_buffers.append({
+                'i': i,
+                'j': j,
+                # flat indices of the rows of the ends in the positions
+                'rows_i': (3*i[:, np.newaxis] + axes).ravel(),
+                'rows_j': (3*j[:, np.newaxis] + axes).ravel(),
+                'lengths': self._lengths[color],
+                'cable': self._cables[color],
+                'multiplier': np.zeros(m),
+                'p_i': np.zeros((m, 3)),
+                'p_j': np.zeros((m, 3)),
+                'separation': np.zeros((m, 3)),
+                'step': np.zeros((m, 3)),
+                'move': np.zeros((m, 3)),
+                'length': np.zeros(m),
+                'error': np.zeros(m),
+                'w_i': np.zeros(m),
+                'w_j': np.zeros(m),
+                'weight': np.zeros(m),
+                'change': np.zeros(m),
+                'scratch': np.zeros(m),
+                'solvable': np.zeros(m, dtype=bool),
+                'unsolvable': np.zeros(m, dtype=bool),
+                'stretched': np.zeros(m, dtype=bool),
+                'flags': np.zeros(m, dtype=bool)})
+
+    def project(self, world, dt):
+        """Move the ends of the world's links until they are at their
+        lengths, or for iterations sweeps, and add the corrections to the
+        particles' velocities."""
+        self._gather(world.contact_generators)
+        particles = self._particles
+        self.n_links = len(self._ends)
+        self.n_violated = 0
+        if not self.n_links:
+            return
+        buffers = self._buffers
+        start = buffers['start']
+        p = buffers['p']
+        inv_mass = buffers['inv_mass']
+        for k, particle in enumerate(particles):
+            start[k] = particle.physics.p
+            inv_mass[k] = particle.physics.inv_mass
+        np.copyto(p, start)
+        for color in self._color_buffers:
+            color['multiplier'].fill(0)
+        alpha = self.compliance/dt**2
+        for iteration in range(self.iterations):
+            for color in self._color_buffers:
+                self._project_color(color, p, inv_mass, alpha,
+                                    iteration == 0)
+        correction = np.subtract(p, start, out=buffers['correction'])
+        velocity = np.divide(correction, dt, out=buffers['velocity'])
+        # a reduction along the rows allocates for every row
+        moved = np.not_equal(correction[:, 0], 0, out=buffers['moved'])
+        axis_moved = buffers['axis_moved']
+        for axis in (1, 2):
+            np.not_equal(correction[:, axis], 0, out=axis_moved)
+            np.logical_or(moved, axis_moved, out=moved)
+        for k, particle_moved in enumerate(moved):
+            if particle_moved:
+                physics = particles[k].physics
+                physics.p += correction[k]
+                physics.v += velocity[k]
+
+    def _project_color(self, color, p, inv_mass, alpha, first):
+        """Project the links of one color on the positions p, counting the
+        violated links if first, writing only into the color's buffers and
+        the rows of p at the links' ends."""
+        i = color['i']
+        j = color['j']
+        cable = color['cable']
+        multiplier = color['multiplier']
+        p_i = color['p_i']
+        p_j = color['p_j']
+        separation = color['separation']
+        length = color['length']
+        error = color['error']
+        w_i = color['w_i']
+        w_j = color['w_j']
+        weight = color['weight']
+        change = color['change']
+        scratch = color['scratch']
+        solvable = color['solvable']
+        unsolvable = color['unsolvable']
+        flags = color['flags']
+        # take only buffers out with mode='raise', the ends are valid
+        np.take(p, i, axis=0, out=p_i, mode='clip')
+        np.take(p, j, axis=0, out=p_j, mode='clip')
+        np.subtract(p_j, p_i, out=separation)
+        np.einsum('ij,ij->i', separation, separation, out=length)
+        np.sqrt(length, out=length)
+        np.subtract(length, color['lengths'], out=error)
+        np.take(inv_mass, i, out=w_i, mode='clip')
+        np.take(inv_mass, j, out=w_j, mode='clip')
+        np.add(w_i, w_j, out=weight)
+        np.add(weight, alpha, out=weight)
+        np.greater(weight, 0, out=solvable)
+        np.greater(length, 0, out=flags)
+        np.logical_and(solvable, flags, out=solvable)
+        np.logical_not(solvable, out=unsolvable)
+        np.negative(error, out=change)
+        np.multiply(multiplier, alpha, out=scratch)
+        np.subtract(change, scratch, out=change)
+        np.divide(change, weight, out=change, where=solvable)
+        np.copyto(change, 0, where=unsolvable)
+        # cables only pull, their multipliers may not turn positive
+        np.add(multiplier, change, out=scratch)
+        np.minimum(scratch, 0, out=scratch)
+        np.subtract(scratch, multiplier, out=change, where=cable)
+        if first:
+            np.not_equal(error, 0, out=flags)
+            stretched = np.greater(error, 0, out=color['stretched'])
+            np.copyto(flags, stretched, where=cable)
+            self.n_violated += int(np.count_nonzero(flags))
+        np.add(multiplier, change, out=multiplier)
+        np.copyto(length, 1, where=unsolvable)
+        np.divide(change, length, out=scratch)
+        step = color['step']
+        _scale_rows(separation, scratch, step)
+        move = color['move']
+        # no two links of a color share a particle, so the ends can be
+        # moved in their buffers and put back, which unlike assigning to
+        # p[i] allocates nothing
+        _scale_rows(step, w_i, move)
+        np.subtract(p_i, move, out=p_i)
+        np.put(p, color['rows_i'], p_i)
+        _scale_rows(step, w_j, move)
+        np.add(p_j, move, out=p_j)
+        np.put(p, color['rows_j'], p_j)
@@ -1,3 +1,4 @@
+import math
 import numpy as np
 
 class ParticleContact:
@@ -41,6 +42,9 @@ class ParticleContact:
             p_b' = p_b - (m_a/(m_a+m_b))*d*n
             where d is the penetration depth and n is the contact normal
     """
+    __slots__ = ('entities', 'restitution', 'normal', 'penetration',
+                 'entity_movement')
+
     def __init__(self, entities=None, restitution=None, normal=None,
                  penetration=None):
         self.entities = entities
@@ -118,23 +122,127 @@ class ParticleContact:
         # if all entities have infinite mass then there is no effect
         if total_inv_mass == 0: return
 
-        self.entity_movement[0] = self.entities[0].physics.inv_mass*\
-                                  self.penetration*self.normal/total_inv_mass
-        self.entities[0].physics.p += self.entity_movement[0]
+        # movements are written in place so pooled contacts allocate nothing
+        movement = self.entity_movement[0]
+        np.multiply(self.normal,
+                    self.entities[0].physics.inv_mass*self.penetration,
+                    out=movement)
+        movement /= total_inv_mass
+        self.entities[0].physics.p += movement
 
         if self.entities[1] is not None:
-            self.entity_movement[1] = self.entities[1].physics.inv_mass*\
-                                    self.penetration*self.normal/total_inv_mass
-            self.entities[1].physics.p -= self.entity_movement[1]
+            movement = self.entity_movement[1]
+            np.multiply(self.normal,
+                        self.entities[1].physics.inv_mass*self.penetration,
+                        out=movement)
+            movement /= total_inv_mass
+            self.entities[1].physics.p -= movement
+
+class ParticleContactPool:
+    """A pool of reusable ParticleContacts.  Contact generators take
+    contacts from the pool with take, a ParticleWorld resets it once they
+    have been resolved, so once the pool has grown to the largest number of
+    contacts in a step no more are created.
+    Variables:
+        contacts: List of every contact owned by the pool, the first n_used
+            are in use
+        n_used: Number of contacts taken since the last reset
+    Methods:
+        take: Returns a free contact filled with the given values
+        add: Copies a contact into the pool
+        reset: Frees every contact
+    """
+    def __init__(self):
+        self.contacts = []
+        self.n_used = 0
+
+    def take(self, first, second, restitution, penetration):
+        """Return a free contact between first and second, second None for
+        scenery.  The caller writes its normal in place."""
+        if self.n_used == len(self.contacts):
+            self.contacts.append(ParticleContact([None, None], 0,
+                                                 np.zeros(3), 0))
+        contact = self.contacts[self.n_used]
+        self.n_used += 1
+        contact.entities[0] = first
+        contact.entities[1] = second
+        contact.restitution = restitution
+        contact.penetration = penetration
+        return contact
+
+    def add(self, contact):
+        """Copy a contact created outside the pool into it."""
+        pooled = self.take(contact.entities[0], contact.entities[1],
+                           contact.restitution, contact.penetration)
+        pooled.normal[:] = contact.normal
+
+    def reset(self):
+        self.n_used = 0
+
+
+def new_contact(pool, first, second, restitution, penetration):
+    """Return a contact taken from pool, or a new one if pool is None.  Its
+    normal is a float array to be written in place by the caller."""
+    if pool is not None:
+        return pool.take(first, second, restitution, penetration)
+    return ParticleContact([first, second], restitution, np.zeros(3),
+                           penetration)
+
+
+def contacts_from_arrays(firsts, seconds, restitution, normals, penetration):
+    """Build many contacts at once.  The constructor is bypassed and every
+    contact's normal and entity movements are rows of one new array, which
+    is several times faster than creating them one by one.
+    Arguments:
+        firsts, seconds: Lists of the entities in each contact, seconds
+            holds None for contacts with the scenery
+        restitution: Coefficients of restitution, (n,)
+        normals: Contact normals, (n, 3)
+        penetration: Penetration depths, (n,)
+    Returns:
+        List of ParticleContacts
+    """
+    n = len(firsts)
+    normals = list(np.array(normals, dtype=float).reshape(n, 3))
+    movements = list(np.zeros((2*n, 3)))
+    restitution = np.asarray(restitution, dtype=float).tolist()
+    penetration = np.asarray(penetration, dtype=float).tolist()
+    contacts = []
+    for i in range(n):
+        contact = ParticleContact.__new__(ParticleContact)
+        contact.entities = [firsts[i], seconds[i]]
+        contact.restitution = restitution[i]
+        contact.normal = normals[i]
+        contact.penetration = penetration[i]
+        contact.entity_movement = movements[2*i:2*i + 2]
+        contacts.append(contact)
+    return contacts
+
 
 class ParticleContactGenerator:
-    """An interface for contact generators."""
+    """An interface for contact generators.  A generator whose
+    linked_pairs change increments its filter_version."""
+    filter_version = 0
+
     def gen_contacts(self):
         """Detects whether any contacts occur and returns a list of all the 
         contacts it detects.
         """
         pass
 
+    def fill_contacts(self, pool):
+        """Detects whether any contacts occur and takes a contact from the
+        ParticleContactPool pool for each.  Generators which only implement
+        gen_contacts have their contacts copied into the pool."""
+        for contact in self.gen_contacts():
+            pool.add(contact)
+
+    def linked_pairs(self):
+        """Returns a list of the pairs of particles the generator holds
+        together, which ParticleCollisionGenerator does not test against
+        each other."""
+        return []
+
 # currently unused
 class ParticleContactResolver:
     """Contact resolution algorithm for entity contacts.  One
@@ -210,33 +318,191 @@ class ParticleContactResolver:
 
 class ParticleCollisionGenerator(ParticleContactGenerator):
     """Detects all current particle collisions in the given list 
-    of particles.
+    of particles.  A pair is only tested if the collision_group of each
+    particle shares a bit with the collision_mask of the other and, with
+    exclude_linked, if no contact generator of world holds the pair
+    together, see ParticleContactGenerator.linked_pairs.
+
+    The filter is rebuilt only when the particle or generator lists change
+    length or the filter_version of the world, a particle or a generator
+    changes, call reset after replacing particles or generators in place.
+    Each row of the pair loop runs over ranges of particles which leave out
+    those linked to it, and rows are masked by their bits only if some bits
+    exclude a pair.
+    Variables:
+        world: ParticleWorld, or any object with a contact_generators list
+            and a filter_version, whose linked pairs are not tested, or
+            None
+        exclude_linked: If False linked pairs are tested
+        n_candidates: Number of particle pairs tested by the last call to
+            gen_contacts
+    Methods:
+        filter_arrays: Returns the collision groups, masks and linked
+            pairs of the particles
+        reset: Rebuild the filter before its next use
     """
-    def __init__(self, particles):
+    def __init__(self, particles, world=None, exclude_linked=True):
         self.particles = particles
-        
+        self.world = world
+        self.exclude_linked = exclude_linked
+        self.n_candidates = 0
+        # scratch buffer for the separation of each pair, in the dtype of
+        # the particles' positions so the pair loop does not mix dtypes
+        self._separation = np.zeros(3)
+        # state the filter was built from
+        self._version = None
+        self._n_particles = None
+        self._generators = None
+        self._n_generators = None
+        self._excluding = None
+        # filter arrays, whether bits exclude any pair, the indices j > i
+        # linked to each particle i, the ranges of j > i not linked to each
+        # particle i and the number of linked pairs
+        self._filter = None
+        self._masked = False
+        self._linked = {}
+        self._spans = []
+        self._n_linked = 0
+
+    def reset(self):
+        """Rebuild the pair filter before it is next used."""
+        self._version = None
+
+    def _filter_version(self, generators):
+        """Return the sum of the filter versions of the world, particles
+        and generators, which grows whenever any of them changes."""
+        version = 0 if self.world is None else self.world.filter_version
+        for particle in self.particles:
+            version += particle.filter_version
+        if generators is not None:
+            for generator in generators:
+                version += generator.filter_version
+        return version
+
+    def _update_filter(self):
+        """Rebuild the filter if anything it depends on has changed."""
+        world = self.world
+        generators = None if world is None else world.contact_generators
+        n_generators = 0 if generators is None else len(generators)
+        version = self._filter_version(generators)
+        if self._version == version and \
+                self._n_particles == len(self.particles) and \
+                self._generators is generators and \
+                self._n_generators == n_generators and \
+                self._excluding == self.exclude_linked:
+            return
+        particles = self.particles
+        n = len(particles)
+        groups = np.array([particle.collision_group
+                           for particle in particles], dtype=np.int64)
+        masks = np.array([particle.collision_mask
+                          for particle in particles], dtype=np.int64)
+        linked = {}
+        if self.exclude_linked and generators is not None:
+            index = {id(particle): i for i, particle in enumerate(particles)}
+            for generator in generators:
+                for first, second in generator.linked_pairs():
+                    i = index.get(id(first))
+                    j = index.get(id(second))
+                    if i is None or j is None or i == j:
+                        continue
+                    if i > j:
+                        i, j = j, i
+                    linked.setdefault(i, set()).add(j)
+        link_start = np.zeros(n + 1, dtype=np.int64)
+        link_to = []
+        spans = []
+        for i in range(n):
+            neighbours = sorted(linked.get(i, ()))
+            link_start[i + 1] = link_start[i] + len(neighbours)
+            link_to.extend(neighbours)
+            row = []
+            start = i + 1
+            for j in neighbours:
+                if j > start:
+                    row.append(range(start, j))
+                start = j + 1
+            if start < n:
+                row.append(range(start, n))
+            spans.append(tuple(row))
+        self._filter = (groups, masks, link_start,
+                        np.array(link_to, dtype=np.int64))
+        # every pair passes the bits if all groups share a bit in every mask
+        self._masked = n > 1 and not (np.bitwise_and.reduce(groups) &
+                                      np.bitwise_and.reduce(masks))
+        self._linked = linked
+        self._spans = spans
+        self._n_linked = len(link_to)
+        self._version = version
+        self._n_particles = n
+        self._generators = generators
+        self._n_generators = n_generators
+        self._excluding = self.exclude_linked
+
+    def filter_arrays(self):
+        """Return the collision groups and masks of the particles as int64
+        arrays, and the particles linked to each particle as int64 arrays
+        link_start, (n + 1,), and link_to: the indices j > i linked to i are
+        link_to[link_start[i]:link_start[i + 1]], sorted."""
+        self._update_filter()
+        return self._filter
+
+    def _candidates(self, i, groups, masks):
+        """Return the indices j > i of the particles whose bits allow a test
+        against particle i and which are not linked to it."""
+        ok = ((groups[i + 1:] & masks[i]) != 0) & \
+            ((masks[i + 1:] & groups[i]) != 0)
+        candidates = (np.flatnonzero(ok) + i + 1).tolist()
+        skip = self._linked.get(i)
+        if skip:
+            candidates = [j for j in candidates if j not in skip]
+        return candidates
+
     def gen_contacts(self):
-        n_particles = len(self.particles)
         contact_list = []
-        for i in range(n_particles - 1):
-            for j in range(i + 1, n_particles):
-                p1 = self.particles[i].physics.p
-                p2 = self.particles[j].physics.p
-
-                r1 = self.particles[i].graphics.r
-                r2 = self.particles[j].graphics.r
-
-                p_sep = p1 - p2
-
-                if np.abs(np.linalg.norm(p_sep)) < (r1 + r2):
-                    contact_pair = [self.particles[i], self.particles[j]]
-                    restitution = 1
-                    normal = p_sep / np.linalg.norm(p_sep)
-                    penetration = r1 + r2 - np.abs(np.linalg.norm(p_sep))
-                    contact_list.append(ParticleContact(contact_pair, 
-                                        restitution, normal, penetration))
+        self.fill_contacts(None, contact_list)
         return contact_list
 
+    def fill_contacts(self, pool, contact_list=None):
+        """Take a contact from pool for every colliding pair, or append new
+        contacts to contact_list if pool is None."""
+        n_particles = len(self.particles)
+        self._update_filter()
+        groups, masks = self._filter[:2]
+        masked = self._masked
+        spans = self._spans
+        if masked:
+            self.n_candidates = 0
+        else:
+            self.n_candidates = n_particles*(n_particles - 1)//2 - \
+                self._n_linked
+        p_sep = self._separation
+        if n_particles and p_sep.dtype != self.particles[0].physics.p.dtype:
+            p_sep = np.zeros(3, dtype=self.particles[0].physics.p.dtype)
+            self._separation = p_sep
+        for i in range(n_particles - 1):
+            particle_i = self.particles[i]
+            p1 = particle_i.physics.p
+            r1 = particle_i.graphics.r
+            if masked:
+                candidates = self._candidates(i, groups, masks)
+                self.n_candidates += len(candidates)
+                row = (candidates,)
+            else:
+                row = spans[i]
+            for candidates in row:
+                for j in candidates:
+                    particle_j = self.particles[j]
+                    np.subtract(p1, particle_j.physics.p, out=p_sep)
+                    r_sum = r1 + particle_j.graphics.r
+                    distance = math.sqrt(p_sep.dot(p_sep))
+                    if distance < r_sum:
+                        contact = new_contact(pool, particle_i, particle_j,
+                                              1, r_sum - distance)
+                        np.divide(p_sep, distance, out=contact.normal)
+                        if pool is None:
+                            contact_list.append(contact)
+
 class BoundaryCollisionGenerator(ParticleContactGenerator):
     """Detects all boundary wall collisions for the given list of
     particles and given x,y,z limits.
@@ -248,41 +514,46 @@ class BoundaryCollisionGenerator(ParticleContactGenerator):
         self.zlim = zlim
 
     def gen_contacts(self):
-        restitution = 1
         contact_list = []
+        self.fill_contacts(None, contact_list)
+        return contact_list
+
+    def fill_contacts(self, pool, contact_list=None):
+        """Take a contact from pool for every wall a particle touches, or
+        append new contacts to contact_list if pool is None."""
+        restitution = 1
+        x_low, x_high = self.xlim
+        y_low, y_high = self.ylim
+        z_low = self.zlim[0]
         for particle in self.particles:
-            contact_pair = [particle, None]
+            p = particle.physics.p
+            r = particle.graphics.r
             # x direction
-            if particle.physics.p[0] <= self.xlim[0] + particle.graphics.r:
-                normal = np.array([1, 0, 0])
-                penetration = self.xlim[0] + particle.graphics.r - \
-                              particle.physics.p[0]
-                contact_list.append(ParticleContact(contact_pair,
-                    restitution, normal, penetration))
-            elif particle.physics.p[0] >= self.xlim[1] - particle.graphics.r:
-                normal = np.array([-1, 0, 0])
-                penetration = self.xlim[1] - particle.graphics.r - \
-                              particle.physics.p[0]
-                contact_list.append(ParticleContact(contact_pair,
-                    restitution, normal, penetration))
+            if p[0] <= x_low + r:
+                self._wall(pool, contact_list, particle, restitution, 0, 1,
+                           x_low + r - p[0])
+            elif p[0] >= x_high - r:
+                self._wall(pool, contact_list, particle, restitution, 0, -1,
+                           x_high - r - p[0])
             # y direction
-            if particle.physics.p[1] <= self.ylim[0] + particle.graphics.r:
-                normal = np.array([0, 1, 0])
-                penetration = self.ylim[0] + particle.graphics.r - \
-                              particle.physics.p[1]
-                contact_list.append(ParticleContact(contact_pair,
-                    restitution, normal, penetration))
-            elif particle.physics.p[1] >= self.ylim[1] - particle.graphics.r:
-                normal = np.array([0, -1, 0])
-                penetration = self.ylim[1] - particle.graphics.r - \
-                              particle.physics.p[1]
-                contact_list.append(ParticleContact(contact_pair,
-                    restitution, normal, penetration))
+            if p[1] <= y_low + r:
+                self._wall(pool, contact_list, particle, restitution, 1, 1,
+                           y_low + r - p[1])
+            elif p[1] >= y_high - r:
+                self._wall(pool, contact_list, particle, restitution, 1, -1,
+                           y_high - r - p[1])
             # z direction
-            if particle.physics.p[2] <= self.zlim[0] + particle.graphics.r:
-                normal = np.array([0, 0, 1])
-                penetration = self.zlim[0] + particle.graphics.r - \
-                              particle.physics.p[2]
-                contact_list.append(ParticleContact(contact_pair,
-                    restitution, normal, penetration))
-        return contact_list
+            if p[2] <= z_low + r:
+                self._wall(pool, contact_list, particle, restitution, 2, 1,
+                           z_low + r - p[2])
+
+    @staticmethod
+    def _wall(pool, contact_list, particle, restitution, axis, sign,
+              penetration):
+        """Record a contact with a wall whose normal is sign along axis."""
+        contact = new_contact(pool, particle, None, restitution, penetration)
+        normal = contact.normal
+        normal.fill(0)
+        normal[axis] = sign
+        if pool is None:
+            contact_list.append(contact)
@@ -1,3 +1,4 @@
+import time
 import numpy as np
 
 class ParticleForceRegistry:
@@ -19,6 +20,8 @@ class ParticleForceRegistry:
             particle: A QuickParticle
             generator: a ForceGenerator which acts on particle
         """
+        __slots__ = ('particle', 'generator')
+
         def __init__(self, particle, generator):
             self.particle = particle
             self.generator = generator
@@ -42,8 +45,18 @@ class ParticleForceRegistry:
         """Clear registry of all registrations."""
         self.registry = []
 
-    def update_forces(self, duration):
-        """Update all forces in the registry using the time step 'duration'."""
+    def update_forces(self, duration, tracer=None):
+        """Update all forces in the registry using the time step 'duration'.
+        If a tracing.Tracer is given every force generator call is recorded
+        as a span."""
+        if tracer is not None:
+            clock = time.perf_counter
+            for entry in self.registry:
+                start = clock()
+                entry.generator.update_force(entry.particle, duration)
+                tracer.add(type(entry.generator).__name__, 'force_generator',
+                           start, clock())
+            return
         for entry in self.registry:
             entry.generator.update_force(entry.particle, duration)
 
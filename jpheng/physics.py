@@ -13,35 +13,53 @@ class PhysicsComponent:
         force_accum: Net force acting on component, float
         force_registry: list containing ForceGenerators which define the forces
             acting on the component
+    Methods:
+        set_dtype: Convert the component's vectors to another float type
+
+    The vectors are stored as dtype, float64 unless given, float32 halves
+    their memory at the cost of precision.
     """
+    __slots__ = ('p', 'v', 'a', 'inv_mass', 'g', 'damping', 'force_accum')
+
     def __init__(self, p, v, a, inv_mass, g = np.array([0,0,-20]),
-                 damping = 0.999):
+                 damping = 0.999, dtype=float):
         # set physical properties of component
-        self.p = np.array(p, dtype=float)  # position, numpy array, [x,y,z]
-        self.v = np.array(v, dtype=float)  # velocity, numpy array, [x,y,z]
-        self.a = np.array(a, dtype=float)  # acceleration, numpy array, [x,y,z]
+        self.p = np.array(p, dtype=dtype)  # position, numpy array, [x,y,z]
+        self.v = np.array(v, dtype=dtype)  # velocity, numpy array, [x,y,z]
+        self.a = np.array(a, dtype=dtype)  # acceleration, numpy array, [x,y,z]
         self.inv_mass = inv_mass  # inverse mass, float
-        self.g = np.array(g, dtype=float)  # accel. due to gravity, [x,y,z]
+        self.g = np.array(g, dtype=dtype)  # accel. due to gravity, [x,y,z]
         self.damping = damping  # damping constant, float, see step function
         # store values relating to forces
-        self.force_accum = np.zeros(3)  # stores net force acting on the
-                                        # component
+        self.force_accum = np.zeros(3, dtype=dtype)  # stores net force
+                                                     # acting on the component
+
+    def set_dtype(self, dtype):
+        """Store the component's vectors as dtype, e.g. np.float32."""
+        for name in ('p', 'v', 'a', 'g', 'force_accum'):
+            setattr(self, name, getattr(self, name).astype(dtype))
 
     def clear_force_accumulator(self):
         """Clear all forces from the accumulator, gravity always acts and is
-        not cleared."""
-        self.force_accum = self.g/self.inv_mass
+        not cleared.  Particles of infinite mass, inv_mass 0, feel no
+        gravity."""
+        if self.inv_mass == 0:
+            self.force_accum.fill(0)
+            return
+        np.divide(self.g, self.inv_mass, out=self.force_accum)
 
     def step(self, dt):
         """Calculate the new position, velocity and acceleration of the
         particle based on its acceleration.  Uses simple Euler integration
-        method."""
+        method.  The state arrays are updated in place rather than
+        replaced."""
         # update position based on last step's velocity and acceleration
         self.p += self.v*dt + 0.5*self.a*dt**2
         # update velocity based on last step's acceleration, reduce previous
         # step's velocity by damping**dt to avoid numerical instability
-        self.v = self.v*(self.damping**dt) + self.a*dt
+        self.v *= self.damping**dt
+        self.v += self.a*dt
         # set current acceleration by N2L
-        self.a = self.force_accum*self.inv_mass
+        np.multiply(self.force_accum, self.inv_mass, out=self.a)
         # clear force accumulator
         self.clear_force_accumulator()
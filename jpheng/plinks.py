@@ -8,12 +8,22 @@ class ParticleLink(pcontacts.ParticleContactGenerator):
         particles: list of particles affected by the link
     Methods:
         current_length: Returns the current length of the link.
-        fill_contact: Fills the given contact with the information necessary to
-            keep the link from violating its constraint.
+        linked_pairs: Returns the pair of particles joined by the link
+        fill_contacts: Takes a contact from a ParticleContactPool with the
+            information necessary to keep the link from violating its
+            constraint.
     """
     def __init__(self, particles):
         self.particles = particles
 
+    def gen_contacts(self):
+        contact_list = []
+        self.fill_contacts(None, contact_list)
+        return contact_list
+
+    def linked_pairs(self):
+        return [self.particles]
+
     def current_length(self):
         separation = self.particles[0].physics.p - self.particles[1].physics.p
         separation = np.linalg.norm(separation)
@@ -31,19 +41,22 @@ class ParticleCable(ParticleLink):
         self.max_length = max_length
         self.restitution = restitution
 
-    def gen_contacts(self):
+    def fill_contacts(self, pool, contact_list=None):
+        """Take a contact from pool if the cable is overextended, or append
+        a new one to contact_list if pool is None."""
         # get current length
         length = self.current_length()
         # check if cable is overextended
         if length < self.max_length:
-            return []
-        contact_pair = [self.particles[0], self.particles[1]]
-        p_sep = self.particles[1].physics.p - self.particles[0].physics.p
-        normal = p_sep/np.linalg.norm(p_sep)
-        penetration = length - self.max_length
-        contact = pcontacts.ParticleContact(contact_pair,
-                                  self.restitution, normal, penetration)
-        return [contact]
+            return
+        contact = pcontacts.new_contact(pool, self.particles[0],
+                                        self.particles[1], self.restitution,
+                                        length - self.max_length)
+        np.subtract(self.particles[1].physics.p, self.particles[0].physics.p,
+                    out=contact.normal)
+        contact.normal /= length
+        if pool is None:
+            contact_list.append(contact)
 
 
 class ParticleRod(ParticleLink):
@@ -56,19 +69,241 @@ class ParticleRod(ParticleLink):
         super(ParticleRod, self).__init__(particles)
         self.length = length
 
-    def gen_contacts(self):
+    def fill_contacts(self, pool, contact_list=None):
+        """Take a contact from pool if the rod is not at its length, or
+        append a new one to contact_list if pool is None."""
         current_length = self.current_length()
         if current_length == self.length:
-            return []
-        contact_pair = [self.particles[0], self.particles[1]]
-        p_sep = self.particles[1].physics.p - self.particles[0].physics.p
-        normal = p_sep/np.linalg.norm(p_sep)
+            return
         if current_length > self.length:
             penetration = current_length - self.length
         else:
-            normal = -1*normal
             penetration = self.length - current_length
         restitution = 0
-        contact = pcontacts.ParticleContact(contact_pair,
-                                            restitution, normal, penetration)
-        return [contact]
+        contact = pcontacts.new_contact(pool, self.particles[0],
+                                        self.particles[1], restitution,
+                                        penetration)
+        normal = contact.normal
+        np.subtract(self.particles[1].physics.p, self.particles[0].physics.p,
+                    out=normal)
+        normal /= current_length
+        if current_length < self.length:
+            np.negative(normal, out=normal)
+        if pool is None:
+            contact_list.append(contact)
+
+
+class ParticleLinkSet(pcontacts.ParticleContactGenerator):
+    """Holds many rods and cables as arrays and checks all of them at once,
+    for ropes and chains of many links.  Each link joins two of the set's
+    particles, a cable generates a contact when it reaches its length and a
+    rod whenever it is not at its length, as ParticleCable and ParticleRod
+    do, and contacts are generated in the order the links were added.
+    Variables:
+        particles: List of the particles joined by the links, each once
+        ends: Numpy int array, (n_links, 2), indices into particles of the
+            two ends of each link
+        lengths: Numpy float array, length of each rod and maximum length
+            of each cable
+        restitution: Numpy float array, restitution of each link's
+            contacts, 0 for rods
+        cables: Numpy bool array, True for cables and False for rods
+        filter_version: Incremented whenever links are added
+    Methods:
+        from_links: Returns a link set of ParticleRods and ParticleCables
+        from_arrays: Returns a link set described by arrays
+        add_rod: Add a rod between a pair of particles
+        add_cable: Add a cable between a pair of particles
+        add_link: Add the rod or cable of a ParticleRod or ParticleCable
+        linked_pairs: Returns the pairs of particles joined by the links
+        current_lengths: Returns the current length of every link
+    """
+    def __init__(self):
+        self.particles = []
+        self._index = {}
+        self._links = []
+        self._arrays = None
+        self._scratch = None
+        self.filter_version = 0
+
+    @classmethod
+    def from_links(cls, links):
+        """Return a ParticleLinkSet holding a list of ParticleRods and
+        ParticleCables."""
+        link_set = cls()
+        for link in links:
+            link_set.add_link(link)
+        return link_set
+
+    @classmethod
+    def from_arrays(cls, particles, ends, lengths, restitution, cables):
+        """Return a ParticleLinkSet of the links described by arrays, see
+        the class docstring.  ends index into particles, in which no particle
+        may appear twice."""
+        link_set = cls()
+        link_set.particles = list(particles)
+        link_set._index = {id(particle): i
+                           for i, particle in enumerate(link_set.particles)}
+        ends = np.asarray(ends, dtype=np.int64).reshape(-1, 2)
+        link_set._links = list(zip(
+            ends[:, 0].tolist(), ends[:, 1].tolist(),
+            np.asarray(lengths, dtype=float).tolist(),
+            np.asarray(restitution, dtype=float).tolist(),
+            np.asarray(cables, dtype=bool).tolist()))
+        return link_set
+
+    def __len__(self):
+        return len(self._links)
+
+    def _particle_index(self, particle):
+        key = id(particle)
+        if key not in self._index:
+            self._index[key] = len(self.particles)
+            self.particles.append(particle)
+        return self._index[key]
+
+    def _add(self, pair, length, restitution, cable):
+        self._links.append((self._particle_index(pair[0]),
+                            self._particle_index(pair[1]), length,
+                            restitution, cable))
+        self._arrays = None
+        self.filter_version += 1
+
+    def add_rod(self, pair, length):
+        """Add a rod of the given length between a pair of particles."""
+        self._add(pair, length, 0, False)
+
+    def add_cable(self, pair, max_length, restitution):
+        """Add a cable between a pair of particles."""
+        self._add(pair, max_length, restitution, True)
+
+    def add_link(self, link):
+        """Add the rod or cable described by a ParticleRod or
+        ParticleCable."""
+        if isinstance(link, ParticleCable):
+            self.add_cable(link.particles, link.max_length, link.restitution)
+        elif isinstance(link, ParticleRod):
+            self.add_rod(link.particles, link.length)
+        else:
+            raise TypeError('cannot add {} to a link set'.format(
+                type(link).__name__))
+
+    def _get_arrays(self):
+        """Return the link arrays, rebuilt after links are added together
+        with the scratch buffers fill_contacts writes into."""
+        if self._arrays is None:
+            links = self._links
+            self._arrays = (
+                np.array([link[:2] for link in links],
+                         dtype=np.int64).reshape(-1, 2),
+                np.array([link[2] for link in links], dtype=float),
+                np.array([link[3] for link in links], dtype=float),
+                np.array([link[4] for link in links], dtype=bool))
+            ends = self._arrays[0]
+            n_links = len(links)
+            # positions of the particles, the two ends of each link and
+            # the separation, length, stretch and violation of each link
+            self._scratch = {
+                'positions': np.zeros((len(self.particles), 3)),
+                'first': np.ascontiguousarray(ends[:, 0]),
+                'second': np.ascontiguousarray(ends[:, 1]),
+                'first_p': np.zeros((n_links, 3)),
+                'separation': np.zeros((n_links, 3)),
+                'length': np.zeros(n_links),
+                'stretch': np.zeros(n_links),
+                'stretched': np.zeros(n_links, dtype=bool),
+                'violated': np.zeros(n_links, dtype=bool)}
+        return self._arrays
+
+    @property
+    def ends(self):
+        return self._get_arrays()[0]
+
+    @property
+    def lengths(self):
+        return self._get_arrays()[1]
+
+    @property
+    def restitution(self):
+        return self._get_arrays()[2]
+
+    @property
+    def cables(self):
+        return self._get_arrays()[3]
+
+    def gen_contacts(self):
+        contact_list = []
+        self.fill_contacts(None, contact_list)
+        return contact_list
+
+    def linked_pairs(self):
+        particles = self.particles
+        return [(particles[i], particles[j]) for i, j, length, restitution,
+                cable in self._links]
+
+    def _separations(self):
+        """Return the vector from the first to the second end of every link
+        and its length, in scratch buffers overwritten at the next call."""
+        self._get_arrays()
+        scratch = self._scratch
+        positions = scratch['positions']
+        for k, particle in enumerate(self.particles):
+            positions[k] = particle.physics.p
+        separation = scratch['separation']
+        first_p = scratch['first_p']
+        length = scratch['length']
+        # take only buffers out with mode='raise', the ends are valid
+        np.take(positions, scratch['second'], axis=0, out=separation,
+                mode='clip')
+        np.take(positions, scratch['first'], axis=0, out=first_p,
+                mode='clip')
+        np.subtract(separation, first_p, out=separation)
+        np.einsum('ij,ij->i', separation, separation, out=length)
+        np.sqrt(length, out=length)
+        return separation, length
+
+    def current_lengths(self):
+        """Return the current length of every link."""
+        return self._separations()[1].copy()
+
+    def fill_contacts(self, pool, contact_list=None):
+        """Take a contact from pool for every violated link, or append new
+        contacts to contact_list if pool is None."""
+        if not self._links:
+            return
+        ends, lengths, restitution, cables = self._get_arrays()
+        separation, length = self._separations()
+        scratch = self._scratch
+        stretch = np.subtract(length, lengths, out=scratch['stretch'])
+        # cables only pull, rods also push when compressed
+        violated = np.not_equal(length, lengths, out=scratch['violated'])
+        np.greater_equal(length, lengths, out=scratch['stretched'])
+        np.copyto(violated, scratch['stretched'], where=cables)
+        if not violated.any():
+            return
+        particles = self.particles
+        if pool is None:
+            hits = np.flatnonzero(violated)
+            length = length[hits]
+            normals = separation[hits]/length[:, np.newaxis]
+            normals[stretch[hits] < 0] *= -1
+            ends = ends[hits].tolist()
+            contact_list.extend(pcontacts.contacts_from_arrays(
+                [particles[i] for i, j in ends],
+                [particles[j] for i, j in ends], restitution[hits],
+                normals, np.abs(stretch[hits])))
+            return
+        first = scratch['first']
+        second = scratch['second']
+        # loop over the mask, finding the hits would allocate an index array
+        for k, hit in enumerate(violated):
+            if not hit:
+                continue
+            link_stretch = stretch.item(k)
+            contact = pool.take(particles[first.item(k)],
+                                particles[second.item(k)],
+                                restitution.item(k), abs(link_stretch))
+            normal = contact.normal
+            np.divide(separation[k], length.item(k), out=normal)
+            if link_stretch < 0:
+                np.negative(normal, out=normal)
@@ -0,0 +1,89 @@
+import time
+import numpy as np
+
+
+class StepProfiler:
+    """Records the cost of every ParticleWorld step into a fixed size ring
+    buffer, keeping the most recent capacity steps.
+
+    Each record holds the time in seconds of the five phases of a step,
+    link_projection being zero without a pbd.LinkSolver, and of the whole
+    step, along with the number of particles, force
+    registrations, candidate collision pairs and contacts in that step.
+    Variables:
+        PHASES: Names of the timed phases
+        COUNTS: Names of the recorded counts
+        FIELDS: Names of every column of a record
+        capacity: Maximum number of steps kept
+        clock: Function returning a time in seconds the phases are timed
+            with, time.perf_counter for wall time or time.process_time for
+            CPU time, which other processes disturb far less.  Steps of a
+            world with a tracer are timed with time.perf_counter, the
+            tracer's clock
+        records: Numpy array, shape (capacity, len(FIELDS)), ring buffer of
+            records
+        n_records: Total number of steps recorded
+    Methods:
+        record: Add a record for one step
+        history: Returns the kept records in the order they were recorded
+        summary: Returns the mean, median and 99th percentile of each field
+        report: Returns the summary as a printable table
+        clear: Discard all records
+    """
+    PHASES = ('forces', 'integration', 'contact_generation',
+              'contact_resolution', 'link_projection', 'step')
+    COUNTS = ('particles', 'registrations', 'candidate_pairs', 'contacts')
+    FIELDS = PHASES + COUNTS
+
+    def __init__(self, capacity=1024, clock=time.perf_counter):
+        self.capacity = capacity
+        self.clock = clock
+        self.records = np.zeros((capacity, len(self.FIELDS)))
+        self.n_records = 0
+
+    def record(self, values):
+        """Add a record, a sequence of values in the order of FIELDS."""
+        self.records[self.n_records % self.capacity] = values
+        self.n_records += 1
+
+    def history(self):
+        """Return the kept records, oldest first."""
+        if self.n_records <= self.capacity:
+            return self.records[:self.n_records]
+        start = self.n_records % self.capacity
+        return np.roll(self.records, -start, axis=0)
+
+    def summary(self):
+        """Return a dictionary mapping each field to a dictionary of its
+        mean, median (p50) and 99th percentile (p99) over the kept
+        records."""
+        history = self.history()
+        summary = {}
+        for i, field in enumerate(self.FIELDS):
+            if len(history) == 0:
+                summary[field] = {'mean': 0.0, 'p50': 0.0, 'p99': 0.0}
+                continue
+            column = history[:, i]
+            p50, p99 = np.percentile(column, [50, 99])
+            summary[field] = {'mean': float(np.mean(column)),
+                              'p50': float(p50), 'p99': float(p99)}
+        return summary
+
+    def report(self):
+        """Return the summary as a table, times in milliseconds."""
+        summary = self.summary()
+        lines = ['{:<26}{:>10}{:>10}{:>10}'.format('', 'mean', 'p50', 'p99')]
+        for field in self.PHASES:
+            stats = summary[field]
+            lines.append('{:<26}{:>10.3f}{:>10.3f}{:>10.3f}'.format(
+                field + ' (ms)', 1000*stats['mean'], 1000*stats['p50'],
+                1000*stats['p99']))
+        for field in self.COUNTS:
+            stats = summary[field]
+            lines.append('{:<26}{:>10.1f}{:>10.1f}{:>10.1f}'.format(
+                field, stats['mean'], stats['p50'], stats['p99']))
+        return '\n'.join(lines)
+
+    def clear(self):
+        """Discard all records."""
+        self.n_records = 0
@@ -1,51 +1,308 @@
+import time
+import warnings
 import numpy as np
 import jpheng.pfgen as pfgen
 import jpheng.pcontacts as pcontacts
+import jpheng.profiler as profiler
 
 class ParticleWorld:
     """Keeps track of a set of particles and provides the means to update
-    them all."""
-    def __init__(self, xlim, ylim, zlim):
+    them all.  If profile is True, or a StepProfiler is assigned to
+    profiler, the cost of every step is recorded in the profiler.  If a
+    tracing.Tracer is given as tracer, or assigned later, each step and its
+    phases, contact generators and force generators are recorded as trace
+    spans.  If a recording.TrajectoryRecorder is assigned to recorder the
+    state of the world is recorded after every step.
+
+    If deterministic is True contacts are resolved in a canonical order,
+    sorted by the indices of the particles involved, so results do not
+    depend on the order contact generators produce contacts in.  checksum
+    returns a hash of the physics state which can be compared between runs
+    step by step.  rng is the world's own random number generator, seeded
+    with seed, or 0 if deterministic and no seed is given.  Anything
+    random added to the world while it runs, such as new particles, should
+    draw from it so runs repeat.
+
+    If preallocate is True, or a pcontacts.ParticleContactPool is assigned
+    to contact_pool, contacts are taken from the pool instead of being
+    created every step.  Once the pool has grown to the most contacts seen
+    in a step, stepping creates no objects which outlive a single
+    calculation, so garbage collection is never triggered by the world.
+
+    Particle state is stored as dtype, add_particle converts particles of
+    another float type.  np.float32 halves the memory of every vector and
+    matches the precision the renderer draws with.
+
+    backend selects how contacts are generated and resolved, 'python' with
+    the contact generators' objects or 'numba' with the compiled
+    kernels.ContactSolver.  Without numba installed 'numba' warns and falls
+    back to 'python'.
+
+    Particles are only tested for collision with each other as their
+    collision groups and masks allow, and never if a rod, cable or link set
+    of the world joins them, see pcontacts.ParticleCollisionGenerator.
+    filter_version counts the particles added and removed, which the
+    world's collision generator rebuilds its pair filter after.
+
+    If link_iterations is given, or a pbd.LinkSolver is assigned to
+    link_solver, rods, cables and link sets generate no contacts and are
+    instead projected on the particles' positions for link_iterations
+    sweeps after the other contacts are resolved, with link_compliance the
+    inverse stiffness of the links.  This keeps long chains and cloth at
+    their lengths with one step per frame."""
+    BACKENDS = ('python', 'numba')
+
+    def __init__(self, xlim, ylim, zlim, profile=False, tracer=None,
+                 deterministic=False, seed=None, preallocate=False,
+                 dtype=np.float64, backend='python', link_iterations=None,
+                 link_compliance=0):
         self.particle_list = []
+        self.filter_version = 0
+        self.dtype = np.dtype(dtype)
         self.force_registry = pfgen.ParticleForceRegistry()
         self.contact_generators = []
         self.contacts = []
         self.xlim = xlim
         self.ylim = ylim
         self.zlim = zlim
+        self.profiler = None
+        if profile:
+            self.profiler = profiler.StepProfiler()
+        self.tracer = tracer
+        self.recorder = None
+        # number of contacts generated in the last step
+        self.n_contacts = 0
+        self.contact_solver = None
+        self.set_backend(backend)
+        self.link_solver = None
+        if link_iterations is not None:
+            import jpheng.pbd as pbd
+            self.link_solver = pbd.LinkSolver(link_iterations,
+                                              link_compliance)
+        self.contact_pool = None
+        if preallocate:
+            self.contact_pool = pcontacts.ParticleContactPool()
+        self.deterministic = deterministic
+        if deterministic and seed is None:
+            seed = 0
+        # random number generator for anything stepped with the world
+        self.rng = np.random.RandomState(seed)
         # create contact resolver
         # max_iter = 100
         # self.contact_resolver = contacts.ParticleContactResolver(max_iter)
         # enable collisions for all particles
         self.contact_generators.append(pcontacts.ParticleCollisionGenerator(
-            self.particle_list))
+            self.particle_list, self))
         self.contact_generators.append(pcontacts.BoundaryCollisionGenerator(
             self.particle_list, self.xlim, self.ylim, self.zlim))
 
+    def set_backend(self, backend):
+        """Select the contact backend, see the class docstring."""
+        if backend not in self.BACKENDS:
+            raise ValueError('unknown backend {}'.format(backend))
+        self.contact_solver = None
+        self.backend = 'python'
+        if backend == 'numba':
+            import jpheng.kernels as kernels
+            if kernels.numba is None:
+                warnings.warn('numba is not installed, using the python '
+                              'backend')
+                return
+            self.contact_solver = kernels.ContactSolver()
+            self.backend = 'numba'
+
     def step(self, dt):
-        # update all forces
-        self.force_registry.update_forces(dt)
-        # step all particles
+        if self.profiler is not None or self.tracer is not None:
+            self.instrumented_step(dt)
+        else:
+            # update all forces
+            self.force_registry.update_forces(dt)
+            # step all particles
+            self.integrate(dt)
+            # generate contacts
+            self.generate_contacts()
+            # self.boundary_check(self.particle_list)
+            # process contacts
+            self.resolve_contacts(dt)
+            if self.link_solver is not None:
+                self.link_solver.project(self, dt)
+        if self.recorder is not None:
+            self.recorder.record(self)
+
+    def instrumented_step(self, dt):
+        """Step the world, recording the time taken by each phase of the
+        step in the profiler and tracer."""
+        tracer = self.tracer
+        clock = time.perf_counter
+        if tracer is None and self.profiler is not None:
+            clock = self.profiler.clock
+        t0 = clock()
+        self.force_registry.update_forces(dt, tracer)
+        t1 = clock()
+        self.integrate(dt)
+        t2 = clock()
+        self.generate_contacts()
+        t3 = clock()
+        n_contacts = self.count_contacts()
+        self.resolve_contacts(dt)
+        t_links = clock()
+        if self.link_solver is not None:
+            self.link_solver.project(self, dt)
+        t4 = clock()
+        n_particles = len(self.particle_list)
+        n_registrations = len(self.force_registry.registry)
+        n_candidates = sum(getattr(generator, 'n_candidates', 0)
+                           for generator in self.contact_generators)
+        if self.profiler is not None:
+            self.profiler.record((t1 - t0, t2 - t1, t3 - t2, t_links - t3,
+                                  t4 - t_links, t4 - t0, n_particles,
+                                  n_registrations, n_candidates, n_contacts))
+        if tracer is not None:
+            tracer.add('ParticleWorld.step', 'physics', t0, t4,
+                       {'particles': n_particles,
+                        'registrations': n_registrations,
+                        'candidate_pairs': n_candidates,
+                        'contacts': n_contacts})
+            tracer.add('forces', 'physics', t0, t1)
+            tracer.add('integration', 'physics', t1, t2)
+            tracer.add('contact_generation', 'physics', t2, t3)
+            tracer.add('contact_resolution', 'physics', t3, t_links)
+            if self.link_solver is not None:
+                tracer.add('link_projection', 'physics', t_links, t4,
+                           {'links': self.link_solver.n_links,
+                            'violated': self.link_solver.n_violated})
+
+    def integrate(self, dt):
+        """Step all particles."""
         for particle in self.particle_list:
             particle.step(dt)
-        # generate contacts
-        self.generate_contacts()
-        # self.boundary_check(self.particle_list)
-        # process contacts
+
+    def resolve_contacts(self, dt):
+        """Resolve every contact in self.contacts, or in the contact pool,
+        then clear them."""
+        if self.contact_solver is not None:
+            self.n_contacts = self.contact_solver.n_contacts
+            self.contact_solver.resolve(dt)
+            return
+        pool = self.contact_pool
+        if pool is not None:
+            self.n_contacts = pool.n_used
+            contacts = pool.contacts
+            for i in range(pool.n_used):
+                contacts[i].resolve(dt)
+            pool.reset()
+            return
+        self.n_contacts = len(self.contacts)
         for contact in self.contacts:
             contact.resolve(dt)
         self.contacts = []
 
+    def count_contacts(self):
+        """Return the number of contacts waiting to be resolved."""
+        if self.contact_solver is not None:
+            return self.contact_solver.n_contacts
+        if self.contact_pool is not None:
+            return self.contact_pool.n_used
+        return len(self.contacts)
+
     def add_particle(self, particle):
-        """Add particle to scene."""
+        """Add particle to scene, converting its state to the world's
+        dtype."""
+        if particle.physics.p.dtype != self.dtype:
+            particle.physics.set_dtype(self.dtype)
         self.particle_list.append(particle)
+        self.filter_version += 1
 
     def remove_particle(self, particle):
         """Remove particle from scene."""
         self.particle_list.remove(particle)
+        self.filter_version += 1
 
     def generate_contacts(self):
         """Generate all current contacts from the contact generators and
         append self.contacts with the results."""
-        for generator in self.contact_generators:
-            self.contacts = self.contacts + generator.gen_contacts()
+        if self.contact_solver is not None:
+            self.solver_generate_contacts()
+            return
+        if self.tracer is not None:
+            self.traced_generate_contacts()
+        elif self.contact_pool is not None:
+            for generator in self.active_generators():
+                generator.fill_contacts(self.contact_pool)
+        else:
+            for generator in self.active_generators():
+                self.contacts = self.contacts + generator.gen_contacts()
+        if self.deterministic:
+            self.order_contacts()
+
+    def solver_generate_contacts(self):
+        """generate_contacts with the contact solver, recording one span
+        for all generators if tracing."""
+        start = time.perf_counter()
+        self.contact_solver.generate(self, self.active_generators())
+        if self.deterministic:
+            self.contact_solver.order()
+        if self.tracer is not None:
+            self.tracer.add('ContactSolver', 'contact_generator', start,
+                            time.perf_counter(),
+                            {'contacts': self.contact_solver.n_contacts})
+
+    def active_generators(self):
+        """Return the contact generators which generate contacts, all of
+        them unless links are projected by the link solver."""
+        if self.link_solver is None:
+            return self.contact_generators
+        return self.link_solver.contact_generators(self.contact_generators)
+
+    def order_contacts(self):
+        """Sort self.contacts by the indices of the particles in each
+        contact, boundary contacts first, then by normal and penetration,
+        so the order does not depend on the order of the generators."""
+        index = {id(particle): i
+                 for i, particle in enumerate(self.particle_list)}
+
+        def key(contact):
+            first, second = contact.entities
+            return (index[id(first)],
+                    -1 if second is None else index[id(second)],
+                    tuple(contact.normal.tolist()), contact.penetration)
+
+        pool = self.contact_pool
+        if pool is not None:
+            pool.contacts[:pool.n_used] = sorted(
+                pool.contacts[:pool.n_used], key=key)
+            return
+        self.contacts.sort(key=key)
+
+    def checksum(self):
+        """Return a hex digest of the position, velocity, acceleration and
+        force accumulator of every particle.  Equal checksums mean
+        bit-for-bit equal states."""
+        return state_checksum(self.particle_list)
+
+    def traced_generate_contacts(self):
+        """generate_contacts, recording a span for every generator."""
+        clock = time.perf_counter
+        pool = self.contact_pool
+        for generator in self.active_generators():
+            start = clock()
+            if pool is not None:
+                n_used = pool.n_used
+                generator.fill_contacts(pool)
+                n_contacts = pool.n_used - n_used
+            else:
+                contacts = generator.gen_contacts()
+                n_contacts = len(contacts)
+                self.contacts = self.contacts + contacts
+            self.tracer.add(type(generator).__name__, 'contact_generator',
+                            start, clock(), {'contacts': n_contacts})
+
+
+def state_checksum(particles):
+    """Return a hex digest of the physics state of a list of particles."""
+    import hashlib
+    state = np.empty((len(particles), 4, 3))
+    for i, particle in enumerate(particles):
+        physics = particle.physics
+        state[i] = (physics.p, physics.v, physics.a, physics.force_accum)
+    return hashlib.blake2b(state.tobytes(), digest_size=8).hexdigest()
@@ -0,0 +1,287 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+# Trajectory recordings.  A recording is a directory holding header.json and
+# one flat binary file per recorded field, each a C ordered array with one
+# row per step, so a Trajectory can memory map them and slice any range of
+# steps without copying.  Steps are collected in memory in chunks and each
+# full chunk is appended to the files by a background thread, so recording
+# never waits for the disk.
+
+FORMAT_VERSION = 1
+
+HEADER = 'header.json'
+
+
+class TrajectoryRecorder:
+    """Records the state of a ParticleWorld after every step.  Assign it to
+    world.recorder, or call record after each step.
+
+    Every step stores the positions of up to capacity particles and the
+    number of particles, optionally their velocities and the number of
+    contacts generated in the step.  Rows beyond the number of particles
+    are NaN.  The radius and color of each row are taken from the first
+    particle recorded in it.
+    Variables:
+        path: Directory the recording is written to
+        dt: Time step of the recorded world, seconds
+        capacity: Maximum number of particles recorded per step
+        chunk_steps: Number of steps collected before they are written
+        dtype: Numpy float type positions and velocities are stored as
+        velocities: If True velocities are recorded
+        contacts: If True contact counts are recorded
+        n_steps: Number of steps recorded
+        limits: x, y and z limits of the world, taken from the first step
+    Methods:
+        record: Record the current state of a world
+        flush: Wait until every recorded step has been written
+        close: Write any remaining steps and stop the writer thread
+    """
+    def __init__(self, path, dt, capacity, chunk_steps=256,
+                 dtype=np.float64, velocities=False, contacts=False):
+        self.path = path
+        self.dt = dt
+        self.capacity = capacity
+        self.chunk_steps = chunk_steps
+        self.dtype = np.dtype(dtype)
+        self.velocities = velocities
+        self.contacts = contacts
+        self.n_steps = 0
+        self.limits = None
+        self.fields = {'positions': (self.dtype, (capacity, 3)),
+                       'counts': (np.dtype(np.int64), ())}
+        if velocities:
+            self.fields['velocities'] = (self.dtype, (capacity, 3))
+        if contacts:
+            self.fields['contacts'] = (np.dtype(np.int64), ())
+        self.radii = np.zeros(capacity)
+        self.colors = np.zeros((capacity, 3), dtype=np.uint8)
+        self._filled = 0
+        self._written = 0
+        os.makedirs(path, exist_ok=True)
+        self._files = {name: open(os.path.join(path, name + '.bin'), 'wb')
+                       for name in self.fields}
+        # chunks waiting to be written and chunks free for reuse
+        self._pending = queue.Queue()
+        self._free = queue.Queue()
+        self._chunk = self._new_chunk()
+        self._row = 0
+        self._error = None
+        self._writer = threading.Thread(target=self._write_chunks,
+                                        daemon=True)
+        self._writer.start()
+        self._write_header()
+
+    def _new_chunk(self):
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            return {name: np.empty((self.chunk_steps,) + shape, dtype)
+                    for name, (dtype, shape) in self.fields.items()}
+
+    def record(self, world):
+        """Copy the state of world into the current chunk, handing the chunk
+        to the writer thread once it is full."""
+        if self._error is not None:
+            raise self._error
+        particles = world.particle_list
+        n = len(particles)
+        if n > self.capacity:
+            raise ValueError('{} particles exceed the recorder capacity of '
+                             '{}'.format(n, self.capacity))
+        if self.limits is None:
+            self.limits = [list(world.xlim), list(world.ylim),
+                           list(world.zlim)]
+        row = self._row
+        chunk = self._chunk
+        positions = chunk['positions'][row]
+        positions[n:] = np.nan
+        if n:
+            positions[:n] = [particle.physics.p for particle in particles]
+        if self.velocities:
+            velocities = chunk['velocities'][row]
+            velocities[n:] = np.nan
+            if n:
+                velocities[:n] = [particle.physics.v
+                                  for particle in particles]
+        if self.contacts:
+            chunk['contacts'][row] = world.n_contacts
+        chunk['counts'][row] = n
+        if n > self._filled:
+            for i in range(self._filled, n):
+                self.radii[i] = particles[i].graphics.r
+                self.colors[i] = particles[i].graphics.color
+            self._filled = n
+        self.n_steps += 1
+        self._row += 1
+        if self._row == self.chunk_steps:
+            self._pending.put((self._chunk, self._row))
+            self._chunk = self._new_chunk()
+            self._row = 0
+
+    def _write_chunks(self):
+        """Writer thread, appends chunks to the files until given None."""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._pending.task_done()
+                return
+            chunk, rows = item
+            try:
+                for name, f in self._files.items():
+                    f.write(chunk[name][:rows])
+                    f.flush()
+                self._written += rows
+                self._write_header()
+            except Exception as error:
+                self._error = error
+            self._free.put(chunk)
+            self._pending.task_done()
+
+    def _write_header(self):
+        header = {'version': FORMAT_VERSION,
+                  'dt': self.dt,
+                  'capacity': self.capacity,
+                  'n_steps': self._written,
+                  'fields': {name: [dtype.str, list(shape)]
+                             for name, (dtype, shape) in self.fields.items()},
+                  'limits': self.limits,
+                  'radii': self.radii.tolist(),
+                  'colors': self.colors.tolist()}
+        temporary = os.path.join(self.path, HEADER + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(header, f)
+        os.replace(temporary, os.path.join(self.path, HEADER))
+
+    def flush(self):
+        """Hand any partly filled chunk to the writer thread and wait until
+        every recorded step is on disk."""
+        if self._row:
+            self._pending.put((self._chunk, self._row))
+            self._chunk = self._new_chunk()
+            self._row = 0
+        self._pending.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Write all recorded steps, stop the writer thread and close the
+        files."""
+        if self._writer is None:
+            return
+        self.flush()
+        self._pending.put(None)
+        self._writer.join()
+        self._writer = None
+        for f in self._files.values():
+            f.close()
+
+
+class Trajectory:
+    """Read only view of a recording made by TrajectoryRecorder.  The
+    fields are memory mapped, slicing them reads only the steps needed and
+    makes no copies.
+    Variables:
+        dt: Time step of the recording, seconds
+        n_steps: Number of recorded steps
+        capacity: Number of particle rows per step
+        positions: Array of positions, (n_steps, capacity, 3)
+        velocities: Array of velocities, (n_steps, capacity, 3), or None
+        counts: Array of the number of particles in each step, (n_steps,)
+        contacts: Array of contact counts, (n_steps,), or None
+        radii: Radius of each particle row, (capacity,)
+        colors: Color of each particle row, (capacity, 3)
+        limits: x, y and z limits of the recorded world
+    Methods:
+        frame: Returns the positions, radii and colors of one step
+        step_at: Returns the step shown at a given playback time
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, HEADER)) as f:
+            header = json.load(f)
+        if header['version'] != FORMAT_VERSION:
+            raise ValueError('unsupported recording version {}'.format(
+                header['version']))
+        self.dt = header['dt']
+        self.n_steps = header['n_steps']
+        self.capacity = header['capacity']
+        self.limits = header['limits']
+        self.radii = np.array(header['radii'])
+        self.colors = np.array(header['colors'], dtype=np.uint8)
+        arrays = {}
+        for name, (dtype, shape) in header['fields'].items():
+            shape = (self.n_steps,) + tuple(shape)
+            if self.n_steps == 0:
+                arrays[name] = np.empty(shape, dtype)
+                continue
+            arrays[name] = np.memmap(os.path.join(path, name + '.bin'),
+                                     dtype=dtype, mode='r', shape=shape)
+        self.positions = arrays['positions']
+        self.counts = arrays['counts']
+        self.velocities = arrays.get('velocities')
+        self.contacts = arrays.get('contacts')
+
+    def __len__(self):
+        return self.n_steps
+
+    def frame(self, step):
+        """Return the positions, radii and colors of the particles recorded
+        at step."""
+        n = int(self.counts[step])
+        return self.positions[step, :n], self.radii[:n], self.colors[:n]
+
+    def step_at(self, t, loop=True):
+        """Return the step shown t seconds into playback.  Playback wraps
+        around if loop is True, otherwise it stops at the last step."""
+        step = int(t/self.dt)
+        if loop:
+            return step % self.n_steps
+        return min(step, self.n_steps - 1)
+
+
+class ChecksumLog:
+    """Records ParticleWorld.checksum after every step, so that runs can be
+    compared step by step across machines or code versions.  Assign it to
+    world.recorder, or call record after each step.
+    Variables:
+        checksums: List of checksums, one per step
+    Methods:
+        record: Record the checksum of a world
+        first_divergence: Returns the first step at which two logs differ
+        save: Write the checksums to a text file
+    """
+    def __init__(self, checksums=None):
+        self.checksums = [] if checksums is None else list(checksums)
+
+    def __len__(self):
+        return len(self.checksums)
+
+    def record(self, world):
+        """Append the checksum of world's current state."""
+        self.checksums.append(world.checksum())
+
+    def first_divergence(self, other):
+        """Return the index of the first step whose checksum differs from
+        other's, the length of the shorter log if one is a prefix of the
+        other, or None if they are identical."""
+        for step, (mine, theirs) in enumerate(zip(self.checksums,
+                                                  other.checksums)):
+            if mine != theirs:
+                return step
+        if len(self.checksums) != len(other.checksums):
+            return min(len(self.checksums), len(other.checksums))
+        return None
+
+    def save(self, path):
+        """Write one checksum per line to path."""
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.checksums) + '\n')
+
+
+def load_checksums(path):
+    """Read a ChecksumLog written by ChecksumLog.save."""
+    with open(path) as f:
+        return ChecksumLog(line.strip() for line in f if line.strip())
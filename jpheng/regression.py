@@ -0,0 +1,183 @@
+import json
+import time
+import numpy as np
+import jpheng.bench as bench
+import jpheng.profiler as profiler
+
+# Performance regression checks against a stored baseline.  A benchmark
+# case is a scene at one size, each is run several times and every phase of
+# the step is summarised by the median of its per-run mean time and a
+# bootstrap confidence interval of that median.
+#
+# Steps are timed in CPU time by default, as wall time on a shared machine
+# shifts by tens of percent between invocations while the confidence
+# interval only sees the noise within one.  Cases which appear to have
+# regressed are measured again by recheck before they fail.
+
+METRICS = profiler.StepProfiler.PHASES
+
+# clocks a baseline may be measured with
+CLOCKS = {'process_time': time.process_time,
+          'perf_counter': time.perf_counter}
+
+
+def measure(scene, n, repeats=5, steps=50, dt=1/120, seed=0,
+            clock='process_time'):
+    """Run one benchmark case repeats times, timed with the clock named
+    clock, see CLOCKS.
+    Returns:
+        Dictionary mapping each metric to the list of its mean time per step
+        in seconds, one entry per run
+    """
+    samples = {metric: [] for metric in METRICS}
+    for i in range(repeats):
+        result = bench.run_benchmark(scene, n, steps, dt, seed, memory=False,
+                                     clock=CLOCKS[clock])
+        for metric in METRICS:
+            samples[metric].append(result['phases'][metric])
+    return samples
+
+
+def summarise(samples, confidence=0.95, n_resamples=1000, seed=0):
+    """Summarise a list of timings by their median and a bootstrap
+    confidence interval of the median.
+    Returns:
+        Dictionary with the median, ci_low, ci_high and the samples
+    """
+    samples = np.asarray(samples, dtype=float)
+    rng = np.random.RandomState(seed)
+    resamples = rng.choice(samples, (n_resamples, len(samples)))
+    medians = np.median(resamples, axis=1)
+    tail = 100*(1 - confidence)/2
+    ci_low, ci_high = np.percentile(medians, [tail, 100 - tail])
+    return {'median': float(np.median(samples)),
+            'ci_low': float(ci_low),
+            'ci_high': float(ci_high),
+            'samples': samples.tolist()}
+
+
+def case_name(scene, n):
+    return '{}/{}'.format(scene, n)
+
+
+def measure_case(scene, n, repeats=5, steps=50, dt=1/120, seed=0,
+                 clock='process_time'):
+    """Measure one case and summarise every metric.
+    Returns:
+        Dictionary mapping each metric to its summary
+    """
+    samples = measure(scene, n, repeats, steps, dt, seed, clock)
+    return {metric: summarise(values) for metric, values in samples.items()}
+
+
+def run_cases(scenes, sizes, repeats=5, steps=50, dt=1/120, seed=0,
+              clock='process_time', log=None):
+    """Measure and summarise every combination of scene and size.
+    Returns:
+        Dictionary mapping case names, 'scene/n', to dictionaries mapping
+        each metric to its summary
+    """
+    cases = {}
+    for scene in scenes:
+        for n in sizes:
+            cases[case_name(scene, n)] = measure_case(
+                scene, n, repeats, steps, dt, seed, clock)
+            if log is not None:
+                log('measured {:<24} step {:.3f} ms'.format(
+                    case_name(scene, n),
+                    1000*cases[case_name(scene, n)]['step']['median']))
+    return cases
+
+
+def compare(baseline, current, threshold=0.25, min_seconds=1e-5):
+    """Compare current case summaries against a baseline.  A metric has
+    regressed if its median is more than threshold, a fraction, slower
+    than the baseline median and its confidence interval lies entirely
+    above the baseline's, so noise alone does not fail the check.  Metrics
+    are improved by the reverse test.  Metrics taking less than min_seconds
+    in both runs are too short to time reliably and are always ok.
+    Returns:
+        List of row dictionaries, one per metric of every case present in
+        both, with the case, metric, both medians, the relative change and
+        a status of 'regressed', 'improved' or 'ok'
+    """
+    rows = []
+    for case in sorted(current):
+        if case not in baseline:
+            continue
+        for metric in METRICS:
+            old = baseline[case].get(metric)
+            new = current[case].get(metric)
+            if old is None or new is None:
+                continue
+            if old['median'] > 0:
+                change = new['median']/old['median'] - 1
+            else:
+                change = 0.0
+            status = 'ok'
+            if max(old['median'], new['median']) < min_seconds:
+                pass
+            elif change > threshold and new['ci_low'] > old['ci_high']:
+                status = 'regressed'
+            elif change < -threshold and new['ci_high'] < old['ci_low']:
+                status = 'improved'
+            rows.append({'case': case, 'metric': metric,
+                         'baseline': old['median'], 'current': new['median'],
+                         'change': change, 'status': status})
+    return rows
+
+
+def recheck(baseline, rows, threshold=0.25, retries=2, repeats=5, steps=50,
+            dt=1/120, seed=0, clock='process_time', log=None, **settings):
+    """Measure every case with a regressed metric in compare's rows again,
+    up to retries times.  A metric stays regressed only if it regresses in
+    every measurement, so one slow spell of the machine does not fail the
+    check.  Other settings stored with a baseline are ignored.
+    Returns:
+        The rows, with metrics which did not regress again marked 'ok'
+    """
+    for attempt in range(retries):
+        flagged = sorted({row['case'] for row in rows
+                          if row['status'] == 'regressed'})
+        if not flagged:
+            break
+        for case in flagged:
+            scene, n = case.rsplit('/', 1)
+            summary = measure_case(scene, int(n), repeats, steps, dt, seed,
+                                   clock)
+            again = {row['metric'] for row in compare(
+                {case: baseline[case]}, {case: summary}, threshold)
+                     if row['status'] == 'regressed'}
+            for row in rows:
+                if row['case'] == case and row['status'] == 'regressed' and \
+                        row['metric'] not in again:
+                    row['status'] = 'ok'
+            if log is not None:
+                log('rechecked {:<23} {} metric(s) still regressed'.format(
+                    case, len(again)))
+    return rows
+
+
+def format_rows(rows):
+    """Format compare's rows as a table, times in milliseconds."""
+    lines = ['{:<24}{:<20}{:>12}{:>12}{:>9}  {}'.format(
+        'case', 'metric', 'baseline', 'current', 'change', 'status')]
+    for row in rows:
+        lines.append('{:<24}{:<20}{:>12.3f}{:>12.3f}{:>+8.1f}%  {}'.format(
+            row['case'], row['metric'], 1000*row['baseline'],
+            1000*row['current'], 100*row['change'], row['status']))
+    return '\n'.join(lines)
+
+
+def save_baseline(cases, settings, path):
+    """Write case summaries and the settings used to measure them to a
+    baseline JSON file."""
+    with open(path, 'w') as f:
+        json.dump({'environment': bench.environment(), 'settings': settings,
+                   'cases': cases}, f, indent=2)
+
+
+def load_baseline(path):
+    """Read a baseline written by save_baseline."""
+    with open(path) as f:
+        return json.load(f)
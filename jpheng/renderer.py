@@ -0,0 +1,287 @@
+import numpy as np
+import pyglet
+import jpheng.graphics as gra
+
+# Level of detail thresholds.  Each entry gives the smallest apparent size,
+# radius/distance from the camera, at which a sphere is drawn with the given
+# fraction of its full mesh resolution.  Spheres smaller than the last
+# threshold are drawn as single points.
+DEFAULT_LOD_LEVELS = ((0.05, 1.0), (0.02, 0.5), (0.005, 0.25))
+
+def perspective_matrix(fov, aspect, near, far):
+    """Return the projection matrix set by gluPerspective as a numpy
+    array."""
+    f = 1/np.tan(np.radians(fov)/2)
+    return np.array([[f/aspect, 0, 0, 0],
+                     [0, f, 0, 0],
+                     [0, 0, (far + near)/(near - far), 2*far*near/(near - far)],
+                     [0, 0, -1, 0]])
+
+def frustum_planes(matrix):
+    """Extract the six clipping planes of the view frustum from the combined
+    projection and modelview matrix.
+    Returns:
+        planes: Numpy array, shape (6, 4), each row [a,b,c,d] a plane with
+            unit normal [a,b,c] pointing into the frustum, so that a point p
+            is inside if a*x + b*y + c*z + d >= 0
+    """
+    m = np.asarray(matrix, dtype=float)
+    planes = np.array([m[3] + m[0],   # left
+                       m[3] - m[0],   # right
+                       m[3] + m[1],   # bottom
+                       m[3] - m[1],   # top
+                       m[3] + m[2],   # near
+                       m[3] - m[2]])  # far
+    planes /= np.sqrt(np.sum(planes[:, :3]**2, axis=1))[:, np.newaxis]
+    return planes
+
+def visible_spheres(planes, positions, radii):
+    """Test every bounding sphere against the frustum planes at once.
+    Returns a boolean numpy array which is False for spheres lying entirely
+    outside the frustum."""
+    distance = positions.dot(planes[:, :3].T) + planes[:, 3]
+    return np.all(distance >= -radii[:, np.newaxis], axis=1)
+
+
+class InstanceGroup:
+    """A block of vertices in a pyglet batch holding every instance of one
+    sphere mesh resolution.  The block is sized for a number of instances,
+    capacity, and grows by doubling.  Unused instances are collapsed onto
+    the origin so that they draw nothing.
+    Variables:
+        mesh: Read-only numpy array, shape (n_verts, 3), of the unit mesh
+        indices: Read-only numpy array of the unit mesh's indices
+        n_verts: Number of vertices in the unit mesh
+        capacity: Number of instances the vertex list has room for
+        count: Number of instances written by the last update
+        vertex_list: Indexed vertex list in the batch, None until the first
+            update
+    Methods:
+        reserve: Grows the vertex list to hold a number of instances
+        update: Writes the instance arrays into the vertex list
+    """
+    def __init__(self, batch, draw_mode, n_lat, n_long):
+        mesh, self.indices = gra.sphere_mesh(1, n_lat, n_long)
+        self.mesh = mesh.reshape(-1, 3)
+        self.n_verts = len(self.mesh)
+        self.batch = batch
+        self.draw_mode = draw_mode
+        self.capacity = 0
+        self.count = 0
+        self.vertex_list = None
+
+    def reserve(self, n):
+        """Ensure the vertex list has room for at least n instances."""
+        if n <= self.capacity:
+            return
+        capacity = max(n, 2*self.capacity, 16)
+        indices = self.indices[np.newaxis] + \
+            self.n_verts*np.arange(capacity)[:, np.newaxis]
+        if self.vertex_list is not None:
+            self.vertex_list.delete()
+        self.vertex_list = self.batch.add_indexed(
+            capacity*self.n_verts, self.draw_mode, None, indices.ravel(),
+            'v3f/stream', 'c3B/stream')
+        self.capacity = capacity
+        self.count = capacity  # new vertices are uninitialised
+
+    def update(self, positions, radii, colors):
+        """Write instance positions, radii and colors into the batch with
+        broadcast writes directly into the mapped vertex buffer."""
+        n = len(radii)
+        self.reserve(n)
+        shape = (self.capacity, self.n_verts, 3)
+        vertices = np.ctypeslib.as_array(
+            self.vertex_list.vertices).reshape(shape)
+        vertex_colors = np.ctypeslib.as_array(
+            self.vertex_list.colors).reshape(shape)
+        # scale and translate every instance of the unit mesh in place
+        np.multiply(self.mesh, radii[:, np.newaxis, np.newaxis],
+                    out=vertices[:n])
+        vertices[:n] += positions[:, np.newaxis]
+        vertex_colors[:n] = colors[:, np.newaxis]
+        if n < self.count:
+            vertices[n:self.count] = 0
+        self.count = n
+
+
+class PointGroup:
+    """A block of vertices in a pyglet batch holding the instances which are
+    too far away to be worth a mesh, each drawn as a single point.
+    Variables:
+        count: Number of instances written by the last update
+        vertex_list: Vertex list in the batch, None while there are no points
+    Methods:
+        update: Writes the instance arrays into the vertex list
+    """
+    def __init__(self, batch):
+        self.batch = batch
+        self.count = 0
+        self.vertex_list = None
+
+    def update(self, positions, colors):
+        """Write instance positions and colors into the batch."""
+        n = len(positions)
+        if n == 0:
+            if self.vertex_list is not None:
+                self.vertex_list.delete()
+                self.vertex_list = None
+        elif self.vertex_list is None:
+            self.vertex_list = self.batch.add(
+                n, pyglet.gl.GL_POINTS, None, 'v3f/stream', 'c3B/stream')
+        elif n != self.count:
+            self.vertex_list.resize(n)
+        if n > 0:
+            np.ctypeslib.as_array(
+                self.vertex_list.vertices).reshape(n, 3)[:] = positions
+            np.ctypeslib.as_array(
+                self.vertex_list.colors).reshape(n, 3)[:] = colors
+        self.count = n
+
+
+class ParticleRenderer:
+    """Draws a whole list of particles with a single batch draw rather than
+    one draw call per particle.
+
+    Every sphere of a given resolution is an instance of the same unit
+    sphere mesh, scaled by its radius and translated to its position.  The
+    per-instance positions, radii and colors are gathered into arrays and
+    written into one InstanceGroup per resolution.  All groups live in the
+    same pyglet batch, and therefore the same streaming vertex buffer, which
+    is updated once per frame.  Particles whose graphics are not spheres are
+    drawn individually.
+
+    If the camera position is given the mesh resolution of each sphere is
+    reduced with its apparent size, radius/distance, according to
+    lod_levels, and the most distant spheres are drawn as points.  If the
+    frustum planes are given spheres outside the view are culled before
+    anything else is done with them.
+    Variables:
+        draw_mode: OpenGL draw mode used for the sphere meshes
+        lod_levels: Sequence of (minimum apparent size, resolution fraction)
+            pairs in descending order of size, see DEFAULT_LOD_LEVELS
+        point_size: Size in pixels of spheres drawn as points
+        batch: pyglet batch holding the vertices of every instance
+        groups: Dictionary mapping (n_lat, n_long) to InstanceGroup
+        points: PointGroup holding the spheres drawn as points
+        n_draw_calls: Number of draw calls issued by the most recent draw
+        n_culled: Number of spheres culled by the most recent draw
+    Methods:
+        gather: Returns the instance arrays for a list of particles
+        draw: Draws a list of particles
+        draw_instances: Draws spheres from instance arrays
+        resolutions: Returns the mesh resolution of each instance
+    """
+    def __init__(self, lod_levels=DEFAULT_LOD_LEVELS, point_size=2):
+        self.draw_mode = pyglet.gl.GL_TRIANGLES
+        self.lod_levels = lod_levels
+        self.point_size = point_size
+        self.batch = pyglet.graphics.Batch()
+        self.groups = {}
+        self.points = PointGroup(self.batch)
+        self.n_draw_calls = 0
+        self.n_culled = 0
+        # scratch arrays reused by gather
+        self._positions = np.empty((0, 3))
+        self._radii = np.empty(0)
+        self._colors = np.empty((0, 3), dtype=np.uint8)
+
+    def gather(self, particles):
+        """Split particles into spheres, which can be instanced, and
+        everything else.  The returned arrays are views of scratch buffers
+        which are overwritten by the next call.
+        Returns:
+            positions: Numpy float array, shape (n, 3), of sphere centres
+            radii: Numpy float array, shape (n,), of sphere radii
+            colors: Numpy uint8 array, shape (n, 3), of sphere colors
+            others: List of the particles which are not spheres
+        """
+        if len(particles) > len(self._radii):
+            n = max(len(particles), 2*len(self._radii))
+            self._positions = np.empty((n, 3))
+            self._radii = np.empty(n)
+            self._colors = np.empty((n, 3), dtype=np.uint8)
+        others = []
+        n = 0
+        for particle in particles:
+            if isinstance(particle.graphics, gra.SphereComponent):
+                self._positions[n] = particle.physics.p
+                self._radii[n] = particle.graphics.r
+                self._colors[n] = particle.graphics.color
+                n += 1
+            else:
+                others.append(particle)
+        return self._positions[:n], self._radii[:n], self._colors[:n], others
+
+    def draw(self, particles, eye=None, planes=None):
+        """Draw all particles in the active pyglet window, as seen from eye
+        and culled to the frustum planes if they are given."""
+        positions, radii, colors, others = self.gather(particles)
+        self.draw_instances(positions, radii, colors, eye, planes)
+        for particle in others:
+            particle.draw()
+        self.n_draw_calls += len(others)
+
+    def resolutions(self, positions, radii, eye=None):
+        """Choose the mesh resolution of every instance from its apparent
+        size as seen from eye.  Instances with zero resolution should be
+        drawn as points.
+        Returns:
+            n_lat: Numpy int array of latitudinal vertex counts
+            n_long: Numpy int array of longitudinal vertex counts
+        """
+        n_lat, n_long = gra.sphere_resolutions(radii)
+        if eye is None or not self.lod_levels:
+            return n_lat, n_long
+        distance = np.sqrt(np.sum((positions - eye)**2, axis=1))
+        size = radii/np.maximum(distance, 1e-9)
+        thresholds = np.array([level[0] for level in self.lod_levels])
+        fractions = np.array([level[1] for level in self.lod_levels] + [0])
+        # thresholds are descending, count those the size falls below
+        level = len(thresholds) - np.searchsorted(thresholds[::-1], size,
+                                                  side='right')
+        fraction = fractions[level]
+        n_lat = np.where(fraction > 0,
+                         np.maximum(3, (n_lat*fraction).astype(int)), 0)
+        n_long = np.where(fraction > 0,
+                          np.maximum(4, (n_long*fraction).astype(int)), 0)
+        return n_lat, n_long
+
+    def draw_instances(self, positions, radii, colors, eye=None,
+                       planes=None):
+        """Draw one sphere per row of the instance arrays, as seen from eye
+        and culled to the frustum planes if they are given."""
+        self.n_culled = 0
+        if planes is not None:
+            visible = visible_spheres(planes, positions, radii)
+            self.n_culled = len(radii) - np.count_nonzero(visible)
+            if self.n_culled:
+                positions = positions[visible]
+                radii = radii[visible]
+                colors = colors[visible]
+        n_lat, n_long = self.resolutions(positions, radii, eye)
+        keys, group = np.unique(np.stack([n_lat, n_long], axis=1), axis=0,
+                                return_inverse=True)
+        group = group.reshape(-1)
+        used = set()
+        for k, (lat, long) in enumerate(keys):
+            members = np.flatnonzero(group == k)
+            if lat == 0:
+                self.points.update(positions[members], colors[members])
+                continue
+            key = (int(lat), int(long))
+            if key not in self.groups:
+                self.groups[key] = InstanceGroup(self.batch, self.draw_mode,
+                                                 *key)
+            self.groups[key].update(positions[members], radii[members],
+                                    colors[members])
+            used.add(key)
+        # empty any resolution which is no longer drawn
+        for key, instances in self.groups.items():
+            if key not in used and instances.count > 0:
+                instances.update(positions[:0], radii[:0], colors[:0])
+        if len(keys) == 0 or keys[0][0] != 0:
+            self.points.update(positions[:0], colors[:0])
+        pyglet.gl.glPointSize(self.point_size)
+        self.batch.draw()
+        self.n_draw_calls = 1
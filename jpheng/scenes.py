@@ -0,0 +1,317 @@
+import json
+import os
+import numpy as np
+import jpheng.particles as entities
+import jpheng.pbd as pbd
+import jpheng.pcontacts as pcontacts
+import jpheng.pfgen as pfgen
+import jpheng.plinks as plinks
+import jpheng.pworld as pworld
+
+# Declarative scene files.  A scene is a JSON object:
+#
+#     {"map": {"xlim": [-60, 60], "ylim": [-60, 60], "zlim": [0, 50]},
+#      "collisions": true,
+#      "particles": [{"name": "ball", "p": [0, 0, 20], "v": [10, 0, 0],
+#                     "inv_mass": 0.1, "r": 10, "color": [255, 0, 0]},
+#                    {"name": "gas", "count": 1000, "p": "gas_p.npy",
+#                     "v": "gas_v.npy", "inv_mass": 0.1, "r": 1}],
+#      "forces": [{"type": "AnchoredSpring", "particle": "ball",
+#                  "anchor": [0, 0, 40], "k": 3, "l0": 10}],
+#      "links": [{"type": "ParticleRod", "particles": ["gas:0", "gas:1"],
+#                 "length": 3}]}
+#
+# Every entry of particles is a group of count particles.  Each field is
+# either one value shared by the whole group or one value per particle,
+# given inline or as the name of a .npy file relative to the scene file.
+# Particle fields are p (required), v, a, g, color, inv_mass, r and
+# damping, with PhysicsComponent's defaults and a random color when
+# omitted.  Groups are built in bulk by particles.from_arrays.
+# collision_group and collision_mask set the bits of Particle's collision
+# filter, "collision_mask": 0 makes markers nothing collides with.
+#
+# forces and links entries likewise create one generator or link per row of
+# their fields.  Particles are referred to by index in the order they are
+# declared, by group name for the first particle of a group, or by
+# 'name:i' for the i-th particle of a group.  A ParticleSpring with
+# "symmetric": true also pulls its other particle back towards the first.
+# A links entry with "set": true puts its links in one plinks.ParticleLinkSet,
+# which is much faster for ropes and chains of many links.  Setting
+# "collisions" false removes the world's ParticleCollisionGenerator.
+# "dtype": "float32" stores the world's state in single precision.
+# "link_solver": {"iterations": 10, "compliance": 0} projects the scene's
+# links on positions with a pbd.LinkSolver instead of resolving them as
+# contacts.
+
+FORMAT_VERSION = 1
+
+# particle fields, their default values and number of components
+PARTICLE_FIELDS = {'p': (None, 3),
+                   'v': ([0, 0, 0], 3),
+                   'a': ([0, 0, 0], 3),
+                   'g': ([0, 0, -20], 3),
+                   'color': (None, 3),
+                   'inv_mass': (1, 1),
+                   'r': (1, 1),
+                   'damping': (0.999, 1)}
+
+PARTICLE = 'particle'
+PAIR = 'pair'
+VECTOR = 'vector'
+SCALAR = 'scalar'
+
+# force generators, their constructor arguments and the kind of each
+FORCES = {
+    'GravityGenerator': (pfgen.GravityGenerator, (('g', VECTOR),)),
+    'ParticleSpring': (pfgen.ParticleSpring, (
+        ('other', PARTICLE), ('k', SCALAR), ('l0', SCALAR))),
+    'AnchoredSpring': (pfgen.AnchoredSpring, (
+        ('anchor', VECTOR), ('k', SCALAR), ('l0', SCALAR))),
+    'AnchoredBungee': (pfgen.AnchoredBungee, (
+        ('anchor', VECTOR), ('k', SCALAR), ('l0', SCALAR))),
+    'StiffAnchoredSpring': (pfgen.StiffAnchoredSpring, (
+        ('anchor', VECTOR), ('k', SCALAR), ('d', SCALAR)))}
+
+LINKS = {
+    'ParticleRod': (plinks.ParticleRod, (
+        ('particles', PAIR), ('length', SCALAR))),
+    'ParticleCable': (plinks.ParticleCable, (
+        ('particles', PAIR), ('max_length', SCALAR),
+        ('restitution', SCALAR)))}
+
+
+class Scene:
+    """A world loaded from a scene file.
+    Variables:
+        world: ParticleWorld holding the scene
+        names: Dictionary mapping particle group names to lists of their
+            particles
+    Methods:
+        make_map: Returns a maps.EmptyMap matching the world's limits
+    """
+    def __init__(self, world, names):
+        self.world = world
+        self.names = names
+
+    def make_map(self):
+        """Return an EmptyMap with the limits of the world.  Needs an open
+        pyglet window."""
+        import jpheng.maps as maps
+        return maps.EmptyMap(self.world.xlim, self.world.ylim,
+                             self.world.zlim)
+
+
+def _value(value, base):
+    """Return a field value as an array, loading it from base if it names a
+    .npy file."""
+    if isinstance(value, str) and value.endswith('.npy'):
+        return np.load(os.path.join(base, value))
+    return value
+
+
+def _rows(value, width, n=None):
+    """Return value as an array with one row of width components per item,
+    broadcasting one shared value to n rows."""
+    array = np.asarray(value)
+    if width == 1:
+        array = array.reshape(-1)
+    else:
+        array = array.reshape(-1, width)
+    if n is not None and len(array) != n:
+        array = np.broadcast_to(array, (n,) + array.shape[1:])
+    return array
+
+
+def _group_size(group, base):
+    """Return the number of particles in a group."""
+    if 'count' in group:
+        return int(group['count'])
+    n = 1
+    for field, (default, width) in PARTICLE_FIELDS.items():
+        if field in group:
+            n = max(n, len(_rows(_value(group[field], base), width)))
+    return n
+
+
+class _References:
+    """Resolves particle references to indices into the particle list."""
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, name, start, count):
+        self.groups[name] = (start, count)
+
+    def index(self, reference):
+        if isinstance(reference, str):
+            name, sep, i = reference.partition(':')
+            start, count = self.groups[name]
+            i = int(i) if sep else 0
+            if not 0 <= i < count:
+                raise IndexError('{} is outside group {} of {} '
+                                 'particles'.format(reference, name, count))
+            return start + i
+        return int(reference)
+
+    def indices(self, value, width):
+        if isinstance(value, np.ndarray) and value.dtype.kind in 'iu':
+            return _rows(value, width)
+        if width == 1 and not isinstance(value, (list, tuple)):
+            value = [value]
+        references = np.ravel(np.array(value, dtype=object))
+        return _rows([self.index(reference) for reference in references],
+                     width)
+
+
+def _build_objects(entry, table, kind_name, base, references, particles):
+    """Create one object per row of the fields of a forces or links entry.
+    Returns the class name, the list of objects and the field rows."""
+    name = entry['type']
+    if name not in table:
+        raise ValueError('unknown {} type {}'.format(kind_name, name))
+    cls, fields = table[name]
+    rows = {}
+    for field, kind in fields:
+        value = _value(entry[field], base)
+        if kind == PARTICLE:
+            rows[field] = references.indices(value, 1)
+        elif kind == PAIR:
+            rows[field] = references.indices(value, 2)
+        elif kind == VECTOR:
+            rows[field] = _rows(value, 3).astype(float)
+        else:
+            rows[field] = _rows(value, 1).astype(float)
+    if kind_name == 'force':
+        rows['particle'] = references.indices(
+            _value(entry['particle'], base), 1)
+    n = max(len(values) for values in rows.values())
+    rows = {field: np.broadcast_to(values, (n,) + values.shape[1:])
+            if len(values) != n else values
+            for field, values in rows.items()}
+    objects = []
+    for i in range(n):
+        args = []
+        for field, kind in fields:
+            value = rows[field][i]
+            if kind == PARTICLE:
+                value = particles[value]
+            elif kind == PAIR:
+                value = [particles[value[0]], particles[value[1]]]
+            elif kind == VECTOR:
+                value = np.array(value)
+            else:
+                value = float(value)
+            args.append(value)
+        objects.append(cls(*args))
+    return name, objects, rows
+
+
+def build(spec, base='.'):
+    """Build a Scene from a scene dictionary, .npy files are loaded
+    relative to base."""
+    version = spec.get('version', FORMAT_VERSION)
+    if version != FORMAT_VERSION:
+        raise ValueError('unsupported scene version {}'.format(version))
+    limits = spec['map']
+    dtype = spec.get('dtype', 'float64')
+    link_solver = spec.get('link_solver')
+    world = pworld.ParticleWorld(list(limits['xlim']), list(limits['ylim']),
+                                 list(limits['zlim']), dtype=dtype)
+    if link_solver is not None:
+        world.link_solver = pbd.LinkSolver(link_solver.get('iterations', 10),
+                                           link_solver.get('compliance', 0))
+    if not spec.get('collisions', True):
+        world.contact_generators = [
+            generator for generator in world.contact_generators
+            if not isinstance(generator, pcontacts.ParticleCollisionGenerator)]
+
+    references = _References()
+    names = {}
+    particles = world.particle_list
+    for group in spec.get('particles', []):
+        n = _group_size(group, base)
+        fields = {}
+        for field, (default, width) in PARTICLE_FIELDS.items():
+            value = _value(group.get(field, default), base)
+            if value is None:
+                if field == 'p':
+                    raise ValueError('particle group without positions')
+                continue
+            fields[field] = _rows(value, width, n)
+        created = entities.from_arrays(
+            fields['p'], fields['v'], fields['a'], fields['inv_mass'],
+            fields['r'], fields.get('color'), fields['g'], fields['damping'],
+            dtype=dtype, rng=world.rng)
+        for field in ('collision_group', 'collision_mask'):
+            if field in group:
+                bits = _rows(_value(group[field], base), 1, n).tolist()
+                for particle, value in zip(created, bits):
+                    setattr(particle, field, int(value))
+        if 'name' in group:
+            references.add(group['name'], len(particles), n)
+            names[group['name']] = created
+        particles.extend(created)
+
+    for entry in spec.get('forces', []):
+        name, generators, rows = _build_objects(
+            entry, FORCES, 'force', base, references, particles)
+        symmetric = name == 'ParticleSpring' and entry.get('symmetric')
+        for i, generator in enumerate(generators):
+            particle = particles[rows['particle'][i]]
+            world.force_registry.add(particle, generator)
+            if symmetric:
+                world.force_registry.add(
+                    generator.other_particle, pfgen.ParticleSpring(
+                        particle, generator.k, generator.l0))
+
+    for entry in spec.get('links', []):
+        name, links, rows = _build_objects(entry, LINKS, 'link', base,
+                                           references, particles)
+        if entry.get('set'):
+            world.contact_generators.append(
+                plinks.ParticleLinkSet.from_links(links))
+        else:
+            world.contact_generators.extend(links)
+    return Scene(world, names)
+
+
+def read(path):
+    """Read a scene file into a dictionary."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def load(path):
+    """Load a scene file, see the module comment for its format.
+    Returns a Scene."""
+    return build(read(path), os.path.dirname(os.path.abspath(path)))
+
+
+def save(spec, path, inline_limit=64):
+    """Write a scene dictionary to path.  Numpy arrays with more than
+    inline_limit elements are written to .npy files beside it, named after
+    the scene file, the section, the entry and the field; smaller arrays are
+    written inline."""
+    base = os.path.dirname(os.path.abspath(path))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    out = {}
+    for key, value in spec.items():
+        if key not in ('particles', 'forces', 'links'):
+            out[key] = value
+            continue
+        entries = []
+        for i, entry in enumerate(value):
+            written = {}
+            for field, item in entry.items():
+                if isinstance(item, np.ndarray):
+                    if item.size > inline_limit:
+                        name = '{}.{}{}.{}.npy'.format(stem, key, i, field)
+                        np.save(os.path.join(base, name), item)
+                        item = name
+                    else:
+                        item = item.tolist()
+                written[field] = item
+            entries.append(written)
+        out[key] = entries
+    out.setdefault('version', FORMAT_VERSION)
+    with open(path, 'w') as f:
+        json.dump(out, f, indent=2)
@@ -0,0 +1,147 @@
+import threading
+import time
+import numpy as np
+
+
+class StateSnapshot:
+    """The state of a world needed to draw it, captured at the end of a
+    step.  Every particle is recorded as a sphere.
+    Variables:
+        positions: Numpy float array, shape (capacity, 3), of positions
+        radii: Numpy float array, shape (capacity,), of radii
+        colors: Numpy uint8 array, shape (capacity, 3), of colors
+        count: Number of particles captured, rows beyond count are unused
+        step: Number of the world step the snapshot was taken after
+    Methods:
+        capture: Copy the state of a list of particles into the snapshot
+    """
+    def __init__(self):
+        self.positions = np.empty((0, 3))
+        self.radii = np.empty(0)
+        self.colors = np.empty((0, 3), dtype=np.uint8)
+        self.count = 0
+        self.step = -1
+
+    def capture(self, particles, step):
+        """Copy the state of particles into the snapshot, growing its arrays
+        if needed."""
+        n = len(particles)
+        if n > len(self.radii):
+            capacity = max(n, 2*len(self.radii))
+            self.positions = np.empty((capacity, 3))
+            self.radii = np.empty(capacity)
+            self.colors = np.empty((capacity, 3), dtype=np.uint8)
+        for i, particle in enumerate(particles):
+            self.positions[i] = particle.physics.p
+            self.radii[i] = particle.graphics.r
+            self.colors[i] = particle.graphics.color
+        self.count = n
+        self.step = step
+
+
+class StateBuffer:
+    """Double buffer of StateSnapshots passing state from the simulation
+    thread to the renderer.
+
+    The simulation writes into the back snapshot and publishes it by
+    swapping it to the front.  The renderer acquires the front snapshot and
+    releases it when it is done drawing.  Neither side ever waits for the
+    other: a lock is only held to swap or acquire an index, and if the
+    renderer is still holding the back snapshot when the simulation wants to
+    write to it the simulation skips publishing that step.
+    Variables:
+        snapshots: The two StateSnapshots
+        n_published: Number of snapshots published
+        n_skipped: Number of snapshots skipped because the renderer was
+            still reading the back buffer
+    Methods:
+        publish: Capture a list of particles and swap it to the front
+        acquire: Returns the front snapshot for reading
+        release: Marks the acquired snapshot as no longer being read
+    """
+    def __init__(self):
+        self.snapshots = [StateSnapshot(), StateSnapshot()]
+        self.n_published = 0
+        self.n_skipped = 0
+        self._front = 0
+        self._reading = None
+        self._lock = threading.Lock()
+
+    def publish(self, particles, step):
+        """Capture particles into the back snapshot and make it the front.
+        Returns False if the snapshot was skipped."""
+        with self._lock:
+            back = 1 - self._front
+            if self._reading == back:
+                self.n_skipped += 1
+                return False
+        self.snapshots[back].capture(particles, step)
+        with self._lock:
+            self._front = back
+            self.n_published += 1
+        return True
+
+    def acquire(self):
+        """Return the most recently published snapshot.  It is not
+        overwritten until release is called."""
+        with self._lock:
+            self._reading = self._front
+            return self.snapshots[self._front]
+
+    def release(self):
+        """Release the snapshot returned by acquire."""
+        with self._lock:
+            self._reading = None
+
+
+class SimulationThread(threading.Thread):
+    """Steps a ParticleWorld at a fixed time step on its own thread,
+    publishing the state after every step into a StateBuffer.
+
+    The world must not be modified by other threads while the simulation is
+    running unless they hold lock, which is held for the duration of every
+    step.
+    Variables:
+        world: The ParticleWorld being simulated
+        dt: Simulation time step, seconds
+        buffer: StateBuffer the state is published to
+        lock: Lock held while the world is stepped
+        n_steps: Number of steps taken
+    Methods:
+        run: Thread main loop, steps the world in real time until stopped
+        stop: Stops the thread and waits for it to finish
+    """
+    def __init__(self, world, dt=1/120, buffer=None):
+        super(SimulationThread, self).__init__(daemon=True)
+        self.world = world
+        self.dt = dt
+        if buffer is None:
+            buffer = StateBuffer()
+        self.buffer = buffer
+        self.lock = threading.RLock()
+        self.n_steps = 0
+        self._stop_event = threading.Event()
+        # publish the initial state so that there is always something to draw
+        self.buffer.publish(self.world.particle_list, self.n_steps)
+
+    def run(self):
+        next_time = time.perf_counter()
+        while not self._stop_event.is_set():
+            with self.lock:
+                self.world.step(self.dt)
+                self.n_steps += 1
+                self.buffer.publish(self.world.particle_list, self.n_steps)
+            # keep to real time, if the simulation has fallen behind carry on
+            # from now rather than trying to catch up
+            next_time += self.dt
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                next_time = time.perf_counter()
+
+    def stop(self):
+        """Stop stepping the world and wait for the thread to finish."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,144 @@
+import ctypes
+import itertools
+import multiprocessing
+import numpy as np
+
+# state shared with the worker processes, set by _init_worker
+_worker = {}
+
+
+class SweepResult:
+    """Results of a parameter sweep, one entry per run in the order of
+    params.
+    Variables:
+        params: List of parameter dictionaries passed to the scene factory
+        metrics: List of metric dictionaries returned for each run
+        positions: Numpy array, shape (n_runs, n_steps, n_particles, 3), of
+            particle positions after every step, None unless recorded
+    Methods:
+        column: Returns one metric for every run as a numpy array
+    """
+    def __init__(self, params, metrics, positions=None):
+        self.params = params
+        self.metrics = metrics
+        self.positions = positions
+
+    def column(self, name):
+        """Return the named metric of every run as a numpy array."""
+        return np.array([metrics[name] for metrics in self.metrics])
+
+
+def parameter_grid(grid):
+    """Expand a dictionary mapping parameter names to lists of values into
+    the list of every combination of values, each a dictionary of
+    parameters."""
+    names = sorted(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def world_summary(world):
+    """Default metrics for a run: particle count, kinetic energy, momentum
+    and the centre of mass of the world's movable particles."""
+    n = len(world.particle_list)
+    kinetic_energy = 0.0
+    momentum = np.zeros(3)
+    centre = np.zeros(3)
+    total_mass = 0.0
+    for particle in world.particle_list:
+        if particle.physics.inv_mass == 0:
+            continue
+        mass = 1/particle.physics.inv_mass
+        kinetic_energy += 0.5*mass*np.dot(particle.physics.v,
+                                          particle.physics.v)
+        momentum += mass*particle.physics.v
+        centre += mass*particle.physics.p
+        total_mass += mass
+    if total_mass > 0:
+        centre /= total_mass
+    return {'n_particles': n,
+            'kinetic_energy': kinetic_energy,
+            'momentum_x': momentum[0],
+            'momentum_y': momentum[1],
+            'momentum_z': momentum[2],
+            'centre_x': centre[0],
+            'centre_y': centre[1],
+            'centre_z': centre[2]}
+
+
+def _init_worker(scene_factory, n_steps, dt, metrics, shared, shape):
+    """Pool initializer, stores the sweep settings and the shared trajectory
+    array in the worker process."""
+    _worker['scene_factory'] = scene_factory
+    _worker['n_steps'] = n_steps
+    _worker['dt'] = dt
+    _worker['metrics'] = metrics
+    _worker['positions'] = None
+    if shared is not None:
+        _worker['positions'] = np.frombuffer(shared).reshape(shape)
+
+
+def _run(task):
+    """Build and step one world, writing its trajectory straight into shared
+    memory.  Only the metrics are sent back to the parent."""
+    index, params = task
+    world = _worker['scene_factory'](**params)
+    positions = _worker['positions']
+    if positions is not None and \
+            len(world.particle_list) != positions.shape[2]:
+        raise ValueError('Recording positions requires every run to have '
+                         'the same number of particles')
+    for step in range(_worker['n_steps']):
+        world.step(_worker['dt'])
+        if positions is not None:
+            for i, particle in enumerate(world.particle_list):
+                positions[index, step, i] = particle.physics.p
+    return index, _worker['metrics'](world)
+
+
+def run_sweep(scene_factory, grid, n_steps, dt=1/120, processes=None,
+              metrics=world_summary, record_positions=False):
+    """Run one headless world per combination of parameters in grid across
+    a pool of processes.
+    Arguments:
+        scene_factory: Function called as scene_factory(**params) which
+            returns a new ParticleWorld.  It must be picklable, i.e. defined
+            at module level.
+        grid: Dictionary mapping parameter names to lists of values, or a
+            list of parameter dictionaries
+        n_steps: Number of steps to run each world for
+        dt: Time step, seconds
+        processes: Number of worker processes, defaults to the CPU count
+        metrics: Picklable function returning a dictionary of summary values
+            for a world at the end of its run
+        record_positions: If True every particle's position after every step
+            is written to shared memory and returned in the result
+    Returns:
+        SweepResult
+    """
+    if isinstance(grid, dict):
+        params = parameter_grid(grid)
+    else:
+        params = list(grid)
+    shared = None
+    shape = None
+    if record_positions and params:
+        n_particles = len(scene_factory(**params[0]).particle_list)
+        shape = (len(params), n_steps, n_particles, 3)
+        shared = multiprocessing.RawArray(ctypes.c_double,
+                                          int(np.prod(shape)))
+    results = [None]*len(params)
+    pool = multiprocessing.Pool(processes, _init_worker,
+                                (scene_factory, n_steps, dt, metrics, shared,
+                                 shape))
+    try:
+        for index, run_metrics in pool.imap_unordered(_run,
+                                                      enumerate(params)):
+            results[index] = run_metrics
+    finally:
+        pool.close()
+        pool.join()
+    positions = None
+    if shared is not None:
+        positions = np.frombuffer(shared).reshape(shape)
+    return SweepResult(params, results, positions)
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+import time
+
+
+class Span:
+    """Context manager timing a block of code as one trace event."""
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add(self.name, self.category, self.start,
+                        time.perf_counter(), self.args)
+        return False
+
+
+class NullSpan:
+    """Context manager which does nothing, used in place of a Span when
+    tracing is disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """Records timed spans as Chrome trace events, which can be saved as
+    JSON and opened in Perfetto (ui.perfetto.dev) or chrome://tracing.
+    Spans recorded on different threads appear on separate tracks.
+    Variables:
+        events: List of trace event dictionaries
+        max_events: Recording stops once this many events have been
+            recorded, None for no limit
+        start: perf_counter time which trace timestamps are relative to
+    Methods:
+        add: Record a span from its start and end times
+        span: Returns a context manager recording the span of a block
+        to_dict: Returns the trace in trace event format
+        save: Write the trace to a JSON file
+        clear: Discard all events
+    """
+    def __init__(self, max_events=1000000):
+        self.events = []
+        self.max_events = max_events
+        self.start = time.perf_counter()
+        self.pid = os.getpid()
+        self._threads = {}
+
+    def add(self, name, category, start, end, args=None):
+        """Record a span given its perf_counter start and end times."""
+        if self.max_events is not None and \
+                len(self.events) >= self.max_events:
+            return
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        event = {'name': name, 'cat': category, 'ph': 'X',
+                 'ts': 1e6*(start - self.start), 'dur': 1e6*(end - start),
+                 'pid': self.pid, 'tid': tid}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def span(self, name, category='jpheng', args=None):
+        """Return a context manager which records the time spent inside it
+        as a span."""
+        return Span(self, name, category, args)
+
+    def to_dict(self):
+        """Return the trace as a trace event format dictionary, including
+        the names of the threads spans were recorded on."""
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                     'tid': tid, 'args': {'name': name}}
+                    for tid, name in self._threads.items()]
+        return {'traceEvents': metadata + self.events,
+                'displayTimeUnit': 'ms'}
+
+    def save(self, path):
+        """Write the trace to path as JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    def clear(self):
+        """Discard all recorded events."""
+        self.events = []
+
+
+def span(tracer, name, category='jpheng', args=None):
+    """Return tracer.span(name, category, args), or a context manager that
+    does nothing if tracer is None."""
+    if tracer is None:
+        return NULL_SPAN
+    return tracer.span(name, category, args)
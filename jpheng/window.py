@@ -1,8 +1,9 @@
 import pyglet
 import numpy as np
 from jpheng import camera as cam
-from jpheng import pfgen as force
-from jpheng import pcontacts as contacts
+from jpheng import renderer
+from jpheng import profiler
+from jpheng import tracing
 
 
 class Window(pyglet.window.Window):
@@ -10,20 +11,52 @@ class Window(pyglet.window.Window):
     within the operating system (from pyglet.window) as well as the
     user-controlled camera, the current level map, the list of entities in
     the current level, the force registry, and the scheduling for the camera
-    and physics update functions.
+    and physics update functions.  If threaded is True the world is stepped
+    on a separate SimulationThread and drawn from the snapshots it
+    publishes, anything else modifying the world must then hold
+    simulation.lock.  If show_profile is True the world is profiled and a
+    summary of the profile is drawn over the scene.  If a tracing.Tracer is
+    given the camera updates, world steps and draws are recorded in it.
+    If a recording.Trajectory is given as replay it is played back at
+    replay_speed times real time instead of simulating, world may then be
+    None.  During playback P pauses and [ and ] halve and double the speed.
     Variables:
         camera: First person camera object
         level_map: Map object containing scenery for simulation
+        renderer: ParticleRenderer used to draw the world's particles
+        fov: Vertical field of view of the perspective projection, degrees
+        near_clip: Distance to the near clipping plane
+        far_clip: Distance to the far clipping plane
+        simulation: SimulationThread stepping the world, None unless
+            threaded
+        profile_label: pyglet Label showing the world's profile, None unless
+            show_profile
+        tracer: tracing.Tracer recording camera updates and draws, shared
+            with the world, or None
+        replay: recording.Trajectory being played back, or None
+        replay_speed: Playback speed as a multiple of real time
+        replay_time: Time into the recording being shown, seconds
+        replay_paused: If True playback is paused
         registry: ParticleForceRegistry object containing all force registrations
         for entities
     Methods:
         set3D: Calls pyglet functions to allow 3D perspective
+        set2D: Calls pyglet functions to draw in window co-ordinates
+        update_profile_label: Refreshes the profile overlay
+        update_camera: Updates the camera
+        update_replay: Advances playback of the recording
+        on_key_press: Handles playback controls
+        draw_scene: Draws the map and the world
+        frustum_planes: Returns the planes bounding the camera's view
         on_draw: Runs when window is rendered
+        on_close: Stops the simulation thread and closes the window
         update: Calls functions needed at each time step of simulation
         boundary_check: Checks if entity is within level bounds, if not,
             reflect it back
     """
-    def __init__(self, world, level_map, *args, **kwargs):
+    def __init__(self, world, level_map, *args, threaded=False,
+                 show_profile=False, tracer=None, replay=None,
+                 replay_speed=1, **kwargs):
         # call init of superclass (pyglet window)
         super(Window, self).__init__(*args, **kwargs)
         # set window properties (overwrites args)
@@ -36,21 +69,100 @@ class Window(pyglet.window.Window):
         # set level map
         self.level_map = level_map
         self.world = world
+        self.renderer = renderer.ParticleRenderer()
+        # perspective projection parameters
+        self.fov = 70
+        self.near_clip = .1
+        self.far_clip = 1000
+        self.tracer = tracer
+        if tracer is not None and world is not None:
+            self.world.tracer = tracer
+        self.replay = replay
+        self.replay_speed = replay_speed
+        self.replay_time = 0
+        self.replay_paused = False
         # create list of objects in window and schedule their updates
         # schedule function calls
-        pyglet.clock.schedule_interval(self.camera.update, 1/120)
-        pyglet.clock.schedule_interval(self.world.step, 1/120)
+        pyglet.clock.schedule_interval(self.update_camera, 1/120)
+        self.profile_label = None
+        if show_profile and world is not None:
+            if self.world.profiler is None:
+                self.world.profiler = profiler.StepProfiler()
+            self.profile_label = pyglet.text.Label(
+                '', font_name='Courier New', font_size=10, x=10,
+                y=self.height - 10, anchor_y='top', color=(0, 0, 0, 255),
+                multiline=True, width=500)
+            pyglet.clock.schedule_interval(self.update_profile_label, 0.5)
+        self.simulation = None
+        if replay is not None:
+            pyglet.clock.schedule_interval(self.update_replay, 1/120)
+        elif threaded:
+            from jpheng import simulation
+            self.simulation = simulation.SimulationThread(self.world, 1/120)
+            self.simulation.start()
+        else:
+            pyglet.clock.schedule_interval(self.world.step, 1/120)
 
     def set3D(self):
         """Calls pyglet functions to allow 3D perspective."""
         pyglet.gl.glMatrixMode(pyglet.gl.GL_PROJECTION)
         pyglet.gl.glLoadIdentity()
-        pyglet.gl.gluPerspective(70, self.width/float(self.height), .1, 1000)
+        pyglet.gl.gluPerspective(self.fov, self.width/float(self.height),
+                                 self.near_clip, self.far_clip)
         pyglet.gl.glMatrixMode(pyglet.gl.GL_MODELVIEW)
         pyglet.gl.glLoadIdentity()
 
+    def set2D(self):
+        """Calls pyglet functions to draw in window co-ordinates."""
+        pyglet.gl.glMatrixMode(pyglet.gl.GL_PROJECTION)
+        pyglet.gl.glLoadIdentity()
+        pyglet.gl.glOrtho(0, self.width, 0, self.height, -1, 1)
+        pyglet.gl.glMatrixMode(pyglet.gl.GL_MODELVIEW)
+        pyglet.gl.glLoadIdentity()
+
+    def update_camera(self, dt):
+        """Update the camera from user input."""
+        with tracing.span(self.tracer, 'camera.update', 'input'):
+            self.camera.update(dt)
+
+    def update_replay(self, dt):
+        """Advance playback by dt scaled by the playback speed."""
+        if not self.replay_paused:
+            self.replay_time += dt*self.replay_speed
+
+    def on_key_press(self, symbol, modifiers):
+        """Pause, slow down or speed up playback of a recording."""
+        if self.replay is not None:
+            if symbol == pyglet.window.key.P:
+                self.replay_paused = not self.replay_paused
+            elif symbol == pyglet.window.key.BRACKETLEFT:
+                self.replay_speed /= 2
+            elif symbol == pyglet.window.key.BRACKETRIGHT:
+                self.replay_speed *= 2
+        return super(Window, self).on_key_press(symbol, modifiers)
+
+    def update_profile_label(self, dt):
+        """Refresh the profile overlay with the world's latest summary."""
+        self.profile_label.y = self.height - 10
+        self.profile_label.text = self.world.profiler.report()
+
+    def frustum_planes(self):
+        """Return the planes bounding the camera's view frustum, see
+        renderer.frustum_planes."""
+        projection = renderer.perspective_matrix(
+            self.fov, self.width/float(self.height), self.near_clip,
+            self.far_clip)
+        return renderer.frustum_planes(
+            projection.dot(self.camera.view_matrix()))
+
     def on_draw(self):
         """Evaluate these functions when the window renders."""
+        with tracing.span(self.tracer, 'on_draw', 'render'):
+            self.draw_scene()
+        return pyglet.event.EVENT_HANDLED
+
+    def draw_scene(self):
+        """Draw the level map, the world and any overlay."""
         # clear scene
         self.clear()
         # self.set3D()
@@ -59,7 +171,33 @@ class Window(pyglet.window.Window):
         # draw level map
         self.level_map.draw()
         # draw all entities
-        for particle in self.world.particle_list:
-            particle.draw()
+        eye = self.camera.eye_position()
+        planes = self.frustum_planes()
+        if self.replay is not None:
+            if len(self.replay):
+                positions, radii, colors = self.replay.frame(
+                    self.replay.step_at(self.replay_time))
+                self.renderer.draw_instances(positions, radii, colors, eye,
+                                             planes)
+        elif self.simulation is None:
+            self.renderer.draw(self.world.particle_list, eye, planes)
+        else:
+            snapshot = self.simulation.buffer.acquire()
+            n = snapshot.count
+            self.renderer.draw_instances(
+                snapshot.positions[:n], snapshot.radii[:n],
+                snapshot.colors[:n], eye, planes)
+            self.simulation.buffer.release()
+        # draw profile overlay
+        if self.profile_label is not None:
+            self.set2D()
+            pyglet.gl.glDisable(pyglet.gl.GL_DEPTH_TEST)
+            self.profile_label.draw()
+            pyglet.gl.glEnable(pyglet.gl.GL_DEPTH_TEST)
         self.set3D()
-        return pyglet.event.EVENT_HANDLED
\ No newline at end of file
+
+    def on_close(self):
+        """Stop the simulation thread before closing the window."""
+        if self.simulation is not None:
+            self.simulation.stop()
+        super(Window, self).on_close()
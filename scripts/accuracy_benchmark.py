@@ -0,0 +1,51 @@
+import argparse
+import json
+from jpheng import accuracy, bench
+
+# Accuracy against cost.  Steps scenes with analytic solutions at a range of
+# time steps with each integrator and prints the energy drift, momentum
+# error and position error of each run next to its speed, followed by the
+# largest time step of each scene within tolerance.
+#
+# Example:
+#     python scripts/accuracy_benchmark.py --dts 0.0333 0.0167 0.0083
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measure simulation error against time step.')
+    parser.add_argument('--scenes', nargs='+', default=sorted(accuracy.SCENES))
+    parser.add_argument('--integrators', nargs='+',
+                        default=sorted(accuracy.INTEGRATORS))
+    parser.add_argument('--dts', nargs='+', type=float,
+                        default=list(accuracy.DEFAULT_TIMESTEPS))
+    parser.add_argument('--duration', type=float, default=4,
+                        help='simulated seconds per run')
+    parser.add_argument('--energy-tolerance', type=float, default=0.01)
+    parser.add_argument('--position-tolerance', type=float, default=0.1)
+    parser.add_argument('--output', help='write results to a JSON file')
+    args = parser.parse_args()
+
+    results = accuracy.run_all(args.scenes, args.integrators, args.dts,
+                               args.duration)
+    print('{:<20}{:<12}{:>10}{:>12}{:>14}{:>16}{:>16}'.format(
+        'scene', 'integrator', 'dt', 'steps/s', 'energy drift',
+        'momentum error', 'position error'))
+    for result in results:
+        print('{:<20}{:<12}{:>10.5f}{:>12.0f}{:>14.3g}{:>16.3g}{:>16.3g}'
+              .format(result['scene'], result['integrator'], result['dt'],
+                      result['steps_per_second'], result['energy_drift'],
+                      result['momentum_error'], result['position_error']))
+    print()
+    for scene in args.scenes:
+        for integrator in args.integrators:
+            dt = accuracy.largest_safe_dt(results, scene, integrator,
+                                          args.energy_tolerance,
+                                          args.position_tolerance)
+            print('{:<20}{:<12} largest safe dt: {}'.format(
+                scene, integrator, 'none' if dt is None else
+                '{:.5f}'.format(dt)))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': bench.environment(),
+                       'results': results}, f, indent=2)
@@ -0,0 +1,45 @@
+import argparse
+import sys
+from jpheng import bench
+
+# Steady state allocation check.  Steps benchmark scenes with a contact pool
+# under tracemalloc after a warm up and checks that no garbage collection
+# runs and that the peak memory allocated during a step stays within a
+# fixed budget at every size, i.e. does not grow with the number of
+# particles or contacts.  Exits with status 1 if either check fails.  Use
+# --no-pool to see the allocations of the default, unpooled step.
+#
+# Example:
+#     python scripts/allocation_check.py --sizes 50 200
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check that stepping allocates no memory per particle.')
+    parser.add_argument('--scenes', nargs='+',
+                        default=['collision_gas', 'spring_network',
+                                 'link_chains', 'link_set_chains',
+                                 'pbd_chains'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[50, 200])
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--budget', type=int, default=4096,
+                        help='peak bytes allowed per step')
+    parser.add_argument('--no-pool', action='store_true',
+                        help='step without a contact pool')
+    args = parser.parse_args()
+
+    failed = False
+    print('{:<16}{:>8}{:>12}{:>12}{:>13}'.format(
+        'scene', 'n', 'peak bytes', 'net bytes', 'collections'))
+    for scene in args.scenes:
+        for n in args.sizes:
+            result = bench.measure_step_allocations(
+                scene, n, args.warmup, args.steps, pool=not args.no_pool)
+            ok = result['collections'] == 0 and \
+                result['peak_bytes'] <= args.budget
+            failed = failed or not ok
+            print('{:<16}{:>8}{:>12}{:>12}{:>13}{}'.format(
+                scene, n, result['peak_bytes'], result['net_bytes'],
+                result['collections'], '' if ok else '  FAILED'))
+    sys.exit(1 if failed else 0)
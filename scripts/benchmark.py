@@ -0,0 +1,85 @@
+import argparse
+from jpheng import bench
+
+# Headless benchmark of the demo scenes.  Runs every scene at a range of
+# sizes, prints steps per second and writes the full results, including the
+# time of each phase of the step and peak memory, to a JSON file.  With
+# --plot the scaling curves are drawn with matplotlib.  With several
+# --backends every scene is run with each and the speed of each backend
+# relative to the first is printed.
+#
+# Example:
+#     python scripts/benchmark.py --sizes 10 100 1000 --output bench.json
+#     python scripts/benchmark.py --backends python numba
+
+
+def plot(results, path):
+    """Plot steps per second against particle count for every scene."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    for scene, backend in sorted({(result['scene'], result['backend'])
+                                  for result in results}):
+        runs = [result for result in results
+                if result['scene'] == scene and
+                result['backend'] == backend and not result.get('skipped')]
+        ax.loglog([run['n_particles'] for run in runs],
+                  [run['steps_per_second'] for run in runs], 'o-',
+                  label='{} ({})'.format(scene, backend))
+    ax.set_xlabel('particles')
+    ax.set_ylabel('steps per second')
+    ax.legend()
+    fig.savefig(path)
+
+
+def compare_backends(results, backends):
+    """Print the steps per second of each backend relative to the first
+    for every scene and size run with all of them."""
+    speeds = {(result['scene'], result['n'], result['backend']):
+              result['steps_per_second'] for result in results
+              if not result.get('skipped')}
+    cases = sorted({(scene, n) for scene, n, backend in speeds})
+    print('{:<16}{:>8}'.format('scene', 'n') +
+          ''.join('{:>12}'.format(backend) for backend in backends[1:]))
+    for scene, n in cases:
+        if not all((scene, n, backend) in speeds for backend in backends):
+            continue
+        base = speeds[scene, n, backends[0]]
+        print('{:<16}{:>8}'.format(scene, n) +
+              ''.join('{:>11.2f}x'.format(speeds[scene, n, backend]/base)
+                      for backend in backends[1:]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark jpheng's demo scenes headlessly.")
+    parser.add_argument('--scenes', nargs='+', default=sorted(bench.SCENES),
+                        choices=sorted(bench.SCENES))
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=bench.DEFAULT_SIZES)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--dt', type=float, default=1/120)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-seconds', type=float, default=60,
+                        help='skip sizes predicted to take longer than this')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='do not measure peak memory')
+    parser.add_argument('--backends', nargs='+', default=['python'],
+                        choices=['python', 'numba'])
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--plot', help='save scaling curves to this file')
+    args = parser.parse_args()
+
+    results = []
+    for backend in args.backends:
+        for scene in args.scenes:
+            results += bench.run_scaling(scene, args.sizes, args.steps,
+                                         args.dt, args.seed, args.max_seconds,
+                                         not args.no_memory, print, backend)
+    if len(args.backends) > 1:
+        compare_backends(results, args.backends)
+    bench.save_results(results, args.output)
+    print('results written to {}'.format(args.output))
+    if args.plot:
+        plot(results, args.plot)
@@ -0,0 +1,60 @@
+import argparse
+import sys
+from jpheng import bench, recording
+
+# Steps a benchmark scene in deterministic mode and checks the state
+# checksum after every step.  The scene is run twice and the runs compared,
+# and with --compare also checked against a checksum file saved with --save
+# on another machine or code version.  Exits with status 1 and prints the
+# first divergent step if the runs differ.
+#
+# Example:
+#     python scripts/determinism_check.py link_chains 50 --save ref.txt
+#     python scripts/determinism_check.py link_chains 50 --compare ref.txt
+
+
+def run(scene, n, steps, dt, seed):
+    """Return the ChecksumLog of a deterministic run of a scene."""
+    world, hook = bench.SCENES[scene](n, seed)
+    world.deterministic = True
+    log = recording.ChecksumLog()
+    for i in range(steps):
+        world.step(dt)
+        if hook is not None:
+            hook(world, dt)
+        log.record(world)
+    return log
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check that a scene steps deterministically.')
+    parser.add_argument('scene', choices=sorted(bench.SCENES))
+    parser.add_argument('n', type=int, help='number of particles')
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--dt', type=float, default=1/120)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write the checksums to a file')
+    parser.add_argument('--compare', help='checksum file to compare with')
+    args = parser.parse_args()
+
+    first = run(args.scene, args.n, args.steps, args.dt, args.seed)
+    second = run(args.scene, args.n, args.steps, args.dt, args.seed)
+    failed = False
+    step = first.first_divergence(second)
+    if step is None:
+        print('{} steps repeat exactly, final checksum {}'.format(
+            len(first), first.checksums[-1]))
+    else:
+        print('runs diverge at step {}'.format(step))
+        failed = True
+    if args.save:
+        first.save(args.save)
+    if args.compare:
+        step = first.first_divergence(recording.load_checksums(args.compare))
+        if step is None:
+            print('matches {}'.format(args.compare))
+        else:
+            print('diverges from {} at step {}'.format(args.compare, step))
+            failed = True
+    sys.exit(1 if failed else 0)
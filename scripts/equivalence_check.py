@@ -0,0 +1,47 @@
+import argparse
+import sys
+from jpheng import equivalence
+
+# Differential test of the fast engines against the reference
+# ParticleWorld.  Every engine steps randomised worlds alongside the
+# reference and the first step and particle where they diverge is
+# reported.  Exits with status 1 if any engine diverges.
+#
+# Example:
+#     python scripts/equivalence_check.py --engines batch --seeds 20
+
+
+if __name__ == '__main__':
+    engines = sorted(set(equivalence.ENGINES) - {'reference'})
+    parser = argparse.ArgumentParser(
+        description='Compare fast engines with the reference engine.')
+    parser.add_argument('--engines', nargs='+', default=engines,
+                        choices=engines)
+    parser.add_argument('--seeds', type=int, default=10,
+                        help='number of random worlds per engine')
+    parser.add_argument('--particles', type=int, default=20)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--dt', type=float, default=1/120)
+    parser.add_argument('--atol', type=float, default=1e-9)
+    parser.add_argument('--rtol', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    reports = equivalence.run(args.engines, range(args.seeds),
+                              args.particles, args.steps, args.dt, args.atol,
+                              args.rtol)
+    diverged = 0
+    for report in reports:
+        divergence = report['divergence']
+        if divergence is None:
+            print('{:<12} seed {:<4} ok'.format(report['engine'],
+                                                report['seed']))
+            continue
+        diverged += 1
+        print('{:<12} seed {:<4} diverges at step {} particle {} in {}: '
+              'reference {} actual {} error {:.3g}'.format(
+                  report['engine'], report['seed'], divergence['step'],
+                  divergence['particle'], divergence['field'],
+                  divergence['reference'], divergence['actual'],
+                  divergence['error']))
+    print('{} of {} runs diverged'.format(diverged, len(reports)))
+    sys.exit(1 if diverged else 0)
@@ -33,14 +33,14 @@ if __name__ == '__main__':
         """When left mouse is pressed spawn a new firework with random
         trajectory."""
         if button == pyglet.window.mouse.LEFT:
-            theta = np.random.uniform(0, 10*np.pi/180)
-            phi = np.random.uniform(0, 2*np.pi)
+            theta = world.rng.uniform(0, 10*np.pi/180)
+            phi = world.rng.uniform(0, 2*np.pi)
             s = 100
             p = np.array([0,0,0])
             v = np.array([s*np.sin(theta)*np.cos(phi),
                           s*np.sin(theta)*np.sin(phi),
                           s*np.cos(theta)])
-            fuse = np.random.normal(5, 0.5)
+            fuse = world.rng.normal(5, 0.5)
             world.add_particle(entities.Firework(p, v, fuse, parent=True))
 
     def fireworks_rules(dt):
@@ -55,19 +55,19 @@ if __name__ == '__main__':
                 # if the firework is a parent, spawn children
                 if firework.parent:
                     n = 10
-                    v = np.random.normal(10, 0.1)
+                    v = world.rng.normal(10, 0.1)
                     v_list = np.zeros((n, 3))
-                    thetas = np.random.uniform(0, np.pi, n)
-                    phis = np.random.uniform(0, 2*np.pi, n)
+                    thetas = world.rng.uniform(0, np.pi, n)
+                    phis = world.rng.uniform(0, 2*np.pi, n)
                     v_list[:,0] = v*np.sin(thetas)*np.cos(phis)
                     v_list[:,1] = v*np.sin(thetas)*np.sin(phis)
                     v_list[:,2] = v*np.cos(thetas)
-                    fuse_list = np.random.normal(1.5, 0.7, n)
+                    fuse_list = world.rng.normal(1.5, 0.7, n)
                     for i in range(n):
                         world.add_particle(entities.Firework(
                             firework.physics.p,
                             v_list[i], fuse_list[i],
-                            np.random.choice([True, False]),
+                            world.rng.choice([True, False]),
                             firework.generation + 1))
 
 
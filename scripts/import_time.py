@@ -0,0 +1,85 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Import time of the headless physics modules.  Imports a module in fresh
+# interpreters with python -X importtime and prints the median total time,
+# the time spent in each top level package and the slowest modules.  Exits
+# with status 1 if the median exceeds --budget milliseconds or if a module
+# which must only be loaded on first use, such as pyglet, was imported.
+#
+# Example:
+#     python scripts/import_time.py --budget 250
+#     python scripts/import_time.py --module jpheng.scenes --top 20
+
+# modules physics-only code must not import
+FORBIDDEN = ('pyglet',)
+
+
+def measure(module):
+    """Import module in a new interpreter.  Returns a list of (name, self
+    time, cumulative time) with times in milliseconds, in import order."""
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'import {}'.format(module)],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        rows.append((fields[2].strip(), int(fields[0])/1000,
+                     int(fields[1])/1000))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measure the import time of a jpheng module.')
+    parser.add_argument('--module', default='jpheng.pworld')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest modules to list')
+    parser.add_argument('--budget', type=float,
+                        help='maximum median import time, milliseconds')
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for i in range(args.repeats)]
+    totals = [sum(self_time for name, self_time, total in rows)
+              for rows in runs]
+    median = statistics.median(totals)
+    rows = runs[totals.index(sorted(totals)[len(totals)//2])]
+
+    packages = {}
+    for name, self_time, total in rows:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_time
+    print('import {}: {:.1f} ms median of {} runs ({:.1f} - {:.1f} ms)'
+          .format(args.module, median, args.repeats, min(totals),
+                  max(totals)))
+    print()
+    print('{:<30}{:>10}{:>8}'.format('package', 'ms', '%'))
+    for package, self_time in sorted(packages.items(),
+                                     key=lambda item: -item[1])[:args.top]:
+        print('{:<30}{:>10.1f}{:>8.1f}'.format(
+            package, self_time, 100*self_time/sum(packages.values())))
+    print()
+    print('{:<40}{:>10}{:>12}'.format('module', 'self ms', 'cumul. ms'))
+    for name, self_time, total in sorted(rows,
+                                         key=lambda row: -row[1])[:args.top]:
+        print('{:<40}{:>10.1f}{:>12.1f}'.format(name, self_time, total))
+
+    failed = False
+    loaded = {name.split('.')[0] for name, self_time, total in rows}
+    for name in FORBIDDEN:
+        if name in loaded:
+            print('{} imported by {}'.format(name, args.module))
+            failed = True
+    if args.budget is not None and median > args.budget:
+        print('import time {:.1f} ms exceeds the budget of {:.1f} ms'.format(
+            median, args.budget))
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,50 @@
+import argparse
+import numpy as np
+from jpheng import scenes
+
+# Generates a large scene file offline: a gas of n particles in a box, or
+# with --chains, chains of ten particles joined by rods.  Bulk arrays are
+# written to .npy files beside the scene file.  Open the result with
+# scene_demo.py.
+#
+# Example:
+#     python scripts/make_scene.py 10000 --output gas.json
+#     python scripts/scene_demo.py gas.json
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Generate a procedural scene file.')
+    parser.add_argument('n', type=int, help='number of particles')
+    parser.add_argument('--chains', action='store_true',
+                        help='join the particles into chains of ten rods')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='scene.json')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    half = 3*max(1.0, np.ceil(args.n**(1/3)))
+    spec = {'map': {'xlim': [-half, half], 'ylim': [-half, half],
+                    'zlim': [0, 2*half]},
+            'collisions': args.n <= 1000}
+    low = [-half + 1, -half + 1, 1]
+    high = [half - 1, half - 1, 2*half - 1]
+    if args.chains:
+        n_chains = args.n//10
+        starts = rng.uniform(low, [high[0] - 30, high[1], high[2]],
+                             (n_chains, 1, 3))
+        offsets = np.zeros((1, 10, 3))
+        offsets[0, :, 0] = 3*np.arange(10)
+        p = (starts + offsets).reshape(-1, 3)
+        first = 10*np.arange(n_chains)[:, np.newaxis] + np.arange(9)
+        pairs = np.stack([first.ravel(), first.ravel() + 1], axis=1)
+        spec['links'] = [{'type': 'ParticleRod', 'particles': pairs,
+                          'length': 3}]
+    else:
+        p = rng.uniform(low, high, (args.n, 3))
+    spec['particles'] = [{'name': 'particles', 'p': p,
+                          'v': rng.uniform(-20, 20, (len(p), 3)),
+                          'inv_mass': 0.1, 'r': 1,
+                          'color': rng.randint(0, 256, (len(p), 3))}]
+    scenes.save(spec, args.output)
+    print('wrote {} particles to {}'.format(len(p), args.output))
@@ -0,0 +1,59 @@
+import argparse
+import sys
+from jpheng import regression
+
+# Performance regression gate.  Benchmarks a set of scenes several times and
+# compares the median time of ParticleWorld.step and each of its phases
+# against a stored baseline, exiting with status 1 if anything has
+# regressed.  Record a new baseline with --record.  The settings stored with
+# the baseline are reused when comparing against it.  Steps are timed in
+# CPU time and cases which appear to have regressed are measured again
+# before the gate fails.
+#
+# Example:
+#     python scripts/perf_gate.py --record
+#     python scripts/perf_gate.py
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare benchmark timings against a stored baseline.')
+    parser.add_argument('--baseline', default='perf_baseline.json')
+    parser.add_argument('--record', action='store_true',
+                        help='measure and save a new baseline')
+    parser.add_argument('--scenes', nargs='+',
+                        default=['collision_gas', 'link_chains'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='fractional slowdown allowed before failing')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='times a regressed case is measured again')
+    args = parser.parse_args()
+
+    if args.record:
+        settings = {'scenes': args.scenes, 'sizes': args.sizes,
+                    'repeats': args.repeats, 'steps': args.steps,
+                    'seed': args.seed, 'clock': 'process_time'}
+        cases = regression.run_cases(log=print, **settings)
+        regression.save_baseline(cases, settings, args.baseline)
+        print('baseline written to {}'.format(args.baseline))
+        sys.exit(0)
+
+    baseline = regression.load_baseline(args.baseline)
+    settings = baseline['settings']
+    # baselines written before the clock was stored are wall times
+    settings.setdefault('clock', 'perf_counter')
+    cases = regression.run_cases(log=print, **settings)
+    rows = regression.compare(baseline['cases'], cases, args.threshold)
+    regression.recheck(baseline['cases'], rows, args.threshold,
+                       args.retries, log=print, **settings)
+    print(regression.format_rows(rows))
+    regressed = [row for row in rows if row['status'] == 'regressed']
+    if regressed:
+        print('{} metric(s) regressed by more than {:.0f}%'.format(
+            len(regressed), 100*args.threshold))
+        sys.exit(1)
+    print('no regressions')
@@ -0,0 +1,51 @@
+import argparse
+import time
+from jpheng import bench, recording
+
+# Records a benchmark scene headlessly to a trajectory recording which can
+# then be reviewed with replay.py.  Capacity is the most particles the
+# scene may hold at once, by default its starting size times its entry in
+# GROWTH.  Steps recorded before an error are still written.
+#
+# Example:
+#     python scripts/record_scene.py collision_gas 500 --steps 2400
+#     python scripts/replay.py recording
+
+# most particles a scene can hold per particle it starts with, a firework
+# bursts into at most ten children which never burst
+GROWTH = {'fireworks': 10}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Record a benchmark scene to a trajectory recording.')
+    parser.add_argument('scene', choices=sorted(bench.SCENES))
+    parser.add_argument('n', type=int, help='number of particles')
+    parser.add_argument('--steps', type=int, default=1200)
+    parser.add_argument('--dt', type=float, default=1/120)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--capacity', type=int,
+                        help='most particles recorded per step')
+    parser.add_argument('--velocities', action='store_true')
+    parser.add_argument('--contacts', action='store_true')
+    parser.add_argument('--output', default='recording')
+    args = parser.parse_args()
+
+    world, hook = bench.SCENES[args.scene](args.n, args.seed)
+    capacity = args.capacity
+    if capacity is None:
+        capacity = GROWTH.get(args.scene, 1)*len(world.particle_list)
+    recorder = recording.TrajectoryRecorder(
+        args.output, args.dt, capacity, velocities=args.velocities,
+        contacts=args.contacts)
+    world.recorder = recorder
+    start = time.perf_counter()
+    try:
+        for i in range(args.steps):
+            world.step(args.dt)
+            if hook is not None:
+                hook(world, args.dt)
+    finally:
+        recorder.close()
+    print('recorded {} steps of {} in {:.1f} s to {}'.format(
+        args.steps, args.scene, time.perf_counter() - start, args.output))
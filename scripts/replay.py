@@ -0,0 +1,29 @@
+import argparse
+import pyglet
+import jpheng.window as windows
+from jpheng import maps
+from jpheng import recording
+
+# Plays back a trajectory recording without simulating.  P pauses, [ and ]
+# halve and double the playback speed.  Press escape to exit the program.
+#
+# Example:
+#     python scripts/replay.py recording --speed 0.5
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Play back a trajectory recording.')
+    parser.add_argument('path', help='recording directory')
+    parser.add_argument('--speed', type=float, default=1,
+                        help='playback speed as a multiple of real time')
+    args = parser.parse_args()
+
+    trajectory = recording.Trajectory(args.path)
+    xlim, ylim, zlim = trajectory.limits
+    level_map = maps.EmptyMap(xlim, ylim, zlim)
+    window = windows.Window(None, level_map, caption="jpheng Replay",
+                            resizable=True, replay=trajectory,
+                            replay_speed=args.speed)
+    window.set_exclusive_mouse(True)
+    pyglet.app.run()
@@ -0,0 +1,25 @@
+import argparse
+import pyglet
+import jpheng.window as windows
+from jpheng import scenes
+
+# Opens any scene file, see jpheng/scenes.py for the format.  Press escape
+# to exit the program.
+#
+# Example:
+#     python scripts/scene_demo.py scenes/springs.json
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate a scene file.')
+    parser.add_argument('path', help='scene file')
+    parser.add_argument('--threaded', action='store_true',
+                        help='step the world on its own thread')
+    args = parser.parse_args()
+
+    scene = scenes.load(args.path)
+    window = windows.Window(scene.world, scene.make_map(),
+                            caption="jpheng Demo", resizable=True,
+                            threaded=args.threaded)
+    window.set_exclusive_mouse(True)
+    pyglet.app.run()
@@ -0,0 +1,40 @@
+import numpy as np
+from jpheng import pworld
+from jpheng import particles
+from jpheng import pfgen
+from jpheng import sweep
+
+# This demo runs a headless parameter sweep over the spring constant and
+# damping of a pair of particles joined by a spring, using every core on the
+# machine, and prints the kinetic energy left in each world at the end.
+
+
+def spring_pair(k, damping):
+    """Build a world containing two particles joined by a spring."""
+    world = pworld.ParticleWorld([-100, 100], [-100, 100], [0, 50])
+    particle1 = particles.QuickParticle([30, 0, 25], [0, 0, 0], [0, 0, 0],
+                                        1/5, 1, color=(97, 86, 103))
+    particle2 = particles.QuickParticle([-30, 0, 25], [0, 0, 0], [0, 0, 0],
+                                        1/5, 1, color=(97, 86, 103))
+    for particle in (particle1, particle2):
+        particle.physics.g = np.zeros(3)
+        particle.physics.damping = damping
+        world.add_particle(particle)
+    world.force_registry.add(particle1,
+                             pfgen.ParticleSpring(particle2, k, 40))
+    world.force_registry.add(particle2,
+                             pfgen.ParticleSpring(particle1, k, 40))
+    return world
+
+
+if __name__ == '__main__':
+    grid = {'k': [1, 2, 4, 8],
+            'damping': [0.5, 0.9, 0.999]}
+    result = sweep.run_sweep(spring_pair, grid, n_steps=1200,
+                             record_positions=True)
+    for params, metrics in zip(result.params, result.metrics):
+        print('k = {k:<4} damping = {damping:<6} kinetic energy = '
+              '{energy:.4f}'.format(energy=metrics['kinetic_energy'],
+                                    **params))
+    print('trajectories recorded with shape {}'.format(
+        result.positions.shape))